@@ -18,23 +18,44 @@ Agamotto class module, initial imports followed by class
 """
 
 import os
-import zipfile
 import time
-from datetime import datetime
+import zipfile
+from datetime import datetime, timedelta
 
 # from typing import List, Dict, Any
 import cv2
-from tensorflow import keras
+import numpy as np
 import tensorflow as tf
-import tensorflow_datasets as tfds
 
 from config.bigquery import BigQuery
+from config.bigquery_writer import BigQueryWriter
+from config.backfill import video_start_time
+from config.rollup import WindowAggregator
+from config.spool import RowSpool
+from utils.artifact_cache import ArtifactCache, sha256sum
 from utils.logger import logger
-from .retinanet.labelencoder import LabelEncoder
-from .retinanet.retinanet import RetinaNet, RetinaNetLoss, get_backbone
-from .retinanet.autotune import apply_autotune
+from utils.metrics import (
+    record_detections,
+    record_frames_processed,
+    record_frames_skipped,
+    timed_stage,
+)
+from utils.tuning import read_tuning
 from .retinanet.decodepredictions import DecodePredictions
-from .retinanet.utils import prepare_image
+from .retinanet.preprocess import prepare_image, prepare_image_batch
+from .frame_preprocessor import FramePreprocessor
+from .overlay import OverlayRenderer
+from .inference import CompiledInference
+from .tflite_backend import TFLiteInference, export_tflite_model, read_labels
+from .serving import SavedModelInference, export_saved_model
+from .pipeline import FramePipeline
+from .sampler import FrameSampler
+from .capture import LatestFrameReader
+from .multisource import MultiSourceEngine, parse_sources
+from .motion_gate import MotionGate
+from .tracker import KeyframeTracker
+from .roi import RegionOfInterest
+from .tiling import TiledDetector
 
 
 class Agamotto:
@@ -51,48 +72,150 @@ class Agamotto:
     def __init__(self, config):
         """Init constructor
 
+        With inference_backend saved_model or tflite only the exported
+        artifact is loaded, the weights are not downloaded and the Keras
+        RetinaNet is not built
+
         Args:
             config (Dict[str]): Receives the config dict to initialize variables
         """
 
         self._config = config
-        self.set_parameters()
-        self.download_weights()
-        self.init_model()
-        self.load_dataset()
-        if self._config["model"]["train"]:
-            self.autotune_train()
-        self.load_weights()
-        self.build_inference_model()
+        self._startup_times = []
+        self._timed_step(self.set_parameters)
+        self._timed_step(self.apply_tuning)
+        if self._inference_backend == "saved_model":
+            self._timed_step(self.load_saved_model)
+        elif self._inference_backend == "tflite":
+            self._timed_step(self.load_tflite_model)
+        else:
+            self._timed_step(self.download_weights)
+            self._timed_step(self.init_model)
+            self._timed_step(self.load_dataset)
+            if self._config["model"]["train"]:
+                self._timed_step(self.autotune_train)
+            self._timed_step(self.load_weights)
+            self._timed_step(self.build_inference_model)
+        self.log_startup_times()
+
+    def _timed_step(self, step):
+        """Run a startup step and record how long it took
+
+        Args:
+            step (Callable): Method without arguments
+        """
+        start_time = time.perf_counter()
+        step()
+        self._startup_times.append((step.__name__, time.perf_counter() - start_time))
+
+    def log_startup_times(self):
+        """Log the startup time breakdown"""
+        total = sum(duration for _, duration in self._startup_times)
+        breakdown = ", ".join(
+            f"{name} {duration:.2f}s" for name, duration in self._startup_times
+        )
+        logger(self.__class__.__name__).info(f"Startup took {total:.2f}s ({breakdown})")
+
+    def apply_tuning(self):
+        """Apply the batch size and TensorFlow threads measured by bench.py
+
+        Nothing changes when model.tuning_file does not exist. The threads can
+        only be set before TensorFlow starts, otherwise they are left as they
+        are with a warning.
+        """
+        tuning = read_tuning(self._tuning_file)
+        if tuning is None:
+            return
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(
+                tuning["intra_op_parallelism_threads"]
+            )
+            tf.config.threading.set_inter_op_parallelism_threads(
+                tuning["inter_op_parallelism_threads"]
+            )
+        except RuntimeError as ex:
+            logger(self.__class__.__name__).warning(
+                f"TensorFlow already started, threads of {self._tuning_file} "
+                f"not applied: {ex}"
+            )
+        self._inference_batch_size = tuning["inference_batch_size"]
+        logger(self.__class__.__name__).info(
+            f"Applied {self._tuning_file}: inference_batch_size "
+            f"{self._inference_batch_size}, intra_op "
+            f"{tuning['intra_op_parallelism_threads']}, inter_op "
+            f"{tuning['inter_op_parallelism_threads']}"
+        )
 
     def download_weights(self):
         """
-        Downloading weights for first (or only) executions, it will download, extract and create
-        a folder based on agamotto.yaml file.
-        #TODO Improvements:
-            - Add a download weights URL inside agamotto.yaml
-            - Add a version inside agamotto.yaml
+        Downloading weights for first (or only) executions, the archive from
+        load_weights_url/load_weights_version is downloaded, checked and
+        extracted once into the artifact cache, warm restarts reuse it.
+        Without artifact_cache_dir it is downloaded and extracted into the
+        working directory.
         """
         url = f"{self._model_load_weights_url}/{self._model_load_weights_version}/{self._load_weights_dir}.zip"
-        filename = os.path.join(os.getcwd(), f"{self._load_weights_dir}.zip")
-        keras.utils.get_file(filename, url)
-        with zipfile.ZipFile(f"{self._load_weights_dir}.zip", "r") as z_fp:
-            z_fp.extractall("./")
+        if not self._model_artifact_cache_dir:
+            filename = os.path.join(os.getcwd(), f"{self._load_weights_dir}.zip")
+            tf.keras.utils.get_file(filename, url)
+            if (
+                self._model_load_weights_sha256
+                and sha256sum(filename) != self._model_load_weights_sha256
+            ):
+                raise ValueError(f"Checksum mismatch for {url}")
+            with zipfile.ZipFile(filename, "r") as z_fp:
+                z_fp.extractall("./")
+            return
+        extracted_dir = ArtifactCache(self._model_artifact_cache_dir).fetch(
+            url,
+            self._model_load_weights_version,
+            checksum=self._model_load_weights_sha256,
+        )
+        self._load_weights_dir = os.path.join(extracted_dir, self._load_weights_dir)
+        if not self._config["model"]["load_dataset"]:
+            self._datadir = self._load_weights_dir
 
     def set_parameters(self):
         """
         Set parameters acts as a constructor for model parameters
         """
         self._save_weights_dir = self._config["model"]["save_weights_dir"]
-        self._label_encoder = LabelEncoder()
 
         self._num_classes = self._config["model"]["num_classes"]
         self._batch_size = self._config["model"]["batch_size"]
+        self._inference_batch_size = self._config["model"]["inference_batch_size"]
+        self._tuning_file = self._config["model"]["tuning_file"]
         self._confidence_threshold = self._config["model"]["confidence_threshold"]
+        self._compiled_inference = self._config["model"]["compiled_inference"]
+        self._jit_compile = self._config["model"]["jit_compile"]
+        self._decode_mode = self._config["model"]["decode_mode"]
+        self._pre_nms_top_k = self._config["model"]["pre_nms_top_k"]
+        self._inference_backend = self._config["model"]["inference_backend"]
+        self._tflite_model_path = self._config["model"]["tflite_model_path"]
+        self._tflite_num_threads = self._config["model"]["tflite_num_threads"]
+        self._saved_model_dir = self._config["model"]["saved_model_dir"]
+        self._resolution_profiles = self._config["model"]["resolution_profiles"]
+        self._uint8_preprocessing = self._config["model"]["uint8_preprocessing"]
+        self.set_resolution_profile(self._config["model"]["resolution_profile"])
+        self._tiling = self._config["model"]["tiling"]
+        self._tiled_detector = (
+            TiledDetector(
+                self.create_detections_batch,
+                tile_size=self._tiling["tile_size"],
+                overlap=self._tiling["overlap"],
+                tile_scale=self._tiling["tile_scale"],
+                iou_threshold=self._tiling["nms_iou_threshold"],
+                evaluate=self._tiling["evaluate"],
+            )
+            if self._tiling["enabled"]
+            else None
+        )
         # Change this to `model_dir` when not using the downloaded weights
         self._load_weights_dir = self._config["model"]["load_weights_dir"]
         self._model_load_weights_url = self._config["model"]["load_weights_url"]
         self._model_load_weights_version = self._config["model"]["load_weights_version"]
+        self._model_load_weights_sha256 = self._config["model"]["load_weights_sha256"]
+        self._model_artifact_cache_dir = self._config["model"]["artifact_cache_dir"]
         self._train_dataset_size = self._config["model"]["train_dataset_size"]
         self._val_dataset_size = self._config["model"]["val_dataset_size"]
         self._epochs = self._config["model"]["epochs"]
@@ -109,8 +232,34 @@ class Agamotto:
         self._video_read_inverval = self._config["video"]["read_interval"]
         self._video_output_location = self._config["video"]["output_location"]
         self._video_is_stream = self._config["video"]["is_stream"]
+        self._overlay_renderer = OverlayRenderer(
+            lambda class_id: self._int2str(class_id),
+            render_level=self._config["video"]["render_level"],
+        )
+        self._video_pipeline_queue_size = self._config["video"]["pipeline_queue_size"]
+        self._video_seek_threshold = self._config["video"]["seek_threshold"]
+        self._video_reconnect_initial_delay = self._config["video"][
+            "reconnect_initial_delay"
+        ]
+        self._video_reconnect_max_delay = self._config["video"]["reconnect_max_delay"]
+        self._video_motion_gate = self._config["video"]["motion_gate"]
+        self._video_tracker = self._config["video"]["tracker"]
 
+        self._roi = RegionOfInterest.from_location(self._config["location"])
         self._gcp_save_to_bigquery = self._config["gcp"]["save_to_bigquery"]
+        self._bigquery_writer = None
+        self._rollup_raw_rows = self._config["rollup"]["raw_rows"]
+        self._rollup = (
+            WindowAggregator(
+                mode=self._config["rollup"]["mode"],
+                window_seconds=self._config["rollup"]["window_seconds"],
+                slide_seconds=self._config["rollup"]["slide_seconds"],
+                capacity=self._config["rollup"]["capacity"],
+            )
+            if self._config["rollup"]["enabled"]
+            else None
+        )
+        self._rollup_configs = {}
 
         self._learning_rates = [2.5e-06, 0.000625, 0.00125, 0.0025, 0.00025, 2.5e-05]
         self._learning_rate_boundaries = [125, 250, 500, 240000, 360000]
@@ -118,10 +267,40 @@ class Agamotto:
             boundaries=self._learning_rate_boundaries, values=self._learning_rates
         )
 
+    def set_resolution_profile(self, profile):
+        """Select the inference resolution from model.resolution_profiles
+
+        The anchors follow the padded shape of the prepared image, so every
+        profile gets its own entries in the anchors cache
+
+        Args:
+            profile (str): Name of the profile, like fast, balanced or accurate
+        """
+        if profile not in self._resolution_profiles:
+            raise ValueError(
+                f"Unknown resolution profile {profile}, "
+                f"available: {list(self._resolution_profiles)}"
+            )
+        self._resolution_profile = profile
+        self._min_side = float(self._resolution_profiles[profile]["min_side"])
+        self._max_side = float(self._resolution_profiles[profile]["max_side"])
+        self._frame_preprocessor = FramePreprocessor(
+            min_side=self._min_side, max_side=self._max_side
+        )
+        logger(self.__class__.__name__).info(
+            f"Resolution profile {profile}: min_side {self._min_side}, "
+            f"max_side {self._max_side}"
+        )
+
     def init_model(self):
         """
         Init model actually instantiate the Retinanet constructor and add the backbone
         """
+        from .retinanet.retinanet import (  # pylint: disable=import-outside-toplevel
+            RetinaNet,
+            get_backbone,
+        )
+
         resnet50_backbone = get_backbone()
         self._model = RetinaNet(self._num_classes, resnet50_backbone)
 
@@ -148,6 +327,10 @@ class Agamotto:
             - Decouple loss
             - Decouple optimizer
         """
+        from .retinanet.retinanet import (  # pylint: disable=import-outside-toplevel
+            RetinaNetLoss,
+        )
+
         loss_fn = RetinaNetLoss(self._num_classes)
         optimizer = tf.optimizers.SGD(
             learning_rate=self._learning_rate_fn,
@@ -162,6 +345,11 @@ class Agamotto:
             - Decouple compile_model method
             - Decouple set_callbacks method
         """
+        # pylint: disable=import-outside-toplevel
+        from .retinanet.autotune import apply_autotune
+        from .retinanet.labelencoder import LabelEncoder
+
+        self._label_encoder = LabelEncoder()
         self.compile_model()
         self.set_callbacks()
         self._train_dataset, self._val_dataset = apply_autotune(
@@ -184,6 +372,8 @@ class Agamotto:
         #TODO Improvements:
             - decouple _int2str
         """
+        import tensorflow_datasets as tfds  # pylint: disable=import-outside-toplevel
+
         (self._train_dataset, self._val_dataset), self._dataset_info = tfds.load(
             self._tensorflow_dataset,
             split=["train", "validation"],
@@ -208,18 +398,126 @@ class Agamotto:
         """
         image = tf.keras.Input(shape=[None, None, 3], name="image")
         predictions = self._model(image, training=False)
-        detections = DecodePredictions(confidence_threshold=self._confidence_threshold)(
-            image, predictions
+        self._decode_predictions = DecodePredictions(
+            num_classes=self._num_classes,
+            confidence_threshold=self._confidence_threshold,
+            decode_mode=self._decode_mode,
+            pre_nms_top_k=self._pre_nms_top_k,
         )
+        detections = self._decode_predictions(image, predictions)
         self._inference_model = tf.keras.Model(inputs=image, outputs=detections)
+        self._inference_function = CompiledInference(
+            self._model, self._decode_predictions, jit_compile=self._jit_compile
+        )
+
+    def load_tflite_model(self):
+        """
+        Load the INT8 model written by `python main.py export-tflite` and the
+        label names stored next to it, models exported without them still
+        read the labels from tensorflow_datasets
+        """
+        self._decode_predictions = DecodePredictions(
+            num_classes=self._num_classes,
+            confidence_threshold=self._confidence_threshold,
+            decode_mode=self._decode_mode,
+            pre_nms_top_k=self._pre_nms_top_k,
+        )
+        self._inference_function = TFLiteInference(
+            self._tflite_model_path,
+            self._decode_predictions,
+            num_threads=self._tflite_num_threads,
+        )
+        labels = read_labels(self._tflite_model_path)
+        if labels is None:
+            logger(self.__class__.__name__).warning(
+                f"No labels next to {self._tflite_model_path}, loading them from "
+                f"{self._tensorflow_dataset}, export the model again to skip it"
+            )
+            self.load_dataset()
+            return
+        self._int2str = lambda class_id: labels[int(class_id)]
+
+    def load_saved_model(self):
+        """
+        Load the serving artifact written by `python main.py export`, it holds
+        the model, the decoding and the label names
+        """
+        self._inference_function = SavedModelInference(self._saved_model_dir)
+        self._int2str = self._inference_function.int2str
+
+    def export_saved_model(self, export_dir):
+        """Export the loaded model, the decoding and the label names
+
+        Args:
+            export_dir (str): Directory of the SavedModel
+        """
+        export_saved_model(
+            self._model,
+            self._decode_predictions,
+            [self._int2str(class_id) for class_id in range(self._num_classes)],
+            export_dir,
+        )
+
+    def run_inference(self, input_images):
+        """Run the inference over prepared images
+
+        Uses the exported artifact when inference_backend is saved_model, the
+        INT8 TFLite interpreter when it is tflite, the compiled tf.function
+        when compiled_inference is enabled in agamotto.yaml, otherwise it falls
+        back to keras Model.predict
+
+        Args:
+            input_images (tf.Tensor): Batch of images from prepare_image
+
+        Returns:
+            Detections namedtuple with NumPy arrays
+        """
+        with timed_stage("inference"):
+            if self._inference_backend != "keras" or self._compiled_inference:
+                return self._inference_function(input_images)
+            return self._inference_model.predict(input_images)
+
+    def export_tflite(self, video_path, num_frames, output_path):
+        """Export the loaded model as an INT8 TFLite model
+
+        The activations are calibrated on frames sampled from video_path every
+        read_interval seconds, prepared exactly like the inference frames
+
+        Args:
+            video_path (str): Video with frames representative of the camera
+            num_frames (int): Number of calibration frames
+            output_path (str): Where the .tflite file is written
+        """
+        player = cv2.VideoCapture(video_path)
+        representative_images = []
+        for sampled_frame in FrameSampler(
+            player,
+            interval=self._video_read_inverval,
+            seek_threshold=self._video_seek_threshold,
+        ):
+            input_image, _ = self.prepare_frame(sampled_frame.image)
+            # prepare_frame may return a reused buffer
+            representative_images.append(np.array(input_image, copy=True))
+            if len(representative_images) >= num_frames:
+                break
+        player.release()
+        export_tflite_model(
+            self._model,
+            representative_images,
+            output_path,
+            labels=[self._int2str(class_id) for class_id in range(self._num_classes)],
+        )
 
     def process_media(self, path):
         """Process media defines which media it will be used
 
         Args:
-            path (str): Media path format in string
+            path (str | List): Media path format in string, or a list of
+                sources for the multi-camera mode (see agamotto.yaml)
         """
-        if self._video_is_stream:
+        if isinstance(path, list):
+            self.process_sources()
+        elif self._video_is_stream:
             self.process_stream(path)
         else:
             self.process_video(path)
@@ -243,29 +541,22 @@ class Agamotto:
             self._video_write_output_fps,
             (frame_width, frame_height),
         )
-        count = 0
         detections_count = []
-        while player.isOpened():
-            ret, frame = player.read()
-            if not ret:
-                logger(self.__class__.__name__).info(
-                    "Frame was not load correctly, exiting..."
-                )
-                break
-            detections, ratio, num_detections = self.create_detections(frame)
-            logger(self.__class__.__name__).info(f"Count of persons: {num_detections}")
-            self.draw_boxes_to_frame(
-                frame=frame,
-                detections=detections,
-                num_detections=num_detections,
-                ratio=ratio,
+        # Wall clock time each frame was counted, the media time of recordings
+        # is only used by backfill_video
+        frame_times = []
+
+        def write_frame(sampled_frame, frame_detections):
+            detections_count.append(
+                self.write_video_frame(output, sampled_frame, frame_detections)
             )
-            detections_count.append(num_detections)
-            output.write(frame)
-            count += self._video_read_inverval * 30
-            player.set(cv2.CAP_PROP_POS_FRAMES, count)
+            frame_times.append(time.time())
+
+        self.run_video_pipeline(player, write_frame)
         if self._gcp_save_to_bigquery:
-            self.insert_to_bigquery(num_detections=detections_count)
+            self.insert_to_bigquery(
+                num_detections=detections_count, block=True, timestamps=frame_times
+            )
         logger(self.__class__.__name__).info(
             f"Saving to file {self._video_output_location}"
         )
@@ -273,29 +564,163 @@ class Agamotto:
         output.release()
         player.release()
 
+    def run_video_pipeline(self, player, write_frame):
+        """Sample a video, detect the persons and hand every frame to write_frame
+
+        Args:
+            player (cv2.VideoCapture): Opened video
+            write_frame (Callable): Called with (SampledFrame, frame_detections)
+                in the order of the video, on the render thread
+        """
+        processed = []
+        motion_gate = self.create_motion_gate()
+
+        def detect_frames(frames):
+            return self.create_gated_detections(
+                frames, [motion_gate] * len(frames), [self._roi] * len(frames)
+            )
+
+        keyframe_tracker = self.create_keyframe_tracker(detect_frames)
+        pipeline = FramePipeline(
+            frames=FrameSampler(
+                player,
+                interval=self._video_read_inverval,
+                seek_threshold=self._video_seek_threshold,
+            ),
+            detect_frames=lambda sampled_frames: (keyframe_tracker or detect_frames)(
+                [sampled_frame.image for sampled_frame in sampled_frames]
+            ),
+            write_frame=lambda sampled_frame, frame_detections: processed.append(
+                write_frame(sampled_frame, frame_detections)
+            ),
+            batch_size=self._inference_batch_size,
+            queue_size=self._video_pipeline_queue_size,
+        )
+        start_time = time.perf_counter()
+        pipeline.run()
+        elapsed = time.perf_counter() - start_time
+        logger(self.__class__.__name__).info(
+            f"Processed {len(processed)} frames in {elapsed:.2f}s "
+            f"({len(processed) / max(elapsed, 1e-9):.2f} frames/sec, "
+            f"inference_batch_size: {self._inference_batch_size})"
+        )
+        if motion_gate is not None:
+            logger(self.__class__.__name__).info(motion_gate.summary())
+        if keyframe_tracker is not None:
+            keyframe_tracker.report()
+        self.report_tiling()
+
+    def backfill_video(self, video_path, backfill_writer, start_time=None):
+        """Count the persons of a recorded video and commit them as one backfill batch
+
+        Nothing is drawn or written to output_location, every row is stamped
+        with the start of the recording plus the frame presentation timestamp
+
+        Args:
+            video_path (str): Local video file
+            backfill_writer (BackfillWriter): Writer of the partition files
+            start_time (datetime, optional): Local time of the first frame,
+                defaults to the file modification time minus the video duration
+
+        Returns:
+            List[str]: Paths of the written partition files
+        """
+        player = cv2.VideoCapture(video_path)
+        if start_time is None:
+            start_time = video_start_time(
+                video_path,
+                player.get(cv2.CAP_PROP_FRAME_COUNT),
+                player.get(cv2.CAP_PROP_FPS),
+            )
+        logger(self.__class__.__name__).info(
+            f"Backfilling {video_path} from {start_time.isoformat()}"
+        )
+        detections_count = []
+
+        def count_frame(sampled_frame, frame_detections):
+            num_detections = int(frame_detections[2])
+            record_detections(num_detections, self._config["location"]["name"])
+            frame_time = start_time + timedelta(seconds=sampled_frame.timestamp)
+            detections_count.append(
+                [num_detections, frame_time.strftime("%Y-%m-%dT%H:%M:%S")]
+            )
+
+        self.run_video_pipeline(player, count_frame)
+        player.release()
+        batch_id = (
+            f"{os.path.splitext(os.path.basename(video_path))[0]}"
+            f"-{start_time.strftime('%Y%m%dT%H%M%S')}"
+        )
+        return backfill_writer.commit(
+            batch_id, BigQuery(self._config).build_rows(detections_count)
+        )
+
+    def write_video_frame(self, output, sampled_frame, frame_detections):
+        """Draw the detections into a frame and write it, used by the render stage
+
+        Args:
+            output (cv2.VideoWriter): Writer that receives the drawn frames
+            sampled_frame (SampledFrame): Frame from the FrameSampler
+            frame_detections (Tuple): (detections, ratio, num_detections)
+
+        Returns:
+            int: Number of detections in the frame
+        """
+        frame = sampled_frame.image
+        detections, ratio, num_detections = frame_detections
+        logger(self.__class__.__name__).info(
+            f"Count of persons: {num_detections} at {sampled_frame.timestamp:.2f}s"
+        )
+        record_detections(num_detections, self._config["location"]["name"])
+        self.draw_boxes_to_frame(
+            frame=frame,
+            detections=detections,
+            num_detections=num_detections,
+            ratio=ratio,
+        )
+        with timed_stage("write"):
+            output.write(frame)
+        return num_detections
+
     def process_stream(self, stream_path):
         """Process the stream and send stdout to container output
 
-        #TODO Improvements:
-            - Create another method that receives a player and returns a output
+        The connection stays open on a LatestFrameReader thread, every
+        read_interval seconds the newest frame is taken from it
+
         Args:
             stream_path (str): Stream path url (usually http - see OpenCV Types)
         """
-        while True:
-            time.sleep(self._video_read_inverval)
-            logger(self.__class__.__name__).info(f"Loading stream {stream_path}")
-            player = cv2.VideoCapture(stream_path)
-            while player.isOpened():
-                ret, frame = player.read()
-                if not ret:
-                    logger(self.__class__.__name__).info(
-                        "Frame was not load correctly, exiting..."
-                    )
-                    break
-                detections, ratio, num_detections = self.create_detections(frame)
+        reader = LatestFrameReader(
+            stream_path,
+            initial_delay=self._video_reconnect_initial_delay,
+            max_delay=self._video_reconnect_max_delay,
+        )
+        reader.start()
+        last_sequence = 0
+        motion_gate = self.create_motion_gate()
+        try:
+            while True:
+                start_time = time.perf_counter()
+                sequence, frame = reader.wait_for_frame(
+                    last_sequence, timeout=self._video_read_inverval
+                )
+                if frame is None:
+                    continue
+                last_sequence = sequence
+                captured_at = time.time()
+                ((detections, ratio, num_detections),) = self.create_gated_detections(
+                    [frame], [motion_gate], [self._roi]
+                )
                 logger(self.__class__.__name__).info(
                     f"Count of persons: {num_detections}"
                 )
+                record_detections(num_detections, self._config["location"]["name"])
+                if (
+                    motion_gate is not None
+                    and (motion_gate.inference_calls + motion_gate.skipped) % 100 == 0
+                ):
+                    logger(self.__class__.__name__).info(motion_gate.summary())
                 self.draw_boxes_to_frame(
                     frame=frame,
                     detections=detections,
@@ -303,32 +728,142 @@ class Agamotto:
                     ratio=ratio,
                 )
                 if self._gcp_save_to_bigquery:
-                    self.insert_to_bigquery(num_detections=[num_detections])
-                cv2.imwrite("frame-0.jpg", frame)
-
-                break
+                    self.insert_to_bigquery(
+                        num_detections=[num_detections], timestamps=[captured_at]
+                    )
+                if self._overlay_renderer.enabled:
+                    with timed_stage("write"):
+                        cv2.imwrite("frame-0.jpg", frame)
+                elapsed = time.perf_counter() - start_time
+                time.sleep(max(0.0, self._video_read_inverval - elapsed))
+        finally:
+            reader.stop()
+            self.report_tiling()
             cv2.destroyAllWindows()
-            player.release()
 
-    def insert_to_bigquery(self, num_detections):
+    def process_sources(self):
+        """Process every source of video.input_location with this single model
+
+        Each source gets a capture worker and the latest frames of all of them
+        are batched through one inference worker, see MultiSourceEngine
+        """
+        engine = MultiSourceEngine(
+            agamotto=self,
+            sources=parse_sources(self._config),
+            read_interval=self._video_read_inverval,
+            batch_size=self._inference_batch_size,
+            save_to_bigquery=self._gcp_save_to_bigquery,
+            reconnect_initial_delay=self._video_reconnect_initial_delay,
+            reconnect_max_delay=self._video_reconnect_max_delay,
+            write_frames=self._overlay_renderer.enabled,
+            reconnect=self._video_is_stream,
+        )
+        engine.run()
+
+    def _get_bigquery_writer(self):
+        """Start the BigQuery writer (and open its spool) on the first insert
+
+        Returns:
+            BigQueryWriter: The running writer shared by every location
+        """
+        if self._bigquery_writer is None:
+            self._bigquery_writer = BigQueryWriter(
+                BigQuery(self._config),
+                queue_size=self._config["gcp"]["writer_queue_size"],
+                flush_size=self._config["gcp"]["writer_flush_size"],
+                flush_interval=self._config["gcp"]["writer_flush_interval"],
+                max_retries=self._config["gcp"]["writer_max_retries"],
+                max_backoff=self._config["gcp"]["writer_max_backoff"],
+                spool=(
+                    RowSpool(self._config["gcp"]["spool_path"])
+                    if self._config["gcp"]["spool_path"]
+                    else None
+                ),
+            ).start()
+        return self._bigquery_writer
+
+    def insert_to_bigquery(
+        self, num_detections, config=None, block=False, timestamps=None
+    ):
         """Insert into bigquery, after receiving a list of detections
 
+        The rows are handed to the background BigQueryWriter, started on the
+        first call, the insert itself happens on its thread with the shared
+        client. With rollup
+        enabled the counts also go through the WindowAggregator and one row is
+        queued per closed window, per-frame rows only when rollup.raw_rows
+
         Args:
             num_detections (List[int]): List of detections as int
+            config (Dict, optional): Config with the location of the rows,
+                defaults to the config given to Agamotto
+            block (bool): If True, wait for room in the writer queue instead
+                of dropping rows (outside of the frame loop only)
+            timestamps (List[float], optional): Time of the frame of every
+                count in seconds since the epoch, defaults to now
         """
-        bigquery = BigQuery(self._config)
+        config = config if config is not None else self._config
+        bigquery = BigQuery(config)
+        if timestamps is None:
+            timestamps = [time.time()] * len(num_detections)
         detections_count = []
-        for values in num_detections:
-            logger(self.__class__.__name__).info(
-                f"Adding {values,datetime.now().strftime('%Y-%m-%dT%H:%M:%S')} to batch"
-            )
-            detections_count.append(
-                [values, datetime.now().strftime("%Y-%m-%dT%H:%M:%S")]
-            )
+        rows = []
+        for values, timestamp in zip(num_detections, timestamps):
+            day_time = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%dT%H:%M:%S")
+            logger(self.__class__.__name__).info(f"Adding {values,day_time} to batch")
+            detections_count.append([values, day_time])
+            if self._rollup is not None:
+                location_id = config["location"]["id"]
+                self._rollup_configs[location_id] = config
+                rows.extend(
+                    bigquery.build_window_rows(
+                        self._rollup.add(location_id, timestamp, values)
+                    )
+                )
+        if self._rollup is None or self._rollup_raw_rows:
+            rows = bigquery.build_rows(detections_count) + rows
+        if not rows:
+            return
         logger(self.__class__.__name__).info(
-            f"Attempting to stream insert {len(detections_count)} rows into BigQuery..."
+            f"Queueing {len(rows)} rows for BigQuery..."
         )
-        bigquery.insert(detections_count)
+        self._get_bigquery_writer().submit(rows, block=block)
+
+    def close(self):
+        """Flush the open rollup windows and the rows waiting in the BigQuery writer, then stop it"""
+        if self._bigquery_writer is None:
+            return
+        if self._rollup is not None:
+            for location_id, windows in self._rollup.flush().items():
+                self._bigquery_writer.submit(
+                    BigQuery(self._rollup_configs[location_id]).build_window_rows(
+                        windows
+                    ),
+                    block=True,
+                )
+        self._bigquery_writer.close()
+        self._bigquery_writer = None
+
+    def prepare_frame(self, frame):
+        """Resize, pad and normalize a frame with the current resolution profile
+
+        With uint8_preprocessing the frame is resized in uint8 into a reusable
+        buffer before the float conversion, the returned input is then only
+        valid until the next call
+
+        Args:
+            frame (numpy.ndarray): Frame from read
+
+        Returns:
+            Tuple[tf.Tensor, float]: `(1, height, width, 3)` input and ratio
+        """
+        with timed_stage("preprocess"):
+            if self._uint8_preprocessing:
+                return self._frame_preprocessor(frame)
+            image = tf.cast(frame, dtype=tf.float32)
+            return prepare_image(
+                image, min_side=self._min_side, max_side=self._max_side
+            )
 
     def create_detections(self, frame):
         """Create detections fit the inference model with the input
@@ -339,49 +874,174 @@ class Agamotto:
         Returns:
             #TODO: _description_
         """
-        image = tf.cast(frame, dtype=tf.float32)
-        input_image, ratio = prepare_image(image)
-        detections = self._inference_model.predict(input_image)
+        input_image, ratio = self.prepare_frame(frame)
+        detections = self.run_inference(input_image)
+        record_frames_processed()
         num_detections = detections.valid_detections[0]
 
         return detections, ratio, num_detections
 
-    def draw_boxes_to_frame(self, frame, detections, num_detections, ratio):
-        """Draw boxes to frame receives the output from create_detections
+    def create_detections_batch(self, frames, ratios=None):
+        """Create detections for several frames with a single forward pass
+
+        Frames are padded to a common shape and go through the inference model
+        (and DecodePredictions) as one batch, then the result is split back so
+        each frame gets the same output create_detections would give.
 
         Args:
-            frame (#TODO): _description_
-            detections (#TODO): _description_
-            num_detections (#TODO): _description_
-            ratio (#TODO): _description_
+            frames (List[numpy.ndarray]): Frames from read
+            ratios (List[float | None], optional): Scaling factor of each
+                frame, None entries use the resolution profile
+
+        Returns:
+            List[Tuple]: One (detections, ratio, num_detections) per frame
         """
-        class_names = [
-            self._int2str(int(x)) for x in detections.nmsed_classes[0][:num_detections]
+        with timed_stage("preprocess"):
+            if self._uint8_preprocessing:
+                input_images, ratios = self._frame_preprocessor.prepare_batch(
+                    frames, ratios
+                )
+            else:
+                images = [tf.cast(frame, dtype=tf.float32) for frame in frames]
+                input_images, ratios = prepare_image_batch(
+                    images,
+                    min_side=self._min_side,
+                    max_side=self._max_side,
+                    ratios=ratios,
+                )
+        detections = self.run_inference(input_images)
+        batch_detections = []
+        for index, ratio in enumerate(ratios):
+            frame_detections = tf.nest.map_structure(
+                lambda field, i=index: field[i : i + 1], detections
+            )
+            num_detections = frame_detections.valid_detections[0]
+            batch_detections.append((frame_detections, ratio, num_detections))
+        return batch_detections
+
+    def create_motion_gate(self):
+        """Motion gate built from video.motion_gate, one per video or camera
+
+        Returns:
+            MotionGate | None: None when the motion gate is disabled
+        """
+        if not self._video_motion_gate["enabled"]:
+            return None
+        return MotionGate(
+            method=self._video_motion_gate["method"],
+            threshold=self._video_motion_gate["threshold"],
+            pixel_threshold=self._video_motion_gate["pixel_threshold"],
+            downscale_width=self._video_motion_gate["downscale_width"],
+            max_skipped_frames=self._video_motion_gate["max_skipped_frames"],
+        )
+
+    def report_tiling(self):
+        """Log the latency and detections of the tiled inference, if enabled"""
+        if self._tiled_detector is not None:
+            self._tiled_detector.report()
+
+    def create_keyframe_tracker(self, detect_frames):
+        """Keyframe tracker built from video.tracker
+
+        Args:
+            detect_frames (Callable): Detector used on the keyframes, with the
+                create_detections_batch signature
+
+        Returns:
+            KeyframeTracker | None: None when the tracker is disabled
+        """
+        if not self._video_tracker["enabled"]:
+            return None
+        return KeyframeTracker(
+            detect_frames,
+            keyframe_interval=self._video_tracker["keyframe_interval"],
+            method=self._video_tracker["method"],
+            iou_threshold=self._video_tracker["iou_threshold"],
+            evaluate_drift=self._video_tracker["evaluate_drift"],
+        )
+
+    def create_gated_detections(self, frames, motion_gates, rois=None):
+        """create_detections_batch for the frames that pass their motion gate
+
+        Frames with a region of interest are cropped to it first, the crop is
+        scaled with the ratio of the full frame so people keep the size the
+        model sees without the region, and the boxes are mapped back to frame
+        coordinates (ratio 1.0). Frames without changes since the last
+        inference of their gate reuse its detections, the others go through
+        the model as one batch (or through the TiledDetector when
+        model.tiling is enabled).
+
+        Args:
+            frames (List[numpy.ndarray]): Frames from read
+            motion_gates (List[MotionGate | None]): Gate of each frame, None
+                always runs the inference
+            rois (List[RegionOfInterest | None], optional): Region of each
+                frame, None (or a region outside of the frame) uses the whole
+                frame
+
+        Returns:
+            List[Tuple]: One (detections, ratio, num_detections) per frame
+        """
+        rois = [
+            None if roi is None else roi.for_frame(frame.shape)
+            for frame, roi in zip(frames, rois or [None] * len(frames))
         ]
-        for box, _cls, score in zip(
-            detections.nmsed_boxes[0][:num_detections] / ratio,
-            class_names,
-            detections.nmsed_scores[0][:num_detections],
-        ):
-            text = f"{_cls}: {score}"
-            texttotal = f"agamotto_total_count: {num_detections}"
-            x1, y1, x2, y2 = box  # w, h = x2 - x1, y2 - y1
-            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 1)
-            cv2.putText(
-                frame,
-                text,
-                (int(x1), int(y1) - 10),
-                cv2.FONT_HERSHEY_DUPLEX,
-                0.6,
-                (36, 255, 12),
-                1,
+        inputs = [
+            frame if roi is None else roi.crop(frame)
+            for frame, roi in zip(frames, rois)
+        ]
+        needs_inference = [
+            motion_gate is None or motion_gate.should_infer(image)
+            for image, motion_gate in zip(inputs, motion_gates)
+        ]
+        inferred_inputs = [
+            image for image, infer in zip(inputs, needs_inference) if infer
+        ]
+        inferred_ratios = [
+            (
+                None
+                if roi is None
+                else self._frame_preprocessor.compute_shapes(*frame.shape[:2])[0]
             )
-            cv2.putText(
-                frame,
-                texttotal,
-                (100, 100),
-                cv2.FONT_HERSHEY_COMPLEX,
-                0.9,
-                (36, 255, 12),
-                2,
+            for frame, roi, infer in zip(frames, rois, needs_inference)
+            if infer
+        ]
+        record_frames_processed(len(inferred_inputs))
+        if len(inferred_inputs) < len(frames):
+            record_frames_skipped("motion_gate", len(frames) - len(inferred_inputs))
+        if not inferred_inputs:
+            inferred = iter([])
+        elif self._tiled_detector is not None:
+            inferred = iter(self._tiled_detector(inferred_inputs))
+        else:
+            inferred = iter(
+                self.create_detections_batch(inferred_inputs, inferred_ratios)
             )
+        batch_detections = []
+        for frame, motion_gate, roi, infer in zip(
+            frames, motion_gates, rois, needs_inference
+        ):
+            if infer:
+                frame_detections = next(inferred)
+                if roi is not None:
+                    frame_detections = roi.to_frame(frame_detections, frame.shape)
+                if motion_gate is not None:
+                    motion_gate.last_result = frame_detections
+            else:
+                frame_detections = motion_gate.last_result
+            batch_detections.append(frame_detections)
+        return batch_detections
+
+    def draw_boxes_to_frame(self, frame, detections, num_detections, ratio):
+        """Draw boxes to frame receives the output from create_detections
+
+        What is drawn depends on video.render_level, see OverlayRenderer
+
+        Args:
+            frame (numpy.ndarray): Frame, drawn in place
+            detections (Detections): Detections of the frame (batch of 1)
+            num_detections (int): Number of valid detections
+            ratio (float): Scaling factor used to prepare the frame
+        """
+        with timed_stage("render"):
+            self._overlay_renderer.render(frame, detections, num_detections, ratio)
@@ -0,0 +1,164 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Long-lived capture of a stream, a thread keeps the connection open and holds
+only the newest decoded frame
+"""
+
+import threading
+import time
+
+import cv2
+
+from utils.logger import logger
+from utils.metrics import observe_stage
+
+
+class LatestFrameReader(threading.Thread):
+    """Keeps a stream open and holds only its newest frame
+
+    The connection and decoder are set up once, the thread reads frames as
+    fast as the source delivers them so nothing piles up in OpenCV's buffer,
+    and readers always get the newest frame. When the stream fails it is
+    reopened with an exponential backoff.
+
+    Local files (reconnect is False) are read at their own frame rate, like a
+    camera, and the reader finishes at the end of the file instead of
+    reopening it.
+
+    Attributes:
+        input_location: Anything cv2.VideoCapture can open
+        initial_delay: Seconds before the first reconnection attempt
+        max_delay: Upper bound of the reconnection delay
+        reconnect: If False, the reader finishes when the source ends
+    """
+
+    def __init__(
+        self,
+        input_location,
+        initial_delay=1.0,
+        max_delay=30.0,
+        name=None,
+        reconnect=True,
+    ):
+        super().__init__(name=name or "agamotto-capture", daemon=True)
+        self.input_location = input_location
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._reconnect = reconnect
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._finished = threading.Event()
+        self._frame = None
+        self._sequence = 0
+        self.reconnections = 0
+
+    def _open(self):
+        """Open the stream asking OpenCV to buffer as few frames as possible"""
+        player = cv2.VideoCapture(self.input_location)
+        player.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return player
+
+    def run(self):
+        try:
+            self._read()
+        finally:
+            self._finished.set()
+            with self._condition:
+                self._condition.notify_all()
+
+    def _read(self):
+        """Read frames until stopped, or until the end of a local file"""
+        delay = self._initial_delay
+        while not self._stop_event.is_set():
+            logger(self.__class__.__name__).info(
+                f"Loading stream {self.input_location}"
+            )
+            player = self._open()
+            fps = player.get(cv2.CAP_PROP_FPS)
+            frame_period = 1 / fps if not self._reconnect and fps > 0 else 0.0
+            next_frame = time.perf_counter()
+            while player.isOpened() and not self._stop_event.is_set():
+                start_time = time.perf_counter()
+                ret, frame = player.read()
+                if not ret:
+                    break
+                observe_stage("capture", time.perf_counter() - start_time)
+                delay = self._initial_delay
+                with self._condition:
+                    self._frame = frame
+                    self._sequence += 1
+                    self._condition.notify_all()
+                if frame_period:
+                    next_frame += frame_period
+                    self._stop_event.wait(max(0.0, next_frame - time.perf_counter()))
+            player.release()
+            if self._stop_event.is_set():
+                break
+            if not self._reconnect:
+                logger(self.__class__.__name__).info(
+                    f"End of {self.input_location} after {self._sequence} frames"
+                )
+                break
+            self.reconnections += 1
+            logger(self.__class__.__name__).info(
+                f"Frame was not load correctly, reconnecting in {delay:.1f}s..."
+            )
+            self._stop_event.wait(delay)
+            delay = min(delay * 2, self._max_delay)
+
+    @property
+    def finished(self):
+        """True once the reader stopped, after the last frame of a local file"""
+        return self._finished.is_set()
+
+    def latest(self):
+        """Newest frame of the stream
+
+        Returns:
+            Tuple[int, numpy.ndarray]: Sequence number and frame (None if no
+            frame was read yet)
+        """
+        with self._condition:
+            return self._sequence, self._frame
+
+    def wait_for_frame(self, after_sequence, timeout=None):
+        """Wait for a frame newer than after_sequence
+
+        Args:
+            after_sequence (int): Sequence number of the last frame used
+            timeout (float, optional): Maximum seconds to wait
+
+        Returns:
+            Tuple[int, numpy.ndarray]: Sequence number and frame, the frame is
+            None if nothing newer arrived before the timeout
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._sequence > after_sequence
+                or self._stop_event.is_set()
+                or self._finished.is_set(),
+                timeout=timeout,
+            )
+            if self._sequence > after_sequence:
+                return self._sequence, self._frame
+            return self._sequence, None
+
+    def stop(self):
+        """Ask the reader to stop and release the stream"""
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
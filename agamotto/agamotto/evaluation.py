@@ -0,0 +1,108 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Evaluation of the resolution profiles, count error and per-frame latency of
+every profile on a local video
+"""
+
+import statistics
+import time
+
+import cv2
+
+from utils.logger import logger
+from .sampler import FrameSampler
+
+
+def read_ground_truth(path):
+    """Read one expected count per sampled frame, one integer per line"""
+    with open(path) as ground_truth_file:
+        return [int(line) for line in ground_truth_file if line.strip()]
+
+
+def count_frames(agamotto, video_path, interval, num_frames):
+    """Count persons on the first num_frames samples of a video
+
+    Returns:
+        Tuple[List[int], List[float]]: Counts and latencies in milliseconds,
+        the first frame is a warmup and is not in the latencies
+    """
+    counts, latencies = [], []
+    player = cv2.VideoCapture(video_path)
+    for position, sampled_frame in enumerate(FrameSampler(player, interval=interval)):
+        if position >= num_frames:
+            break
+        start_time = time.perf_counter()
+        _, _, num_detections = agamotto.create_detections(sampled_frame.image)
+        if position > 0:
+            latencies.append((time.perf_counter() - start_time) * 1000.0)
+        counts.append(int(num_detections))
+    player.release()
+    return counts, latencies
+
+
+def evaluate_resolution_profiles(
+    agamotto,
+    video_path,
+    profiles,
+    reference_profile,
+    interval=1.0,
+    num_frames=50,
+    ground_truth=None,
+):
+    """Run every resolution profile on the same frames
+
+    The count error is measured against the ground truth when it is given,
+    otherwise against the counts of the reference profile
+
+    Args:
+        agamotto (Agamotto): Agamotto instance with the loaded model
+        video_path (str): Local video
+        profiles (List[str]): Names of the profiles to evaluate
+        reference_profile (str): Profile used as reference without ground truth
+        interval (float): Seconds between two sampled frames
+        num_frames (int): Number of sampled frames
+        ground_truth (List[int], optional): Expected count of every frame
+
+    Returns:
+        Dict[str, Dict[str, float]]: Results of every profile
+    """
+    profile_counts, profile_latencies = {}, {}
+    for profile in profiles:
+        agamotto.set_resolution_profile(profile)
+        profile_counts[profile], profile_latencies[profile] = count_frames(
+            agamotto, video_path, interval, num_frames
+        )
+    reference = ground_truth or profile_counts[reference_profile]
+
+    results = {}
+    for profile in profiles:
+        counts = profile_counts[profile]
+        latencies = profile_latencies[profile] or [0.0]
+        errors = [abs(count - expected) for count, expected in zip(counts, reference)]
+        results[profile] = {
+            "frames": len(counts),
+            "mean_count": statistics.mean(counts) if counts else 0.0,
+            "count_mae": statistics.mean(errors) if errors else 0.0,
+            "median_ms": statistics.median(latencies),
+            "mean_ms": statistics.mean(latencies),
+        }
+        logger("evaluate_resolution_profiles").info(
+            f"{profile}: count MAE {results[profile]['count_mae']:.2f}, "
+            f"mean count {results[profile]['mean_count']:.2f}, "
+            f"median {results[profile]['median_ms']:.1f}ms/frame"
+        )
+    return results
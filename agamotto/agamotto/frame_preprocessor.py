@@ -0,0 +1,153 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Inference preprocessing of camera frames in uint8, the frame is resized and
+padded before the float conversion so the float tensor has the model size
+instead of the camera size
+"""
+
+import cv2
+import numpy as np
+
+# Same mean as tf.keras.applications.resnet.preprocess_input ("caffe" mode)
+_RESNET_MEAN = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+
+class FramePreprocessor:
+    """Resize and pad in uint8 into reusable buffers, then normalize
+
+    The output matches `prepare_image` / `prepare_image_batch`: the ratio and
+    the padded shape are computed with the same float32 arithmetic as
+    `resize_and_pad_image`, the resize is bilinear with half pixel centers
+    like `tf.image.resize`, and the normalization is the ResNet
+    `preprocess_input` applied after the zero padding.
+
+    The returned array is a buffer owned by the preprocessor, it is only
+    valid until the next call.
+
+    Attributes:
+        min_side: Shorter side after resizing
+        max_side: Upper bound of the longer side after resizing
+        stride: The padded shape is a multiple of stride
+    """
+
+    def __init__(self, min_side=800.0, max_side=1333.0, stride=128.0):
+        self._min_side = np.float32(min_side)
+        self._max_side = np.float32(max_side)
+        self._stride = np.float32(stride)
+        self._padded = None
+        self._padded_region = None
+        self._resized = None
+        self._batch = None
+
+    def compute_shapes(self, height, width, ratio=None):
+        """Ratio, resized shape and padded shape of a frame
+
+        Args:
+            height (int): Frame height
+            width (int): Frame width
+            ratio (float, optional): Scaling factor to use instead of the one
+                given by min_side and max_side
+
+        Returns:
+            Tuple[numpy.float32, Tuple[int, int], Tuple[int, int]]
+        """
+        image_shape = np.array([height, width], dtype=np.float32)
+        if ratio is not None:
+            ratio = np.float32(ratio)
+        else:
+            ratio = self._min_side / np.min(image_shape)
+            if ratio * np.max(image_shape) > self._max_side:
+                ratio = self._max_side / np.max(image_shape)
+        image_shape = ratio * image_shape
+        resized_shape = tuple(int(side) for side in image_shape.astype(np.int32))
+        padded_shape = tuple(
+            int(side)
+            for side in (np.ceil(image_shape / self._stride) * self._stride).astype(
+                np.int32
+            )
+        )
+        return ratio, resized_shape, padded_shape
+
+    def _buffer(self, name, shape, dtype):
+        """Reuse the buffer stored in name, allocating it when the shape changes"""
+        buffer = getattr(self, name)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.zeros(shape, dtype=dtype)
+            setattr(self, name, buffer)
+            if name == "_padded":
+                self._padded_region = None
+        return buffer
+
+    def _resize_into_padded(self, frame, resized_shape, padded_shape):
+        """Resize frame in uint8 into the top left corner of the padded buffer"""
+        padded = self._buffer("_padded", padded_shape + (3,), np.uint8)
+        if self._padded_region is not None and self._padded_region != resized_shape:
+            padded.fill(0)
+        resized = self._buffer("_resized", resized_shape + (3,), np.uint8)
+        cv2.resize(
+            frame,
+            (resized_shape[1], resized_shape[0]),
+            dst=resized,
+            interpolation=cv2.INTER_LINEAR,
+        )
+        padded[: resized_shape[0], : resized_shape[1]] = resized
+        self._padded_region = resized_shape
+        return padded
+
+    def prepare_batch(self, frames, ratios=None):
+        """Prepare frames as a single padded float32 batch
+
+        Args:
+            frames (List[numpy.ndarray]): uint8 frames `(height, width, 3)`
+            ratios (List[float | None], optional): Scaling factor of each
+                frame, None entries use min_side and max_side
+
+        Returns:
+            Tuple[numpy.ndarray, List[numpy.float32]]: `(len(frames), H, W, 3)`
+            batch and the ratio of every frame
+        """
+        ratios = ratios or [None] * len(frames)
+        shapes = [
+            self.compute_shapes(*frame.shape[:2], ratio=ratio)
+            for frame, ratio in zip(frames, ratios)
+        ]
+        batch_height = max(padded_shape[0] for _, _, padded_shape in shapes)
+        batch_width = max(padded_shape[1] for _, _, padded_shape in shapes)
+        batch = self._buffer(
+            "_batch", (len(frames), batch_height, batch_width, 3), np.float32
+        )
+        for index, (frame, (_, resized_shape, _)) in enumerate(zip(frames, shapes)):
+            padded = self._resize_into_padded(
+                frame, resized_shape, (batch_height, batch_width)
+            )
+            # preprocess_input flips the channels and subtracts the mean
+            np.subtract(
+                padded[..., ::-1], _RESNET_MEAN, out=batch[index], dtype=np.float32
+            )
+        return batch, [ratio for ratio, _, _ in shapes]
+
+    def __call__(self, frame):
+        """Prepare a single frame
+
+        Args:
+            frame (numpy.ndarray): uint8 frame `(height, width, 3)`
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.float32]: `(1, H, W, 3)` input and ratio
+        """
+        batch, ratios = self.prepare_batch([frame])
+        return batch, ratios[0]
@@ -0,0 +1,94 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Compiled inference entry point, it runs the RetinaNet forward pass and the
+DecodePredictions layer through tf.function instead of keras Model.predict
+"""
+
+import tensorflow as tf
+
+from utils.metrics import timed_stage
+
+
+class CompiledInference:
+    """Inference function with a fixed input signature
+
+    `tf.keras.Model.predict` builds a data adapter and a new execution context
+    on every call, this class traces the forward pass once for a
+    `(batch, height, width, 3)` float32 input with dynamic batch, height and
+    width, and returns the detections as NumPy arrays.
+
+    The forward pass can be compiled with XLA (`jit_compile`), the decoding
+    runs on its own tf.function because `combined_non_max_suppression` has no
+    XLA kernel. The anchors are given to the decoding as an input, they come
+    from the per-shape cache so they are not rebuilt on every frame.
+
+    Attributes:
+        model: RetinaNet model with the loaded weights
+        decode_predictions: DecodePredictions layer used after the forward pass
+        jit_compile: If True, the forward pass is compiled with XLA
+    """
+
+    def __init__(self, model, decode_predictions, jit_compile=False):
+        self._model = model
+        self._decode_predictions = decode_predictions
+        self._jit_compile = jit_compile
+        self._forward = tf.function(
+            self._forward_pass,
+            input_signature=[
+                tf.TensorSpec(shape=[None, None, None, 3], dtype=tf.float32)
+            ],
+            jit_compile=jit_compile,
+        )
+        self._decode = tf.function(
+            self._decode_pass,
+            input_signature=[
+                tf.TensorSpec(shape=[None, None, None, 3], dtype=tf.float32),
+                tf.TensorSpec(shape=[None, None, None], dtype=tf.float32),
+                tf.TensorSpec(shape=[None, 4], dtype=tf.float32),
+            ],
+        )
+
+    def _forward_pass(self, images):
+        """RetinaNet forward pass, traced by tf.function"""
+        return self._model(images, training=False)
+
+    def _decode_pass(self, images, predictions, anchor_boxes):
+        """DecodePredictions pass, traced by tf.function"""
+        return self._decode_predictions(images, predictions, anchor_boxes=anchor_boxes)
+
+    def __call__(self, images):
+        """Run the compiled inference
+
+        Args:
+            images (tf.Tensor): A `(batch, height, width, 3)` or a single
+                `(height, width, 3)` float32 image already prepared
+
+        Returns:
+            Detections namedtuple (same fields as Model.predict) with NumPy
+            arrays, always with the batch dimension
+        """
+        images = tf.convert_to_tensor(images, dtype=tf.float32)
+        if images.shape.rank == 3:
+            images = tf.expand_dims(images, axis=0)
+        anchor_boxes = self._decode_predictions.get_anchors(
+            int(images.shape[1]), int(images.shape[2])
+        )
+        with timed_stage("forward"):
+            predictions = self._forward(images)
+        with timed_stage("decode"):
+            detections = self._decode(images, predictions, anchor_boxes)
+            return tf.nest.map_structure(lambda field: field.numpy(), detections)
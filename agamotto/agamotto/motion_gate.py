@@ -0,0 +1,131 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Motion gate, a cheap check on a downscaled frame that decides if the frame
+needs to go through the model or if the previous detections still hold
+"""
+
+import cv2
+import numpy as np
+
+MOTION_GATE_METHODS = ("diff", "mog2")
+
+
+class MotionGate:
+    """Skips the inference of frames where nothing changed
+
+    The frame is converted to gray, downscaled and blurred. With the `diff`
+    method it is compared with the last frame that went through the model,
+    with `mog2` a background model tells which pixels are foreground. When the
+    fraction of changed pixels is below `threshold` the previous detections
+    are reused.
+
+    Attributes:
+        method: diff or mog2
+        threshold: Fraction of changed pixels that triggers the inference
+        pixel_threshold: Gray level difference for a pixel to count as changed
+            (diff method)
+        downscale_width: Width of the frame used for the comparison
+        max_skipped_frames: Run the inference after this many skipped frames
+            in a row even without changes, 0 disables it
+        last_result: Result of the last frame that went through the model
+        inference_calls: Number of frames that went through the model
+        skipped: Number of frames that reused the previous result
+    """
+
+    def __init__(
+        self,
+        method="diff",
+        threshold=0.005,
+        pixel_threshold=25,
+        downscale_width=160,
+        max_skipped_frames=0,
+    ):
+        if method not in MOTION_GATE_METHODS:
+            raise ValueError(
+                f"Unknown motion gate method {method}, available: {MOTION_GATE_METHODS}"
+            )
+        self.method = method
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.downscale_width = downscale_width
+        self.max_skipped_frames = max_skipped_frames
+        self.last_result = None
+        self.inference_calls = 0
+        self.skipped = 0
+        self._skipped_in_a_row = 0
+        self._reference = None
+        self._background = (
+            cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+            if method == "mog2"
+            else None
+        )
+
+    def _downscale(self, frame):
+        """Gray, downscaled and blurred copy of the frame"""
+        height, width = frame.shape[:2]
+        size = (self.downscale_width, max(1, height * self.downscale_width // width))
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def changed_fraction(self, small):
+        """Fraction of pixels that changed in a downscaled frame"""
+        if self._background is not None:
+            mask = self._background.apply(small)
+            return np.count_nonzero(mask) / mask.size
+        if self._reference is None or self._reference.shape != small.shape:
+            return 1.0
+        difference = cv2.absdiff(small, self._reference)
+        return np.count_nonzero(difference > self.pixel_threshold) / difference.size
+
+    def should_infer(self, frame):
+        """Decide if a frame needs the inference, recording the decision
+
+        Args:
+            frame (numpy.ndarray): BGR frame
+
+        Returns:
+            bool: True if the frame must go through the model
+        """
+        small = self._downscale(frame)
+        # Always computed so the mog2 background model sees every frame
+        changed_fraction = self.changed_fraction(small)
+        changed = (
+            self.last_result is None
+            or changed_fraction >= self.threshold
+            or (
+                self.max_skipped_frames
+                and self._skipped_in_a_row >= self.max_skipped_frames
+            )
+        )
+        if changed:
+            self._reference = small
+            self._skipped_in_a_row = 0
+            self.inference_calls += 1
+        else:
+            self._skipped_in_a_row += 1
+            self.skipped += 1
+        return bool(changed)
+
+    def summary(self):
+        """Single line report of the skipped inference calls"""
+        total = self.inference_calls + self.skipped
+        skipped_percent = 100.0 * self.skipped / total if total else 0.0
+        return (
+            f"Motion gate ({self.method}): {self.skipped} of {total} frames "
+            f"skipped the inference ({skipped_percent:.1f}%)"
+        )
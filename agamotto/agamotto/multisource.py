@@ -0,0 +1,219 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Multi-camera engine, one capture worker per source and a single inference
+worker that batches the latest frame of every source through one model
+"""
+
+import time
+from collections import namedtuple
+
+import cv2
+
+from utils.logger import logger
+from utils.metrics import record_detections, timed_stage
+from .capture import LatestFrameReader
+from .roi import RegionOfInterest
+
+Source = namedtuple("Source", ["index", "input_location", "config"])
+Source.__doc__ = """A camera handled by the MultiSourceEngine
+
+Attributes:
+    index: Position of the source in video.input_location
+    input_location: Anything cv2.VideoCapture can open
+    config: agamotto.yaml config with this camera's location section
+"""
+
+
+def parse_sources(config):
+    """Build the sources from a list in video.input_location
+
+    Every entry can be a plain input location or a dict with `input_location`
+    and an optional `location` section, sources without their own location
+    use the top level one.
+
+    Args:
+        config (Dict): Config read from agamotto.yaml
+
+    Returns:
+        List[Source]: One source per entry, in order
+    """
+    sources = []
+    for index, entry in enumerate(config["video"]["input_location"]):
+        if isinstance(entry, dict):
+            input_location = entry["input_location"]
+            location = entry.get("location", config["location"])
+        else:
+            input_location = entry
+            location = config["location"]
+        sources.append(
+            Source(
+                index=index,
+                input_location=input_location,
+                config=dict(config, location=location),
+            )
+        )
+    return sources
+
+
+class MultiSourceEngine:
+    """Runs every source through one shared Agamotto model
+
+    Each source has its own LatestFrameReader, every `read_interval` seconds the
+    inference worker (caller thread) takes the newest unseen frame of every
+    source, runs them in batches of `batch_size` and routes the detections,
+    the drawn frame (`frame-<index>.jpg`) and the BigQuery rows back to the
+    source's own location.
+
+    Attributes:
+        agamotto: Agamotto instance with the loaded model
+        sources: List of Source
+        read_interval: Seconds between two inference rounds
+        batch_size: Maximum number of frames in one forward pass
+        save_to_bigquery: If True, counts are inserted for each location
+        reconnect_initial_delay: First reconnection delay of every source
+        reconnect_max_delay: Upper bound of the reconnection delay
+        write_frames: If False, frame-<index>.jpg is not written
+        reconnect: If False (local files), a source ends with its file and
+            run returns once every source ended
+    """
+
+    def __init__(
+        self,
+        agamotto,
+        sources,
+        read_interval,
+        batch_size,
+        save_to_bigquery,
+        reconnect_initial_delay=1.0,
+        reconnect_max_delay=30.0,
+        write_frames=True,
+        reconnect=True,
+    ):
+        self._agamotto = agamotto
+        self._sources = sources
+        self._read_interval = read_interval
+        self._batch_size = max(1, batch_size)
+        self._save_to_bigquery = save_to_bigquery
+        self._write_frames = write_frames
+        self._workers = [
+            LatestFrameReader(
+                source.input_location,
+                initial_delay=reconnect_initial_delay,
+                max_delay=reconnect_max_delay,
+                name=f"agamotto-capture-{source.index}",
+                reconnect=reconnect,
+            )
+            for source in sources
+        ]
+        self._last_sequences = [0] * len(sources)
+        self._motion_gates = [agamotto.create_motion_gate() for _ in sources]
+        self._rois = [
+            RegionOfInterest.from_location(source.config["location"])
+            for source in sources
+        ]
+
+    def _collect_frames(self):
+        """Newest unseen frame of every source
+
+        Returns:
+            List[Tuple[Source, numpy.ndarray, float]]: Sources with a new
+            frame and the time it was taken from the reader
+        """
+        frames = []
+        for position, (source, worker) in enumerate(zip(self._sources, self._workers)):
+            sequence, frame = worker.latest()
+            if frame is None or sequence == self._last_sequences[position]:
+                continue
+            self._last_sequences[position] = sequence
+            frames.append((source, frame, time.time()))
+        return frames
+
+    def _route(self, source, frame, captured_at, frame_detections):
+        """Draw, write and store the result of one source"""
+        detections, ratio, num_detections = frame_detections
+        location_name = source.config["location"]["name"]
+        logger(self.__class__.__name__).info(
+            f"Count of persons at {location_name}: {num_detections}"
+        )
+        record_detections(num_detections, location_name)
+        self._agamotto.draw_boxes_to_frame(
+            frame=frame,
+            detections=detections,
+            num_detections=num_detections,
+            ratio=ratio,
+        )
+        if self._save_to_bigquery:
+            self._agamotto.insert_to_bigquery(
+                num_detections=[num_detections],
+                config=source.config,
+                timestamps=[captured_at],
+            )
+        if self._write_frames:
+            with timed_stage("write"):
+                cv2.imwrite(f"frame-{source.index}.jpg", frame)
+
+    def run_once(self):
+        """Run one inference round over the newest frame of every source
+
+        Returns:
+            int: Number of frames processed
+        """
+        frames = self._collect_frames()
+        for start in range(0, len(frames), self._batch_size):
+            batch = frames[start : start + self._batch_size]
+            batch_detections = self._agamotto.create_gated_detections(
+                [frame for _, frame, _ in batch],
+                [self._motion_gates[source.index] for source, _, _ in batch],
+                [self._rois[source.index] for source, _, _ in batch],
+            )
+            for (source, frame, captured_at), frame_detections in zip(
+                batch, batch_detections
+            ):
+                self._route(source, frame, captured_at, frame_detections)
+        return len(frames)
+
+    def run(self):
+        """Start the capture workers and run inference rounds
+
+        Streams run forever, local files until the last one ended and its
+        final frame went through the model
+        """
+        for worker in self._workers:
+            worker.start()
+        try:
+            while True:
+                start_time = time.perf_counter()
+                finished = all(worker.finished for worker in self._workers)
+                processed = self.run_once()
+                if finished and not processed:
+                    break
+                elapsed = time.perf_counter() - start_time
+                if processed:
+                    logger(self.__class__.__name__).info(
+                        f"Processed {processed}/{len(self._sources)} sources in "
+                        f"{elapsed:.2f}s ({processed / max(elapsed, 1e-9):.2f} frames/sec)"
+                    )
+                time.sleep(max(0.0, self._read_interval - elapsed))
+        finally:
+            for worker in self._workers:
+                worker.stop()
+            self._agamotto.report_tiling()
+            for source, motion_gate in zip(self._sources, self._motion_gates):
+                if motion_gate is not None:
+                    logger(self.__class__.__name__).info(
+                        f"{source.config['location']['name']}: {motion_gate.summary()}"
+                    )
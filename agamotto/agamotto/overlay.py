@@ -0,0 +1,105 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Overlay renderer, draws the detections and the total count into a frame
+"""
+
+import cv2
+import numpy as np
+
+RENDER_LEVELS = ("none", "count", "boxes", "full")
+
+
+class OverlayRenderer:
+    """Draws detections into frames with a configurable level of detail
+
+    Levels:
+        none: nothing is drawn (headless deployments)
+        count: only the total count
+        boxes: the total count and the boxes
+        full: the total count, the boxes and their label and score
+
+    The detections of a frame are converted to NumPy once, label names are
+    cached per class id and the total count is drawn once per frame.
+
+    Attributes:
+        int2str: Callable returning the label name of a class id
+        render_level: One of RENDER_LEVELS
+    """
+
+    def __init__(self, int2str, render_level="full"):
+        if render_level not in RENDER_LEVELS:
+            raise ValueError(
+                f"Unknown render level {render_level}, available: {RENDER_LEVELS}"
+            )
+        self._int2str = int2str
+        self.render_level = render_level
+        self._labels = {}
+
+    @property
+    def enabled(self):
+        """False when nothing is drawn"""
+        return self.render_level != "none"
+
+    def _label(self, class_id):
+        """Label name of a class id, cached"""
+        label = self._labels.get(class_id)
+        if label is None:
+            label = self._int2str(class_id)
+            self._labels[class_id] = label
+        return label
+
+    def render(self, frame, detections, num_detections, ratio):
+        """Draw a frame's detections into it
+
+        Args:
+            frame (numpy.ndarray): Frame, drawn in place
+            detections (Detections): Detections batch of the frame (batch of 1)
+            num_detections (int): Number of valid detections
+            ratio (float): Scaling factor used to prepare the frame
+        """
+        if self.render_level == "none":
+            return
+        num_detections = int(num_detections)
+        if self.render_level in ("boxes", "full") and num_detections:
+            boxes = np.asarray(detections.nmsed_boxes[0][:num_detections]) / np.float32(
+                ratio
+            )
+            boxes = boxes.astype(np.int32)
+            if self.render_level == "full":
+                classes = np.asarray(detections.nmsed_classes[0][:num_detections])
+                scores = np.asarray(detections.nmsed_scores[0][:num_detections])
+            for index, (x1, y1, x2, y2) in enumerate(boxes):
+                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 1)
+                if self.render_level == "full":
+                    cv2.putText(
+                        frame,
+                        f"{self._label(int(classes[index]))}: {scores[index]}",
+                        (int(x1), int(y1) - 10),
+                        cv2.FONT_HERSHEY_DUPLEX,
+                        0.6,
+                        (36, 255, 12),
+                        1,
+                    )
+        cv2.putText(
+            frame,
+            f"agamotto_total_count: {num_detections}",
+            (100, 100),
+            cv2.FONT_HERSHEY_COMPLEX,
+            0.9,
+            (36, 255, 12),
+            2,
+        )
@@ -0,0 +1,228 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Staged frame pipeline, capture -> inference -> render/write connected by
+bounded queues so OpenCV decoding and encoding overlap with the model
+"""
+
+import queue
+import threading
+import time
+
+from utils.logger import logger
+from utils.metrics import observe_stage, record_queue_depth
+
+_END_OF_STREAM = object()
+
+
+class StageStats:
+    """Time and input queue depth of a pipeline stage
+
+    Attributes:
+        name: Stage name used in the report
+        items: Number of frames handled by the stage
+        busy_time: Seconds spent doing the stage work (waiting excluded)
+        max_queue_depth: Largest input queue depth seen by the stage
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_time = 0.0
+        self.max_queue_depth = 0
+        self._queue_depth_sum = 0
+        self._queue_depth_samples = 0
+        self._lock = threading.Lock()
+
+    def record(self, duration, items=1):
+        """Record the time spent on a number of items"""
+        with self._lock:
+            self.items += items
+            self.busy_time += duration
+
+    def record_queue_depth(self, depth):
+        """Record the input queue depth seen when the stage took an item"""
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+            self._queue_depth_sum += depth
+            self._queue_depth_samples += 1
+
+    @property
+    def mean_queue_depth(self):
+        """Mean input queue depth"""
+        with self._lock:
+            if not self._queue_depth_samples:
+                return 0.0
+            return self._queue_depth_sum / self._queue_depth_samples
+
+    def summary(self):
+        """Single line report of the stage"""
+        per_item = self.busy_time / self.items * 1000.0 if self.items else 0.0
+        return (
+            f"{self.name}: {self.items} frames, busy {self.busy_time:.2f}s "
+            f"({per_item:.1f}ms/frame), input queue mean "
+            f"{self.mean_queue_depth:.1f} max {self.max_queue_depth}"
+        )
+
+
+class FramePipeline:
+    """Runs a capture thread, the inference stage and a render/writer thread
+
+    The capture thread iterates `frames` and feeds a bounded queue, the
+    inference stage (caller thread, where the model lives) takes up to
+    `batch_size` frames at a time and the render/writer thread receives every
+    frame with its detections. Every queue has a single producer and a single
+    consumer, so frames reach `write_frame` in the order they were read.
+
+    Attributes:
+        frames: Iterable of frames (any object understood by the callbacks)
+        detect_frames: Callable receiving a list of frames and returning one
+            result per frame, in the same order
+        write_frame: Callable receiving (frame, result)
+        batch_size: Maximum number of frames given to detect_frames
+        queue_size: Size of both bounded queues
+    """
+
+    def __init__(self, frames, detect_frames, write_frame, batch_size=1, queue_size=8):
+        self._frames = frames
+        self._detect_frames = detect_frames
+        self._write_frame = write_frame
+        self._batch_size = max(1, batch_size)
+        self._capture_queue = queue.Queue(maxsize=queue_size)
+        self._render_queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._errors = []
+        self.capture_stats = StageStats("capture")
+        self.inference_stats = StageStats("inference")
+        self.render_stats = StageStats("render/write")
+
+    def _put(self, target_queue, item):
+        """Put into a bounded queue, giving up if the pipeline is stopping"""
+        while not self._stop.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source_queue):
+        """Get from a queue, returning the end marker if the pipeline is stopping"""
+        while True:
+            try:
+                return source_queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _END_OF_STREAM
+
+    def _capture(self):
+        """Capture thread, reads frames and feeds the capture queue"""
+        try:
+            frames = iter(self._frames)
+            while not self._stop.is_set():
+                start_time = time.perf_counter()
+                try:
+                    frame = next(frames)
+                except StopIteration:
+                    break
+                duration = time.perf_counter() - start_time
+                self.capture_stats.record(duration)
+                observe_stage("capture", duration)
+                if not self._put(self._capture_queue, frame):
+                    break
+        except Exception as ex:  # pylint: disable=broad-except
+            self._errors.append(ex)
+        finally:
+            self._put(self._capture_queue, _END_OF_STREAM)
+
+    def _render(self):
+        """Render/writer thread, draws and writes frames in order"""
+        try:
+            while True:
+                depth = self._render_queue.qsize()
+                item = self._get(self._render_queue)
+                if item is _END_OF_STREAM:
+                    break
+                self.render_stats.record_queue_depth(depth)
+                record_queue_depth("render", depth)
+                start_time = time.perf_counter()
+                self._write_frame(*item)
+                self.render_stats.record(time.perf_counter() - start_time)
+        except Exception as ex:  # pylint: disable=broad-except
+            self._errors.append(ex)
+            self._stop.set()
+
+    def _next_batch(self):
+        """Take up to batch_size frames from the capture queue
+
+        Returns:
+            Tuple[List, bool]: The frames and True once the stream ended
+        """
+        batch = []
+        while len(batch) < self._batch_size:
+            depth = self._capture_queue.qsize()
+            item = self._get(self._capture_queue)
+            if item is _END_OF_STREAM:
+                return batch, True
+            self.inference_stats.record_queue_depth(depth)
+            record_queue_depth("capture", depth)
+            batch.append(item)
+        return batch, False
+
+    def run(self):
+        """Run the pipeline until the frames are exhausted
+
+        Raises:
+            Exception: The first error raised by any of the stages
+        """
+        capture_thread = threading.Thread(
+            target=self._capture, name="agamotto-capture", daemon=True
+        )
+        render_thread = threading.Thread(
+            target=self._render, name="agamotto-render", daemon=True
+        )
+        capture_thread.start()
+        render_thread.start()
+        try:
+            finished = False
+            while not finished and not self._stop.is_set():
+                batch, finished = self._next_batch()
+                if not batch:
+                    continue
+                start_time = time.perf_counter()
+                results = self._detect_frames(batch)
+                self.inference_stats.record(
+                    time.perf_counter() - start_time, len(batch)
+                )
+                for item in zip(batch, results):
+                    if not self._put(self._render_queue, item):
+                        break
+        except Exception:
+            self._stop.set()
+            raise
+        finally:
+            self._put(self._render_queue, _END_OF_STREAM)
+            render_thread.join()
+            self._stop.set()
+            capture_thread.join()
+        self.report()
+        if self._errors:
+            raise self._errors[0]
+
+    def report(self):
+        """Log the time and queue depth of every stage"""
+        for stats in (self.capture_stats, self.inference_stats, self.render_stats):
+            logger(self.__class__.__name__).info(stats.summary())
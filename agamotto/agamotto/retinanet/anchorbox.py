@@ -22,6 +22,9 @@ case of RetinaNet, each location on a given feature map has nine anchor boxes
 (at three scales and three ratios).
 """
 
+import threading
+from collections import OrderedDict
+
 import tensorflow as tf
 
 
@@ -40,9 +43,14 @@ class AnchorBox:
         boxes for each feature map in the feature pyramid.
       strides: A list of float value representing the strides for each feature
         map in the feature pyramid.
+      cache_size: Maximum number of image shapes kept in the anchors cache,
+        the least recently used shape is evicted first. Zero disables it.
+        Only known shapes hit the cache, a graph traced with an unknown
+        image shape (the keras Model.predict path) builds the anchors in
+        the graph on every call.
     """
 
-    def __init__(self):
+    def __init__(self, cache_size=8):
         self.aspect_ratios = [0.5, 1.0, 2.0]
         self.scales = [2**x for x in [0, 1 / 3, 2 / 3]]
 
@@ -50,6 +58,9 @@ class AnchorBox:
         self._strides = [2**i for i in range(3, 8)]
         self._areas = [x**2 for x in [32.0, 64.0, 128.0, 256.0, 512.0]]
         self._anchor_dims = self._compute_dims()
+        self._cache_size = cache_size
+        self._anchors_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
 
     def _compute_dims(self):
         """Computes anchor box dimensions for all ratios and scales at all levels
@@ -95,6 +106,10 @@ class AnchorBox:
 
     def get_anchors(self, image_height, image_width):
         """Generates anchor boxes for all the feature maps of the feature pyramid.
+        When the image shape is known (python numbers, eager tensors or static
+        shapes inside a graph) the anchors are served from a per-shape LRU
+        cache, a fixed camera always produces the same padded shape so the
+        anchors are only built once.
         Arguments:
           image_height: Height of the input image.
           image_width: Width of the input image.
@@ -102,6 +117,61 @@ class AnchorBox:
           anchor boxes for all the feature maps, stacked as a single tensor
             with shape `(total_anchors, 4)`
         """
+        height = tf.get_static_value(image_height)
+        width = tf.get_static_value(image_width)
+        if self._cache_size <= 0 or height is None or width is None:
+            return self._generate_anchors(image_height, image_width)
+
+        key = (int(height), int(width))
+        with self._cache_lock:
+            anchors = self._anchors_cache.get(key)
+            if anchors is not None:
+                self._anchors_cache.move_to_end(key)
+                return anchors
+        # init_scope keeps the cached tensor eager even while tracing a graph
+        with tf.init_scope():
+            anchors = self._generate_anchors(
+                tf.constant(key[0], dtype=tf.float32),
+                tf.constant(key[1], dtype=tf.float32),
+            )
+        with self._cache_lock:
+            self._anchors_cache[key] = anchors
+            self._anchors_cache.move_to_end(key)
+            while len(self._anchors_cache) > self._cache_size:
+                self._anchors_cache.popitem(last=False)
+        return anchors
+
+    def get_level_sizes(self, image_height, image_width):
+        """Number of anchors of every pyramid level, in the get_anchors order
+        Arguments:
+          image_height: Height of the input image.
+          image_width: Width of the input image.
+        Returns:
+          A list with the number of anchors of the levels 3 to 7
+        """
+        return [
+            tf.cast(
+                tf.math.ceil(image_height / stride)
+                * tf.math.ceil(image_width / stride)
+                * self._num_anchors,
+                dtype=tf.int32,
+            )
+            for stride in self._strides
+        ]
+
+    def clear_cache(self):
+        """Drops every cached anchors tensor"""
+        with self._cache_lock:
+            self._anchors_cache.clear()
+
+    def _generate_anchors(self, image_height, image_width):
+        """Builds the anchor boxes of every pyramid level without the cache
+        Arguments:
+          image_height: Height of the input image.
+          image_width: Width of the input image.
+        Returns:
+          anchor boxes with shape `(total_anchors, 4)`
+        """
         anchors = [
             self._get_anchors(
                 tf.math.ceil(image_height / 2**i),
@@ -18,10 +18,17 @@
 ## Implementing a custom layer to decode predictions
 """
 
+from collections import namedtuple
+
 import tensorflow as tf
 from .anchorbox import AnchorBox
 from .preprocess import convert_to_corners
 
+Detections = namedtuple(
+    "Detections",
+    ["nmsed_boxes", "nmsed_scores", "nmsed_classes", "valid_detections"],
+)
+
 
 class DecodePredictions(tf.keras.layers.Layer):
     """A Keras layer that decodes predictions of the RetinaNet model.
@@ -36,6 +43,13 @@ class DecodePredictions(tf.keras.layers.Layer):
         classes.
       box_variance: The scaling factors used to scale the bounding box
         predictions.
+      anchor_cache_size: Number of image shapes kept in the AnchorBox cache.
+      decode_mode: `combined` runs combined_non_max_suppression over every
+        anchor. `fast` first drops the anchors below the confidence threshold
+        and keeps the `pre_nms_top_k` best anchors of each pyramid level, only
+        those boxes are decoded, then a plain non_max_suppression runs when
+        there is a single class (combined_non_max_suppression otherwise).
+      pre_nms_top_k: Anchors kept per pyramid level in the `fast` mode.
     """
 
     def __init__(
@@ -46,7 +60,10 @@ class DecodePredictions(tf.keras.layers.Layer):
         max_detections_per_class=100,
         max_detections=100,
         # box_variance=[0.1, 0.1, 0.2, 0.2],
-        **kwargs
+        anchor_cache_size=8,
+        decode_mode="combined",
+        pre_nms_top_k=1000,
+        **kwargs,
     ):
         super(DecodePredictions, self).__init__(**kwargs)
         self.num_classes = num_classes
@@ -54,8 +71,12 @@ class DecodePredictions(tf.keras.layers.Layer):
         self.nms_iou_threshold = nms_iou_threshold
         self.max_detections_per_class = max_detections_per_class
         self.max_detections = max_detections
+        if decode_mode not in ("combined", "fast"):
+            raise ValueError(f"Unknown decode mode {decode_mode}")
+        self.decode_mode = decode_mode
+        self.pre_nms_top_k = pre_nms_top_k
 
-        self._anchor_box = AnchorBox()
+        self._anchor_box = AnchorBox(cache_size=anchor_cache_size)
         self._box_variance = tf.convert_to_tensor(
             [0.1, 0.1, 0.2, 0.2], dtype=tf.float32
         )
@@ -81,28 +102,164 @@ class DecodePredictions(tf.keras.layers.Layer):
         boxes_transformed = convert_to_corners(boxes)
         return boxes_transformed
 
-    def call(self, images, predictions):
+    def get_anchors(self, image_height, image_width):
+        """Anchor boxes for a padded image shape, served from the AnchorBox cache
+
+        Args:
+            image_height (int): Height of the padded input image
+            image_width (int): Width of the padded input image
+
+        Returns:
+            tf.Tensor: Anchor boxes with shape `(total_anchors, 4)`
+        """
+        return self._anchor_box.get_anchors(image_height, image_width)
+
+    def call(self, images, predictions, anchor_boxes=None):
         """Call method from Keras, it actually use box_predictions to insert into layer
 
         Args:
-            images (#TODO): _description_
-            predictions (#TODO): _description_
+            images (tf.Tensor): Batch of images given to the model
+            predictions (tf.Tensor): Raw RetinaNet outputs for the batch
+            anchor_boxes (tf.Tensor, optional): Precomputed anchors for the
+                images shape, when None they come from get_anchors, which
+                only uses the cache when the shape of images is static
+                (CompiledInference, TFLite and SavedModel pass the cached
+                anchors, the keras functional model does not)
 
         Returns:
-            #TODO: _description_
+            Detections namedtuple, same fields as combined_non_max_suppression
         """
-        image_shape = tf.cast(tf.shape(images), dtype=tf.float32)
-        anchor_boxes = self._anchor_box.get_anchors(image_shape[1], image_shape[2])
+        if anchor_boxes is None:
+            height, width = images.shape[1], images.shape[2]
+            if height is None or width is None:
+                image_shape = tf.cast(tf.shape(images), dtype=tf.float32)
+                height, width = image_shape[1], image_shape[2]
+            anchor_boxes = self.get_anchors(height, width)
+        if self.decode_mode == "fast":
+            return self._fast_decode(images, predictions, anchor_boxes)
         box_predictions = predictions[:, :, :4]
         cls_predictions = tf.nn.sigmoid(predictions[:, :, 4:])
         boxes = self._decode_box_predictions(anchor_boxes[None, ...], box_predictions)
 
-        return tf.image.combined_non_max_suppression(
-            tf.expand_dims(boxes, axis=2),
-            cls_predictions,
-            self.max_detections_per_class,
+        return Detections(
+            *tf.image.combined_non_max_suppression(
+                tf.expand_dims(boxes, axis=2),
+                cls_predictions,
+                self.max_detections_per_class,
+                self.max_detections,
+                self.nms_iou_threshold,
+                self.confidence_threshold,
+                clip_boxes=False,
+            )
+        )
+
+    def _preselect(self, images, predictions):
+        """Confidence threshold and per-level top-k on the raw class logits
+
+        The sigmoid is monotonic, so the threshold and the ranking run on the
+        logits and nothing is decoded for the discarded anchors.
+
+        Args:
+            images (tf.Tensor): Batch of images given to the model
+            predictions (tf.Tensor): Raw RetinaNet outputs for the batch
+
+        Returns:
+            tf.Tensor: `(batch, k)` indices of the kept anchors
+        """
+        image_shape = tf.cast(tf.shape(images), dtype=tf.float32)
+        level_sizes = self._anchor_box.get_level_sizes(image_shape[1], image_shape[2])
+        threshold_logit = tf.math.log(
+            self.confidence_threshold / (1.0 - self.confidence_threshold)
+        )
+        max_logits = tf.reduce_max(predictions[:, :, 4:], axis=-1)
+        max_logits = tf.where(max_logits >= threshold_logit, max_logits, tf.float32.min)
+        indices = []
+        start = 0
+        for level_size in level_sizes:
+            level_logits = max_logits[:, start : start + level_size]
+            _, level_indices = tf.math.top_k(
+                level_logits, k=tf.minimum(self.pre_nms_top_k, level_size)
+            )
+            indices.append(level_indices + start)
+            start += level_size
+        return tf.concat(indices, axis=1)
+
+    def _single_class_nms(self, boxes_and_scores):
+        """NMS of one image, indices padded with zeros to max_detections
+
+        Args:
+            boxes_and_scores (Tuple[tf.Tensor, tf.Tensor]): `(N, 4)` boxes and
+                `(N,)` scores of the image
+
+        Returns:
+            Tuple[tf.Tensor, tf.Tensor]: `(max_detections,)` indices and the
+            number of valid ones
+        """
+        boxes, scores = boxes_and_scores
+        indices = tf.image.non_max_suppression(
+            boxes,
+            scores,
             self.max_detections,
-            self.nms_iou_threshold,
-            self.confidence_threshold,
-            clip_boxes=False,
+            iou_threshold=self.nms_iou_threshold,
+            score_threshold=self.confidence_threshold,
+        )
+        valid_detections = tf.shape(indices)[0]
+        indices = tf.pad(indices, [[0, self.max_detections - valid_detections]])
+        return indices, valid_detections
+
+    def _fast_decode(self, images, predictions, anchor_boxes):
+        """Pre-selection, decoding of the kept anchors and NMS
+
+        Args:
+            images (tf.Tensor): Batch of images given to the model
+            predictions (tf.Tensor): Raw RetinaNet outputs for the batch
+            anchor_boxes (tf.Tensor): Anchors for the images shape
+
+        Returns:
+            Detections namedtuple, same fields as combined_non_max_suppression
+        """
+        indices = self._preselect(images, predictions)
+        selected = tf.gather(predictions, indices, batch_dims=1)
+        boxes = self._decode_box_predictions(
+            tf.gather(anchor_boxes, indices), selected[:, :, :4]
+        )
+        scores = tf.nn.sigmoid(selected[:, :, 4:])
+        num_classes = predictions.shape[-1] - 4 if predictions.shape[-1] else None
+        if (num_classes or self.num_classes) != 1:
+            return Detections(
+                *tf.image.combined_non_max_suppression(
+                    tf.expand_dims(boxes, axis=2),
+                    scores,
+                    self.max_detections_per_class,
+                    self.max_detections,
+                    self.nms_iou_threshold,
+                    self.confidence_threshold,
+                    clip_boxes=False,
+                )
+            )
+
+        scores = scores[:, :, 0]
+        # Per image NMS kernel, it drops the boxes below the threshold first,
+        # the tiled non_max_suppression_padded goes through every preselected
+        # box when there are fewer detections than max_detections
+        nms_indices, valid_detections = tf.map_fn(
+            self._single_class_nms,
+            (boxes, scores),
+            fn_output_signature=(
+                tf.TensorSpec([self.max_detections], dtype=tf.int32),
+                tf.TensorSpec([], dtype=tf.int32),
+            ),
+        )
+        valid_mask = tf.range(self.max_detections)[None, :] < valid_detections[:, None]
+        nmsed_boxes = tf.where(
+            valid_mask[:, :, None], tf.gather(boxes, nms_indices, batch_dims=1), 0.0
+        )
+        nmsed_scores = tf.where(
+            valid_mask, tf.gather(scores, nms_indices, batch_dims=1), 0.0
+        )
+        return Detections(
+            nmsed_boxes=nmsed_boxes,
+            nmsed_scores=nmsed_scores,
+            nmsed_classes=tf.zeros_like(nmsed_scores),
+            valid_detections=tf.cast(valid_detections, dtype=tf.int32),
         )
@@ -123,10 +123,19 @@ class LabelEncoder:
         """Creates box and classification targets for a batch"""
         images_shape = tf.shape(batch_images)
         batch_size = images_shape[0]
+        # Static height and width (when known) let the anchors come from the cache
+        anchors_shape = [
+            (
+                batch_images.shape[i]
+                if batch_images.shape[i] is not None
+                else images_shape[i]
+            )
+            for i in range(3)
+        ]
 
         labels = tf.TensorArray(dtype=tf.float32, size=batch_size, dynamic_size=True)
         for i in range(batch_size):
-            label = self._encode_sample(images_shape, gt_boxes[i], cls_ids[i])
+            label = self._encode_sample(anchors_shape, gt_boxes[i], cls_ids[i])
             labels = labels.write(i, label)
         batch_images = tf.keras.applications.resnet.preprocess_input(batch_images)
         return batch_images, labels.stack()
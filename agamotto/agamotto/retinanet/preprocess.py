@@ -120,20 +120,70 @@ def preprocess_data(sample):
     return image, bbox, class_id
 
 
-def prepare_image(image):
+def prepare_image(image, min_side=800.0, max_side=1333.0):
     """Prepare image is a helper function that resize image and convert it to resnet preprocess
 
     Args:
-        image (#TODO): _description_
+        image (tf.Tensor): 3-D float tensor `(height, width, 3)`
+        min_side (float): Shorter side after resizing (see resize_and_pad_image)
+        max_side (float): Upper bound of the longer side after resizing
 
     Returns:
-        #TODO: _description_
+        image: A 4-D tensor `(1, height, width, 3)` ready for inference
+        ratio: The scaling factor used to resize the image
     """
-    image, _, ratio = resize_and_pad_image(image, jitter=None)
+    image, _, ratio = resize_and_pad_image(
+        image, min_side=min_side, max_side=max_side, jitter=None
+    )
     image = tf.keras.applications.resnet.preprocess_input(image)
     return tf.expand_dims(image, axis=0), ratio
 
 
+def prepare_image_batch(images, min_side=800.0, max_side=1333.0, ratios=None):
+    """Prepares a list of frames as a single padded batch for inference
+
+    Every frame is resized and padded with `resize_and_pad_image`, then all of
+    them are padded on the right and bottom to the largest height and width of
+    the batch, so they can go through the model in one forward pass. Padding
+    at the right and bottom keeps the boxes in the same coordinates, so each
+    frame can still be mapped back to its own size with its own ratio.
+
+    Args:
+        images (List[tf.Tensor]): List of 3-D float tensors `(height, width, 3)`
+        min_side (float): Shorter side after resizing (see resize_and_pad_image)
+        max_side (float): Upper bound of the longer side after resizing
+        ratios (List[float | None], optional): Scaling factor of each image,
+            None entries use min_side and max_side
+
+    Returns:
+        batch: A 4-D tensor `(len(images), height, width, 3)` ready for inference
+        ratios: List with the scaling factor used to resize each image
+    """
+    resized_images = []
+    image_ratios = []
+    for image, ratio in zip(images, ratios or [None] * len(images)):
+        image_min_side, image_max_side = min_side, max_side
+        if ratio is not None:
+            image_min_side = float(ratio) * float(min(image.shape[:2]))
+            image_max_side = float("inf")
+        resized_image, _, ratio = resize_and_pad_image(
+            image, min_side=image_min_side, max_side=image_max_side, jitter=None
+        )
+        resized_images.append(resized_image)
+        image_ratios.append(ratio)
+    max_height = max(int(image.shape[0]) for image in resized_images)
+    max_width = max(int(image.shape[1]) for image in resized_images)
+    batch = tf.stack(
+        [
+            tf.image.pad_to_bounding_box(image, 0, 0, max_height, max_width)
+            for image in resized_images
+        ],
+        axis=0,
+    )
+    batch = tf.keras.applications.resnet.preprocess_input(batch)
+    return batch, image_ratios
+
+
 def swap_xy(boxes):
     """Swaps order the of x and y coordinates of the boxes.
     Arguments:
@@ -239,15 +239,18 @@ class FeaturePyramid(keras.layers.Layer):
         return p3_output, p4_output, p5_output, p6_output, p7_output
 
 
-def get_backbone():
+def get_backbone(weights="imagenet"):
     """Builds ResNet50 with pre-trained imagenet weights
     Building the ResNet50 backbone
     RetinaNet uses a ResNet based backbone, using which a feature pyramid network
     is constructed. In the example we use ResNet50 as the backbone, and return the
     feature maps at strides 8, 16 and 32.
+    Arguments:
+      weights: `imagenet` downloads the pre-trained weights, None keeps the
+        random initialisation (benchmarks without network access).
     """
     backbone = keras.applications.ResNet50(
-        include_top=False, input_shape=[None, None, 3]
+        include_top=False, input_shape=[None, None, 3], weights=weights
     )
     c3_output, c4_output, c5_output = [
         backbone.get_layer(layer_name).output
@@ -0,0 +1,165 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Region of interest of a camera, the frame is cropped to it before the
+inference and the detections outside of it are dropped
+"""
+
+import cv2
+import numpy as np
+
+from utils.logger import logger
+from .retinanet.decodepredictions import Detections
+
+
+class RegionOfInterest:
+    """Polygon or rectangle of the frame where people are counted
+
+    The inference only sees the bounding box of the region, the boxes are
+    mapped back to frame coordinates and a box is kept when its centre is
+    inside the polygon. A region outside of the frames of a camera is ignored
+    (see for_frame) so a bad value never stops the run.
+
+    Attributes:
+        polygon: `(N, 2)` int32 points `[x, y]` in frame coordinates
+        bounds: `(x1, y1, x2, y2)` bounding box of the polygon
+    """
+
+    def __init__(self, points):
+        points = np.asarray(points, dtype=np.int32).reshape(-1, 2)
+        if len(points) == 2:
+            (x1, y1), (x2, y2) = points.min(axis=0), points.max(axis=0)
+            points = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.int32)
+        if len(points) < 3:
+            raise ValueError(
+                "A region of interest needs two corners of a rectangle or at "
+                f"least three polygon points, got {len(points)}"
+            )
+        self.polygon = points
+        x1, y1 = points.min(axis=0)
+        x2, y2 = points.max(axis=0)
+        self.bounds = (int(x1), int(y1), int(x2), int(y2))
+        self._checked_size = None
+        self._inside_frame = True
+
+    @classmethod
+    def from_location(cls, location):
+        """Region of interest of a location section
+
+        Args:
+            location (Dict): location section of agamotto.yaml
+
+        Returns:
+            RegionOfInterest | None: None when the location has no roi
+        """
+        points = location.get("roi")
+        return cls(points) if points else None
+
+    def intersects(self, frame_shape):
+        """True when the region covers at least one pixel of the frame"""
+        height, width = frame_shape[:2]
+        x1, y1, x2, y2 = self.bounds
+        return x2 >= 0 and y2 >= 0 and x1 < width and y1 < height
+
+    def for_frame(self, frame_shape):
+        """This region if it intersects the frames of a camera, None otherwise
+
+        The check runs once per frame size, a region outside of the frame logs
+        a warning and the whole frame is used instead.
+
+        Args:
+            frame_shape (Tuple): Shape of the frames of the camera
+
+        Returns:
+            RegionOfInterest | None: None to use the whole frame
+        """
+        frame_size = tuple(frame_shape[:2])
+        if frame_size != self._checked_size:
+            self._checked_size = frame_size
+            self._inside_frame = self.intersects(frame_shape)
+            if not self._inside_frame:
+                logger(self.__class__.__name__).warning(
+                    f"Region of interest {self.bounds} is outside of the "
+                    f"{frame_size[1]}x{frame_size[0]} frame, using the whole frame"
+                )
+        return self if self._inside_frame else None
+
+    def _clipped_bounds(self, frame_shape):
+        """Bounds clipped to the frame, at least one pixel wide and high
+
+        Raises:
+            ValueError: If the region does not intersect the frame
+        """
+        height, width = frame_shape[:2]
+        x1, y1, x2, y2 = self.bounds
+        if not self.intersects(frame_shape):
+            raise ValueError(
+                f"Region of interest {self.bounds} is outside of the "
+                f"{width}x{height} frame"
+            )
+        x1, y1 = max(x1, 0), max(y1, 0)
+        return (x1, y1, min(max(x2, x1 + 1), width), min(max(y2, y1 + 1), height))
+
+    def crop(self, frame):
+        """View of the frame inside the bounding box of the region
+
+        Args:
+            frame (numpy.ndarray): Frame `(height, width, 3)`
+
+        Returns:
+            numpy.ndarray: Cropped view (no copy)
+        """
+        x1, y1, x2, y2 = self._clipped_bounds(frame.shape)
+        return frame[y1:y2, x1:x2]
+
+    def to_frame(self, frame_detections, frame_shape):
+        """Map the detections of a crop to frame coordinates
+
+        Args:
+            frame_detections (Tuple): (detections, ratio, num_detections) of
+                the cropped frame
+            frame_shape (Tuple): Shape of the full frame
+
+        Returns:
+            Tuple: (detections, 1.0, num_detections) with the boxes in frame
+            coordinates and only the detections inside the polygon
+        """
+        detections, ratio, num_detections = frame_detections
+        num_detections = int(num_detections)
+        x1, y1, _, _ = self._clipped_bounds(frame_shape)
+        boxes = np.asarray(detections.nmsed_boxes[0][:num_detections], np.float32)
+        boxes = boxes / np.float32(ratio) + np.array([x1, y1, x1, y1], np.float32)
+        centres = (boxes[:, :2] + boxes[:, 2:]) / 2.0
+        contour = self.polygon.reshape(-1, 1, 2).astype(np.float32)
+        inside = np.array(
+            [
+                cv2.pointPolygonTest(contour, (float(x), float(y)), False) >= 0
+                for x, y in centres
+            ],
+            dtype=bool,
+        ).reshape(-1)
+        num_inside = int(np.count_nonzero(inside))
+        detections = Detections(
+            nmsed_boxes=boxes[inside][None, ...],
+            nmsed_scores=np.asarray(
+                detections.nmsed_scores[0][:num_detections], np.float32
+            )[inside][None, ...],
+            nmsed_classes=np.asarray(
+                detections.nmsed_classes[0][:num_detections], np.float32
+            )[inside][None, ...],
+            valid_detections=np.array([num_inside], dtype=np.int32),
+        )
+        return detections, 1.0, num_inside
@@ -0,0 +1,101 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Frame sampler for video files, it reads the real frame rate from the container
+and moves between samples with grab()/retrieve() or with a seek
+"""
+
+import math
+from collections import namedtuple
+
+import cv2
+
+from utils.logger import logger
+
+SampledFrame = namedtuple("SampledFrame", ["index", "timestamp", "image"])
+SampledFrame.__doc__ = """A sampled frame
+
+Attributes:
+    index: Frame number inside the video
+    timestamp: Presentation timestamp in seconds from the start of the video
+    image: Decoded BGR frame
+"""
+
+
+class FrameSampler:
+    """Iterates over a video keeping one frame every `interval` seconds
+
+    The stride in frames comes from the FPS stored in the container. For
+    strides up to `seek_threshold` frames the sampler moves forward with
+    `grab()`, which skips the color conversion and copy of the frames it does
+    not need, and only calls `retrieve()` on the sampled one. Longer strides
+    use a seek, which pays a keyframe decode but skips whole GOPs.
+
+    Attributes:
+        player: Opened cv2.VideoCapture
+        interval: Seconds between two sampled frames
+        seek_threshold: Largest stride (in frames) that still uses grab()
+        default_fps: FPS used when the container does not report one
+    """
+
+    def __init__(self, player, interval, seek_threshold=250, default_fps=30.0):
+        self._player = player
+        fps = player.get(cv2.CAP_PROP_FPS)
+        if not fps or math.isnan(fps) or fps <= 0:
+            logger(self.__class__.__name__).warning(
+                f"Video has no FPS information, assuming {default_fps}"
+            )
+            fps = default_fps
+        self.fps = fps
+        self.stride = max(1, int(round(interval * fps)))
+        self.use_seek = self.stride > seek_threshold
+        logger(self.__class__.__name__).info(
+            f"Sampling every {self.stride} frames at {self.fps:.2f} fps using "
+            f"{'seek' if self.use_seek else 'grab'}"
+        )
+
+    def _skip(self, next_index, current_index):
+        """Move the player to next_index, returns False at the end of the video"""
+        if self.use_seek:
+            return self._player.set(cv2.CAP_PROP_POS_FRAMES, next_index)
+        for _ in range(next_index - current_index - 1):
+            if not self._player.grab():
+                return False
+        return True
+
+    def _timestamp(self, index):
+        """Presentation timestamp of the last grabbed frame, in seconds"""
+        position = self._player.get(cv2.CAP_PROP_POS_MSEC)
+        if position is None or math.isnan(position) or (position <= 0 and index > 0):
+            return index / self.fps
+        return position / 1000.0
+
+    def __iter__(self):
+        index = 0
+        previous_index = -1
+        while self._player.isOpened():
+            if previous_index >= 0 and not self._skip(index, previous_index):
+                break
+            if not self._player.grab():
+                break
+            timestamp = self._timestamp(index)
+            ret, frame = self._player.retrieve()
+            if not ret:
+                break
+            yield SampledFrame(index=index, timestamp=timestamp, image=frame)
+            previous_index = index
+            index += self.stride
+        logger(self.__class__.__name__).info("Frame was not load correctly, exiting...")
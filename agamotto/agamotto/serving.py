@@ -0,0 +1,123 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Self-contained SavedModel artifact, the RetinaNet forward pass, the
+DecodePredictions layer and the label names in a single directory, so serving
+does not need the training code, the checkpoint or tensorflow_datasets
+"""
+
+import tensorflow as tf
+
+from utils.logger import logger
+from .retinanet.anchorbox import AnchorBox
+from .retinanet.decodepredictions import Detections
+
+_IMAGES_SPEC = tf.TensorSpec(shape=[None, None, None, 3], dtype=tf.float32)
+_PREDICTIONS_SPEC = tf.TensorSpec(shape=[None, None, None], dtype=tf.float32)
+_ANCHORS_SPEC = tf.TensorSpec(shape=[None, 4], dtype=tf.float32)
+
+
+class DetectionModule(tf.Module):
+    """tf.Module exported as the serving artifact
+
+    Attributes:
+        model: RetinaNet model with the loaded weights
+        decode_predictions: DecodePredictions layer used after the forward pass
+        labels: Label names, the position is the class id
+    """
+
+    def __init__(self, model, decode_predictions, labels):
+        super().__init__(name="agamotto")
+        self.model = model
+        self.decode_predictions = decode_predictions
+        self.labels = tf.Variable(labels, dtype=tf.string, trainable=False)
+
+    @tf.function(input_signature=[_IMAGES_SPEC])
+    def forward(self, images):
+        """RetinaNet forward pass"""
+        return self.model(images, training=False)
+
+    @tf.function(input_signature=[_IMAGES_SPEC, _PREDICTIONS_SPEC, _ANCHORS_SPEC])
+    def decode(self, images, predictions, anchor_boxes):
+        """DecodePredictions with precomputed anchors"""
+        return self.decode_predictions(
+            images, predictions, anchor_boxes=anchor_boxes
+        )._asdict()
+
+    @tf.function(input_signature=[_IMAGES_SPEC])
+    def serve(self, images):
+        """Forward pass and decoding, the default serving signature"""
+        return self.decode_predictions(
+            images, self.model(images, training=False)
+        )._asdict()
+
+
+def export_saved_model(model, decode_predictions, labels, export_dir):
+    """Write the serving artifact
+
+    Args:
+        model (RetinaNet): Model with the loaded weights
+        decode_predictions (DecodePredictions): Layer used after the forward pass
+        labels (List[str]): Label names, the position is the class id
+        export_dir (str): Directory of the SavedModel
+    """
+    module = DetectionModule(model, decode_predictions, labels)
+    tf.saved_model.save(
+        module, export_dir, signatures={"serving_default": module.serve}
+    )
+    logger("export_saved_model").info(
+        f"Saved model with labels {labels} to {export_dir}"
+    )
+
+
+class SavedModelInference:
+    """Runs the exported artifact, with the same output as CompiledInference
+
+    Attributes:
+        export_dir: Directory of the SavedModel
+        labels: Label names stored in the artifact
+    """
+
+    def __init__(self, export_dir):
+        self._module = tf.saved_model.load(export_dir)
+        self._anchor_box = AnchorBox()
+        self.labels = [label.decode("utf-8") for label in self._module.labels.numpy()]
+
+    def int2str(self, class_id):
+        """Label name of a class id"""
+        return self.labels[int(class_id)]
+
+    def __call__(self, images):
+        """Run the exported inference
+
+        Args:
+            images (tf.Tensor): A `(batch, height, width, 3)` or a single
+                `(height, width, 3)` float32 image already prepared
+
+        Returns:
+            Detections namedtuple with NumPy arrays, with the batch dimension
+        """
+        images = tf.convert_to_tensor(images, dtype=tf.float32)
+        if images.shape.rank == 3:
+            images = tf.expand_dims(images, axis=0)
+        anchor_boxes = self._anchor_box.get_anchors(
+            int(images.shape[1]), int(images.shape[2])
+        )
+        predictions = self._module.forward(images)
+        detections = self._module.decode(images, predictions, anchor_boxes)
+        return Detections(
+            **{field: detections[field].numpy() for field in Detections._fields}
+        )
@@ -0,0 +1,195 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+INT8 TFLite backend, post-training quantization of the RetinaNet forward pass
+calibrated on real frames and a runtime based on the TFLite interpreter
+"""
+
+import os
+
+import tensorflow as tf
+
+from utils.logger import logger
+from utils.metrics import timed_stage
+
+
+def labels_path(model_path):
+    """Path of the label names written next to a .tflite file"""
+    return f"{os.path.splitext(model_path)[0]}.labels"
+
+
+def read_labels(model_path):
+    """Read the label names written by export_tflite_model
+
+    Args:
+        model_path (str): Path of the .tflite file
+
+    Returns:
+        List[str] or None: Label names, the position is the class id, None
+        when the model was exported without them
+    """
+    if not os.path.exists(labels_path(model_path)):
+        return None
+    with open(labels_path(model_path), encoding="utf-8") as labels_file:
+        return labels_file.read().splitlines()
+
+
+def export_tflite_model(model, representative_images, output_path, labels=None):
+    """Convert the RetinaNet forward pass into an INT8 quantized TFLite model
+
+    The input shape of the TFLite model is the shape of the calibration
+    images (the padded shape of the camera), the interpreter is resized at
+    runtime if another shape shows up. Weights and activations are INT8, the
+    model keeps float32 input and output so it receives the same prepared
+    images as the float model.
+
+    Args:
+        model (RetinaNet): Model with the loaded weights
+        representative_images (List[tf.Tensor]): Prepared `(1, H, W, 3)`
+            frames used to calibrate the activation ranges
+        output_path (str): Where the .tflite file is written
+        labels (List[str]): Label names written next to the model, so the
+            tflite backend does not need tensorflow_datasets
+
+    Returns:
+        int: Size in bytes of the written model
+    """
+    input_shape = representative_images[0].shape
+    forward = tf.function(
+        lambda images: model(images, training=False),
+        input_signature=[tf.TensorSpec(shape=input_shape, dtype=tf.float32)],
+    )
+    concrete_function = forward.get_concrete_function()
+
+    def representative_dataset():
+        for image in representative_images:
+            yield [tf.cast(image, dtype=tf.float32)]
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions(
+        [concrete_function], model
+    )
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    tflite_model = converter.convert()
+    with open(output_path, "wb") as model_file:
+        model_file.write(tflite_model)
+    if labels is not None:
+        with open(labels_path(output_path), "w", encoding="utf-8") as labels_file:
+            labels_file.write("\n".join(labels))
+    logger("export_tflite_model").info(
+        f"Saved INT8 model calibrated on {len(representative_images)} frames "
+        f"to {output_path} ({len(tflite_model) / 2**20:.1f}MB)"
+    )
+    return len(tflite_model)
+
+
+class TFLiteInference:
+    """Runs the INT8 TFLite model followed by DecodePredictions
+
+    `combined_non_max_suppression` is not a TFLite builtin op, so the
+    interpreter returns the raw RetinaNet outputs and the decoding runs in
+    TensorFlow with the cached anchors, the output is the same as
+    CompiledInference.
+
+    Attributes:
+        model_path: Path of the .tflite file
+        decode_predictions: DecodePredictions layer used after the interpreter
+        num_threads: Number of threads used by the interpreter
+    """
+
+    def __init__(self, model_path, decode_predictions, num_threads=None):
+        self._interpreter = tf.lite.Interpreter(
+            model_path=model_path, num_threads=num_threads
+        )
+        self._interpreter.allocate_tensors()
+        self._input_details = self._interpreter.get_input_details()[0]
+        self._output_details = self._interpreter.get_output_details()[0]
+        self._decode_predictions = decode_predictions
+        self._decode = tf.function(
+            self._decode_pass,
+            input_signature=[
+                tf.TensorSpec(shape=[None, None, None, 3], dtype=tf.float32),
+                tf.TensorSpec(shape=[None, None, None], dtype=tf.float32),
+                tf.TensorSpec(shape=[None, 4], dtype=tf.float32),
+            ],
+        )
+        logger(self.__class__.__name__).info(
+            f"Loaded {model_path} with input {self._input_details['shape']} "
+            f"and {num_threads} threads"
+        )
+
+    def _decode_pass(self, images, predictions, anchor_boxes):
+        """DecodePredictions pass, traced by tf.function"""
+        return self._decode_predictions(images, predictions, anchor_boxes=anchor_boxes)
+
+    def _resize_input(self, shape):
+        """Resize the interpreter when a new input shape shows up"""
+        if list(self._input_details["shape"]) == list(shape):
+            return
+        logger(self.__class__.__name__).info(f"Resizing TFLite input to {shape}")
+        self._interpreter.resize_tensor_input(self._input_details["index"], shape)
+        self._interpreter.allocate_tensors()
+        self._input_details = self._interpreter.get_input_details()[0]
+        self._output_details = self._interpreter.get_output_details()[0]
+
+    def _quantize(self, images):
+        """Convert the input to the interpreter input type"""
+        if self._input_details["dtype"] == tf.float32.as_numpy_dtype:
+            return images
+        scale, zero_point = self._input_details["quantization"]
+        images = tf.round(images / scale + zero_point)
+        return tf.cast(images, dtype=self._input_details["dtype"]).numpy()
+
+    def _dequantize(self, predictions):
+        """Convert the interpreter output back to float32"""
+        if self._output_details["dtype"] == tf.float32.as_numpy_dtype:
+            return predictions
+        scale, zero_point = self._output_details["quantization"]
+        return (predictions.astype("float32") - zero_point) * scale
+
+    def __call__(self, images):
+        """Run the TFLite inference
+
+        Args:
+            images (tf.Tensor): A `(batch, height, width, 3)` or a single
+                `(height, width, 3)` float32 image already prepared
+
+        Returns:
+            Detections namedtuple with NumPy arrays, with the batch dimension
+        """
+        images = tf.convert_to_tensor(images, dtype=tf.float32)
+        if images.shape.rank == 3:
+            images = tf.expand_dims(images, axis=0)
+        self._resize_input(images.shape)
+        self._interpreter.set_tensor(
+            self._input_details["index"], self._quantize(images.numpy())
+        )
+        with timed_stage("forward"):
+            self._interpreter.invoke()
+            predictions = self._dequantize(
+                self._interpreter.get_tensor(self._output_details["index"])
+            )
+        with timed_stage("decode"):
+            anchor_boxes = self._decode_predictions.get_anchors(
+                int(images.shape[1]), int(images.shape[2])
+            )
+            detections = self._decode(
+                images,
+                tf.convert_to_tensor(predictions, dtype=tf.float32),
+                anchor_boxes,
+            )
+            return tf.nest.map_structure(lambda field: field.numpy(), detections)
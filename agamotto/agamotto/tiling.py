@@ -0,0 +1,221 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Tiled inference for high resolution cameras, the frame is split into
+overlapping tiles that go through the model as one batch and the detections
+are merged in frame coordinates
+"""
+
+import time
+
+import numpy as np
+
+from utils.logger import logger
+from .retinanet.decodepredictions import Detections
+
+
+def tile_grid(height, width, tile_size, overlap):
+    """Overlapping tiles covering a frame, the last row and column end at the border
+
+    Args:
+        height (int): Frame height
+        width (int): Frame width
+        tile_size (int): Side of a square tile in frame pixels
+        overlap (int): Pixels shared by two neighbour tiles
+
+    Returns:
+        List[Tuple[int, int, int, int]]: `(x1, y1, x2, y2)` of every tile
+    """
+    step = max(1, tile_size - overlap)
+
+    def starts(side):
+        last = max(side - tile_size, 0)
+        positions = list(range(0, last + 1, step))
+        if positions[-1] != last:
+            positions.append(last)
+        return positions
+
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def merge_detections(
+    boxes, scores, classes, iou_threshold=0.5, containment_threshold=0.8
+):
+    """Greedy NMS across tiles in frame coordinates
+
+    Besides the IoU, a box mostly contained in a better box is suppressed,
+    a person cut by a tile border gives a partial box whose IoU with the
+    full box of the neighbour tile can be low.
+
+    Args:
+        boxes (numpy.ndarray): `(N, 4)` boxes `[x1, y1, x2, y2]`
+        scores (numpy.ndarray): `(N,)` scores
+        classes (numpy.ndarray): `(N,)` class ids, only boxes of the same
+            class suppress each other
+        iou_threshold (float): IoU above which a box is suppressed
+        containment_threshold (float): Intersection over the smaller area
+            above which a box is suppressed
+
+    Returns:
+        numpy.ndarray: Positions of the kept boxes, best score first
+    """
+    areas = np.prod(np.clip(boxes[:, 2:] - boxes[:, :2], 0.0, None), axis=-1)
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    keep = []
+    for index in np.argsort(-scores):
+        if suppressed[index]:
+            continue
+        keep.append(index)
+        top_left = np.maximum(boxes[index, :2], boxes[:, :2])
+        bottom_right = np.minimum(boxes[index, 2:], boxes[:, 2:])
+        intersection = np.prod(np.clip(bottom_right - top_left, 0.0, None), axis=-1)
+        iou = intersection / np.maximum(areas[index] + areas - intersection, 1e-8)
+        containment = intersection / np.maximum(np.minimum(areas[index], areas), 1e-8)
+        suppressed |= (classes == classes[index]) & (
+            (iou > iou_threshold) | (containment > containment_threshold)
+        )
+    return np.array(keep, dtype=np.int64)
+
+
+class TiledDetector:
+    """Runs the detector over overlapping tiles of every frame
+
+    The tiles of a frame go through `detect_frames` as one batch, scaled by
+    `tile_scale` (1.0 keeps the camera resolution), so distant persons keep
+    enough pixels for the P3 level. The output has the same
+    (detections, ratio, num_detections) format as create_detections_batch,
+    with the boxes in frame coordinates and ratio 1.0.
+
+    Attributes:
+        detect_frames: Callable with the create_detections_batch signature
+        tile_size: Side of a square tile in frame pixels
+        overlap: Pixels shared by two neighbour tiles
+        tile_scale: Scaling factor of the tiles before the inference
+        iou_threshold: IoU of the cross-tile NMS
+        evaluate: If True, every frame also goes through the detector without
+            tiles to report the latency cost against the gain in detections
+    """
+
+    def __init__(
+        self,
+        detect_frames,
+        tile_size=1024,
+        overlap=128,
+        tile_scale=1.0,
+        iou_threshold=0.5,
+        evaluate=False,
+    ):
+        if overlap >= tile_size:
+            raise ValueError(
+                f"Tile overlap {overlap} must be smaller than the tile size {tile_size}"
+            )
+        self.detect_frames = detect_frames
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.tile_scale = tile_scale
+        self.iou_threshold = iou_threshold
+        self.evaluate = evaluate
+        self.frames = 0
+        self.tiles = 0
+        self.tiled_seconds = 0.0
+        self.tiled_detections = 0
+        self.full_seconds = 0.0
+        self.full_detections = 0
+
+    def _merge(self, tiles, tiles_detections):
+        """Map the tile detections to frame coordinates and merge them"""
+        boxes, scores, classes = [], [], []
+        for (x1, y1, _, _), (detections, ratio, num_detections) in zip(
+            tiles, tiles_detections
+        ):
+            num_detections = int(num_detections)
+            boxes.append(
+                np.asarray(detections.nmsed_boxes[0][:num_detections], np.float32)
+                / np.float32(ratio)
+                + np.array([x1, y1, x1, y1], dtype=np.float32)
+            )
+            scores.append(
+                np.asarray(detections.nmsed_scores[0][:num_detections], np.float32)
+            )
+            classes.append(
+                np.asarray(detections.nmsed_classes[0][:num_detections], np.float32)
+            )
+        boxes = np.concatenate(boxes).reshape(-1, 4)
+        scores = np.concatenate(scores)
+        classes = np.concatenate(classes)
+        keep = merge_detections(boxes, scores, classes, self.iou_threshold)
+        detections = Detections(
+            nmsed_boxes=boxes[keep][None, ...],
+            nmsed_scores=scores[keep][None, ...],
+            nmsed_classes=classes[keep][None, ...],
+            valid_detections=np.array([len(keep)], dtype=np.int32),
+        )
+        return detections, 1.0, len(keep)
+
+    def __call__(self, frames):
+        """Tiled detections of a list of frames
+
+        Args:
+            frames (List[numpy.ndarray]): Frames from read
+
+        Returns:
+            List[Tuple]: One (detections, 1.0, num_detections) per frame
+        """
+        batch_detections = []
+        for frame in frames:
+            start_time = time.perf_counter()
+            tiles = tile_grid(*frame.shape[:2], self.tile_size, self.overlap)
+            tiles_detections = self.detect_frames(
+                [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles],
+                [self.tile_scale] * len(tiles),
+            )
+            frame_detections = self._merge(tiles, tiles_detections)
+            self.tiled_seconds += time.perf_counter() - start_time
+            self.frames += 1
+            self.tiles += len(tiles)
+            self.tiled_detections += frame_detections[2]
+            if self.evaluate:
+                start_time = time.perf_counter()
+                ((_, _, num_detections),) = self.detect_frames([frame], None)
+                self.full_seconds += time.perf_counter() - start_time
+                self.full_detections += int(num_detections)
+            batch_detections.append(frame_detections)
+        return batch_detections
+
+    def report(self):
+        """Log the cost of the tiles and, with evaluate, the comparison"""
+        if not self.frames:
+            return
+        tiled_ms = 1000.0 * self.tiled_seconds / self.frames
+        logger(self.__class__.__name__).info(
+            f"Tiled inference: {self.tiles / self.frames:.1f} tiles/frame, "
+            f"{tiled_ms:.1f} ms/frame, "
+            f"{self.tiled_detections / self.frames:.2f} detections/frame"
+        )
+        if self.evaluate:
+            full_ms = 1000.0 * self.full_seconds / self.frames
+            gain = self.tiled_detections - self.full_detections
+            logger(self.__class__.__name__).info(
+                f"Full frame inference: {full_ms:.1f} ms/frame, "
+                f"{self.full_detections / self.frames:.2f} detections/frame, "
+                f"tiles cost {tiled_ms / max(full_ms, 1e-9):.2f}x the latency for "
+                f"{gain:+d} detections "
+                f"({100.0 * gain / max(self.full_detections, 1):+.1f}%)"
+            )
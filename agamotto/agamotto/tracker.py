@@ -0,0 +1,452 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Keyframe tracking, RetinaNet runs on every Nth sampled frame and the boxes are
+propagated to the frames in between by a lightweight tracker
+"""
+
+import cv2
+import numpy as np
+
+from utils.logger import logger
+from utils.metrics import record_frames_skipped
+from .retinanet.decodepredictions import Detections
+
+TRACKER_METHODS = ("kalman", "optical_flow")
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU of two sets of `[x1, y1, x2, y2]` boxes
+
+    Args:
+        boxes_a (numpy.ndarray): `(N, 4)` boxes
+        boxes_b (numpy.ndarray): `(M, 4)` boxes
+
+    Returns:
+        numpy.ndarray: `(N, M)` IoU matrix
+    """
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0.0, None), axis=-1)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=-1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=-1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return intersection / np.maximum(union, 1e-8)
+
+
+def associate(track_boxes, detection_boxes, iou_threshold):
+    """Greedy IoU association, leftovers are matched by centroid distance
+
+    A leftover detection is matched to a leftover track when its centre is
+    closer than half of the track's diagonal.
+
+    Args:
+        track_boxes (numpy.ndarray): `(N, 4)` predicted track boxes
+        detection_boxes (numpy.ndarray): `(M, 4)` detected boxes
+        iou_threshold (float): Minimum IoU of an IoU match
+
+    Returns:
+        List[Tuple[int, int]]: Matched (track, detection) positions
+    """
+    matches = []
+    if not len(track_boxes) or not len(detection_boxes):
+        return matches
+    iou = box_iou(track_boxes, detection_boxes)
+    matched_tracks = set()
+    matched_detections = set()
+    for track, detection in zip(
+        *np.unravel_index(np.argsort(-iou, axis=None), iou.shape)
+    ):
+        if iou[track, detection] < iou_threshold:
+            break
+        if track in matched_tracks or detection in matched_detections:
+            continue
+        matches.append((int(track), int(detection)))
+        matched_tracks.add(track)
+        matched_detections.add(detection)
+    track_centres = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2.0
+    detection_centres = (detection_boxes[:, :2] + detection_boxes[:, 2:]) / 2.0
+    for track in range(len(track_boxes)):
+        if track in matched_tracks:
+            continue
+        diagonal = np.linalg.norm(track_boxes[track, 2:] - track_boxes[track, :2])
+        distances = np.linalg.norm(detection_centres - track_centres[track], axis=-1)
+        for detection in np.argsort(distances):
+            if distances[detection] >= diagonal / 2.0:
+                break
+            if detection not in matched_detections:
+                matches.append((int(track), int(detection)))
+                matched_detections.add(detection)
+                break
+    return matches
+
+
+class Track:
+    """A tracked box in frame coordinates
+
+    Attributes:
+        box: `[x1, y1, x2, y2]` float32 box
+        score: Score of the last detection
+        class_id: Class of the last detection
+        kalman: cv2.KalmanFilter with a constant velocity model of the centre,
+            only used by the kalman method
+    """
+
+    def __init__(self, box, score, class_id, use_kalman):
+        self.box = np.asarray(box, dtype=np.float32)
+        self.score = float(score)
+        self.class_id = float(class_id)
+        self.kalman = self._create_kalman() if use_kalman else None
+
+    def _create_kalman(self):
+        """State `(cx, cy, w, h, vx, vy)`, measurement `(cx, cy, w, h)`"""
+        kalman = cv2.KalmanFilter(6, 4)
+        kalman.transitionMatrix = np.eye(6, dtype=np.float32)
+        kalman.transitionMatrix[0, 4] = 1.0
+        kalman.transitionMatrix[1, 5] = 1.0
+        kalman.measurementMatrix = np.eye(4, 6, dtype=np.float32)
+        kalman.processNoiseCov = np.eye(6, dtype=np.float32) * 1e-2
+        kalman.measurementNoiseCov = np.eye(4, dtype=np.float32) * 1e-1
+        kalman.errorCovPost = np.eye(6, dtype=np.float32)
+        kalman.statePost = np.zeros((6, 1), dtype=np.float32)
+        kalman.statePost[:4, 0] = self._measurement()
+        return kalman
+
+    def _measurement(self):
+        """Box as `(cx, cy, w, h)`"""
+        centre = (self.box[:2] + self.box[2:]) / 2.0
+        return np.concatenate([centre, self.box[2:] - self.box[:2]])
+
+    def predict(self):
+        """Move the box one frame ahead with the Kalman filter"""
+        state = self.kalman.predict()[:4, 0]
+        self.box = np.concatenate(
+            [state[:2] - state[2:] / 2.0, state[:2] + state[2:] / 2.0]
+        ).astype(np.float32)
+
+    def correct(self, box, score, class_id):
+        """Update the track with its matched detection"""
+        self.box = np.asarray(box, dtype=np.float32)
+        self.score = float(score)
+        self.class_id = float(class_id)
+        if self.kalman is not None:
+            self.kalman.correct(self._measurement()[:, None])
+
+
+class BoxTracker:
+    """Propagates the detections of a keyframe to the following frames
+
+    Methods:
+        kalman: constant velocity Kalman filter of every box, the velocity is
+            learnt from the keyframes where the track is matched again
+        optical_flow: Lucas-Kanade flow of corner points inside every box,
+            the box is moved by the median displacement
+
+    Attributes:
+        method: One of TRACKER_METHODS
+        iou_threshold: Minimum IoU to match a track with a keyframe detection
+    """
+
+    def __init__(self, method="kalman", iou_threshold=0.3):
+        if method not in TRACKER_METHODS:
+            raise ValueError(
+                f"Unknown tracker method {method}, available: {TRACKER_METHODS}"
+            )
+        self.method = method
+        self.iou_threshold = iou_threshold
+        self.tracks = []
+        self._previous_gray = None
+
+    def _boxes(self):
+        """`(N, 4)` boxes of the tracks"""
+        return np.array([track.box for track in self.tracks], dtype=np.float32).reshape(
+            -1, 4
+        )
+
+    def _move(self, gray):
+        """Move every track to the frame given as gray"""
+        if self.method == "kalman":
+            for track in self.tracks:
+                track.predict()
+        elif self._previous_gray is not None:
+            self._flow_boxes(gray)
+        self._previous_gray = gray
+
+    def _box_points(self, box):
+        """Corner points of the previous frame inside a box, None without any"""
+        height, width = self._previous_gray.shape
+        x1, y1 = np.clip(box[:2].astype(np.int32), 0, [width - 1, height - 1])
+        x2, y2 = np.clip(box[2:].astype(np.int32), 0, [width, height])
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return None
+        # Only the box is searched, not the whole frame
+        points = cv2.goodFeaturesToTrack(
+            self._previous_gray[y1:y2, x1:x2],
+            maxCorners=20,
+            qualityLevel=0.01,
+            minDistance=3,
+        )
+        if points is None:
+            return None
+        return points + np.array([x1, y1], dtype=np.float32)
+
+    def _flow_boxes(self, gray):
+        """Shift every box by the median optical flow of the corners inside it
+
+        The points of all the boxes go through a single Lucas-Kanade call
+        """
+        points = [self._box_points(track.box) for track in self.tracks]
+        tracked_points = [
+            track_points for track_points in points if track_points is not None
+        ]
+        if not tracked_points:
+            return
+        all_points = np.concatenate(tracked_points)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(
+            self._previous_gray, gray, all_points, None
+        )
+        shifts = (moved - all_points)[:, 0]
+        tracked = status[:, 0] == 1
+        start = 0
+        for track, track_points in zip(self.tracks, points):
+            if track_points is None:
+                continue
+            end = start + len(track_points)
+            if np.any(tracked[start:end]):
+                shift = np.median(shifts[start:end][tracked[start:end]], axis=0)
+                track.box = track.box + np.tile(shift, 2).astype(np.float32)
+            start = end
+
+    def _clip(self, frame_shape):
+        """Clip the boxes to the frame, tracks that left it are dropped"""
+        height, width = frame_shape[:2]
+        for track in self.tracks:
+            track.box = np.clip(track.box, 0, [width, height, width, height]).astype(
+                np.float32
+            )
+        self.tracks = [
+            track
+            for track in self.tracks
+            if track.box[2] - track.box[0] > 1 and track.box[3] - track.box[1] > 1
+        ]
+
+    def update(self, frame, boxes, scores, classes):
+        """Match the keyframe detections with the tracks
+
+        Matched tracks are corrected, unmatched detections start new tracks
+        and tracks without a detection are dropped, the keyframe decides which
+        objects exist.
+
+        Args:
+            frame (numpy.ndarray): BGR keyframe
+            boxes (numpy.ndarray): `(N, 4)` detected boxes in frame coordinates
+            scores (numpy.ndarray): `(N,)` scores
+            classes (numpy.ndarray): `(N,)` class ids
+        """
+        self._move(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+        matches = associate(self._boxes(), boxes, self.iou_threshold)
+        tracks = []
+        matched_detections = set()
+        for track_position, detection in matches:
+            track = self.tracks[track_position]
+            track.correct(boxes[detection], scores[detection], classes[detection])
+            tracks.append(track)
+            matched_detections.add(detection)
+        for detection, box in enumerate(boxes):
+            if detection not in matched_detections:
+                tracks.append(
+                    Track(
+                        box,
+                        scores[detection],
+                        classes[detection],
+                        use_kalman=self.method == "kalman",
+                    )
+                )
+        self.tracks = tracks
+
+    def propagate(self, frame):
+        """Move the tracks to a frame without detections
+
+        Args:
+            frame (numpy.ndarray): BGR frame between two keyframes
+
+        Returns:
+            numpy.ndarray: `(N, 4)` tracked boxes in frame coordinates
+        """
+        self._move(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+        self._clip(frame.shape)
+        return self._boxes()
+
+    def as_detections(self, ratio):
+        """Tracks as a Detections batch of 1, boxes scaled by the frame ratio"""
+        num_tracks = len(self.tracks)
+        return Detections(
+            nmsed_boxes=(self._boxes() * np.float32(ratio))[None, ...],
+            nmsed_scores=np.array(
+                [[track.score for track in self.tracks]], dtype=np.float32
+            ).reshape(1, num_tracks),
+            nmsed_classes=np.array(
+                [[track.class_id for track in self.tracks]], dtype=np.float32
+            ).reshape(1, num_tracks),
+            valid_detections=np.array([num_tracks], dtype=np.int32),
+        )
+
+
+class DriftStats:
+    """Drift of the tracked boxes against the detector on the same frames
+
+    Attributes:
+        frames: Number of compared frames
+        mean_iou: Mean IoU of the matched tracked and detected boxes
+        mean_count_error: Mean absolute difference of the counts
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self._iou_sum = 0.0
+        self._matches = 0
+        self._count_error_sum = 0
+
+    def record(self, tracked_boxes, detected_boxes):
+        """Compare the tracked boxes of a frame with its detections"""
+        self.frames += 1
+        self._count_error_sum += abs(len(tracked_boxes) - len(detected_boxes))
+        if not len(tracked_boxes) or not len(detected_boxes):
+            return
+        iou = box_iou(tracked_boxes, detected_boxes)
+        for track, detection in associate(tracked_boxes, detected_boxes, 1e-6):
+            self._iou_sum += iou[track, detection]
+            self._matches += 1
+
+    @property
+    def mean_iou(self):
+        """Mean IoU of the matched boxes"""
+        return self._iou_sum / self._matches if self._matches else 0.0
+
+    @property
+    def mean_count_error(self):
+        """Mean absolute count difference"""
+        return self._count_error_sum / self.frames if self.frames else 0.0
+
+    def summary(self):
+        """Single line report of the drift"""
+        return (
+            f"Tracker drift over {self.frames} frames: mean IoU {self.mean_iou:.3f}, "
+            f"mean count error {self.mean_count_error:.2f}"
+        )
+
+
+class KeyframeTracker:
+    """Runs the detector on keyframes and the tracker on the other frames
+
+    Every `keyframe_interval`-th frame goes through `detect_frames`, the boxes
+    of the frames in between come from a BoxTracker. The output has the same
+    (detections, ratio, num_detections) format as create_detections_batch, so
+    the frames can be drawn and counted the same way.
+
+    Attributes:
+        detect_frames: Callable with the create_detections_batch signature
+        keyframe_interval: Detector runs once every this many frames
+        tracker: BoxTracker between keyframes
+        evaluate_drift: If True, the detector also runs on the tracked frames
+            to fill `drift` (the tracked boxes are still the output)
+        drift: DriftStats, only filled with evaluate_drift
+        keyframes: Number of frames that went through the detector as keyframes
+        tracked_frames: Number of frames that only went through the tracker
+    """
+
+    def __init__(
+        self,
+        detect_frames,
+        keyframe_interval=5,
+        method="kalman",
+        iou_threshold=0.3,
+        evaluate_drift=False,
+    ):
+        self.detect_frames = detect_frames
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.tracker = BoxTracker(method=method, iou_threshold=iou_threshold)
+        self.evaluate_drift = evaluate_drift
+        self.drift = DriftStats()
+        self.keyframes = 0
+        self.tracked_frames = 0
+        self._frame_index = 0
+        self._ratio = None
+
+    @staticmethod
+    def _frame_boxes(frame_detections):
+        """Boxes in frame coordinates, scores and classes of a detection"""
+        detections, ratio, num_detections = frame_detections
+        num_detections = int(num_detections)
+        boxes = np.asarray(detections.nmsed_boxes[0][:num_detections]) / np.float32(
+            ratio
+        )
+        scores = np.asarray(detections.nmsed_scores[0][:num_detections])
+        classes = np.asarray(detections.nmsed_classes[0][:num_detections])
+        return boxes.reshape(-1, 4), scores, classes
+
+    def __call__(self, frames):
+        """Detections of a batch of consecutive frames
+
+        Args:
+            frames (List[numpy.ndarray]): Consecutive BGR frames
+
+        Returns:
+            List[Tuple]: One (detections, ratio, num_detections) per frame
+        """
+        is_keyframe = []
+        for _ in frames:
+            is_keyframe.append(self._frame_index % self.keyframe_interval == 0)
+            self._frame_index += 1
+        detected = [
+            frame
+            for frame, keyframe in zip(frames, is_keyframe)
+            if keyframe or self.evaluate_drift
+        ]
+        detections = iter(self.detect_frames(detected) if detected else [])
+        batch_detections = []
+        for frame, keyframe in zip(frames, is_keyframe):
+            frame_detections = (
+                next(detections) if keyframe or self.evaluate_drift else None
+            )
+            if keyframe:
+                self._ratio = frame_detections[1]
+                self.tracker.update(frame, *self._frame_boxes(frame_detections))
+                self.keyframes += 1
+                batch_detections.append(frame_detections)
+                continue
+            tracked_boxes = self.tracker.propagate(frame)
+            if frame_detections is not None:
+                self.drift.record(tracked_boxes, self._frame_boxes(frame_detections)[0])
+            self.tracked_frames += 1
+            record_frames_skipped("tracker")
+            batch_detections.append(
+                (
+                    self.tracker.as_detections(self._ratio),
+                    self._ratio,
+                    len(self.tracker.tracks),
+                )
+            )
+        return batch_detections
+
+    def report(self):
+        """Log the keyframe and drift statistics"""
+        logger(self.__class__.__name__).info(
+            f"Detector ran on {self.keyframes} keyframes, tracker "
+            f"({self.tracker.method}) on {self.tracked_frames} frames"
+        )
+        if self.evaluate_drift:
+            logger(self.__class__.__name__).info(self.drift.summary())
@@ -0,0 +1,190 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Self-tuning benchmark, sweeps the inference batch size and the TensorFlow
+intra/inter-op threads on this machine and writes the fastest configuration
+to model.tuning_file (agamotto_tuning.yaml when it is not set), Agamotto
+applies it at startup once model.tuning_file points to it
+
+The model has random weights and the frames are synthetic, no network access
+is needed. TensorFlow threads can only be set once per process, so every
+thread setting runs in its own worker process.
+
+Usage (from the agamotto folder):
+    python bench.py
+    python bench.py --batch-sizes 1 2 4 --intra-op 4 8 --inter-op 1 2
+"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+
+from utils.read_from_yaml import read_from_yaml
+from utils.tuning import write_tuning
+
+DEFAULT_TUNING_FILE = "agamotto_tuning.yaml"
+
+
+def default_intra_op_threads():
+    """0 (TensorFlow default), the powers of two below the CPU count and the CPU count"""
+    cpu_count = os.cpu_count() or 1
+    threads = {0, cpu_count}
+    power = 1
+    while power < cpu_count:
+        threads.add(power)
+        power *= 2
+    return sorted(threads)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Agamotto self-tuning benchmark")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument(
+        "--intra-op", type=int, nargs="+", default=default_intra_op_threads()
+    )
+    parser.add_argument("--inter-op", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument(
+        "--frame-size",
+        type=int,
+        nargs=2,
+        default=[1080, 1920],
+        metavar=("HEIGHT", "WIDTH"),
+        help="Size of the synthetic camera frames",
+    )
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument(
+        "--output",
+        help="Tuning file, defaults to model.tuning_file or agamotto_tuning.yaml",
+    )
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def run_worker(config, args):
+    """Time every batch size with a single thread setting, prints JSON results
+
+    Args:
+        config (Dict): Config read from agamotto.yaml
+        args (argparse.Namespace): Worker arguments, one intra and inter value
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+    import tensorflow as tf
+
+    intra_op, inter_op = args.intra_op[0], args.inter_op[0]
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+
+    from agamotto.frame_preprocessor import FramePreprocessor
+    from agamotto.inference import CompiledInference
+    from agamotto.retinanet.decodepredictions import DecodePredictions
+    from agamotto.retinanet.retinanet import RetinaNet, get_backbone
+    from benchmarks.timing import time_call
+
+    model_config = config["model"]
+    model = RetinaNet(model_config["num_classes"], get_backbone(weights=None))
+    inference = CompiledInference(
+        model,
+        DecodePredictions(
+            num_classes=model_config["num_classes"],
+            confidence_threshold=model_config["confidence_threshold"],
+            decode_mode=model_config["decode_mode"],
+            pre_nms_top_k=model_config["pre_nms_top_k"],
+        ),
+        jit_compile=model_config["jit_compile"],
+    )
+    profile = model_config["resolution_profiles"][model_config["resolution_profile"]]
+    frame_preprocessor = FramePreprocessor(profile["min_side"], profile["max_side"])
+    height, width = args.frame_size
+    frames = [
+        np.random.randint(0, 256, size=(height, width, 3), dtype=np.uint8)
+        for _ in range(max(args.batch_sizes))
+    ]
+
+    results = []
+    for batch_size in args.batch_sizes:
+        batch = frames[:batch_size]
+        timing = time_call(
+            lambda batch=batch: inference(frame_preprocessor.prepare_batch(batch)[0]),
+            iterations=args.iterations,
+            warmup=args.warmup,
+        )
+        results.append(
+            {
+                "inference_batch_size": batch_size,
+                "intra_op_parallelism_threads": intra_op,
+                "inter_op_parallelism_threads": inter_op,
+                "median_batch_ms": timing["median_ms"],
+                "frames_per_second": 1000.0 * batch_size / timing["median_ms"],
+            }
+        )
+    print(json.dumps(results))
+
+
+def run_sweep(args):
+    """Run one worker process per thread setting
+
+    Args:
+        args (argparse.Namespace): Sweep arguments
+
+    Returns:
+        List[Dict]: Results of every batch size and thread setting
+    """
+    results = []
+    for intra_op, inter_op in itertools.product(args.intra_op, args.inter_op):
+        command = [sys.executable, os.path.abspath(__file__), "--worker"]
+        command += ["--intra-op", str(intra_op), "--inter-op", str(inter_op)]
+        command += ["--frame-size", *map(str, args.frame_size)]
+        command += ["--iterations", str(args.iterations), "--warmup", str(args.warmup)]
+        command += ["--batch-sizes", *map(str, args.batch_sizes)]
+        worker = subprocess.run(command, capture_output=True, text=True, check=True)
+        worker_results = json.loads(worker.stdout.strip().splitlines()[-1])
+        for result in worker_results:
+            print(
+                f"intra_op {intra_op:>3} inter_op {inter_op:>2} "
+                f"batch {result['inference_batch_size']:>2}: "
+                f"{result['median_batch_ms']:>9.1f} ms/batch "
+                f"{result['frames_per_second']:>7.2f} frames/sec"
+            )
+        results.extend(worker_results)
+    return results
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    config = read_from_yaml()
+
+    if args.worker:
+        run_worker(config, args)
+    else:
+        results = run_sweep(args)
+        best = max(results, key=lambda result: result["frames_per_second"])
+        output = args.output or config["model"]["tuning_file"] or DEFAULT_TUNING_FILE
+        write_tuning(
+            output,
+            dict(best, frame_size=list(args.frame_size), cpu_count=os.cpu_count()),
+        )
+        print(
+            f"Best: batch {best['inference_batch_size']}, "
+            f"intra_op {best['intra_op_parallelism_threads']}, "
+            f"inter_op {best['inter_op_parallelism_threads']} "
+            f"({best['frames_per_second']:.2f} frames/sec), written to {output}"
+        )
+        if output != config["model"]["tuning_file"]:
+            print(f"Set model.tuning_file to {output} in agamotto.yaml to apply it")
@@ -0,0 +1,82 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Micro-benchmark of the per-frame decode time with and without the anchors cache
+
+Usage (from the agamotto folder):
+    python -m benchmarks.anchor_cache --height 896 --width 1408
+"""
+
+import argparse
+
+import tensorflow as tf
+
+from agamotto.retinanet.decodepredictions import DecodePredictions
+from benchmarks.timing import time_call
+
+
+def total_anchors(height, width):
+    """Number of anchors for a padded image shape (9 anchors per location)"""
+    return sum(
+        9 * (-(-height // 2**level)) * (-(-width // 2**level)) for level in range(3, 8)
+    )
+
+
+def benchmark_decode(height, width, num_classes, iterations):
+    """Time DecodePredictions on synthetic predictions for a single frame
+
+    Args:
+        height (int): Padded image height
+        width (int): Padded image width
+        num_classes (int): Number of classes of the predictions
+        iterations (int): Number of timed calls
+
+    Returns:
+        Dict[str, Dict[str, float]]: Timings without and with the cache
+    """
+    images = tf.zeros([1, height, width, 3], dtype=tf.float32)
+    predictions = tf.random.normal([1, total_anchors(height, width), 4 + num_classes])
+    results = {}
+    for name, cache_size in [("without_cache", 0), ("with_cache", 8)]:
+        decode_predictions = DecodePredictions(
+            num_classes=num_classes, anchor_cache_size=cache_size
+        )
+        results[name] = time_call(
+            lambda layer=decode_predictions: layer(images, predictions),
+            iterations=iterations,
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--height", type=int, default=896)
+    parser.add_argument("--width", type=int, default=1408)
+    parser.add_argument("--num-classes", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    timings = benchmark_decode(
+        args.height, args.width, args.num_classes, args.iterations
+    )
+    print(f"Decode of {total_anchors(args.height, args.width)} anchors")
+    for name, timing in timings.items():
+        print(
+            f"{name:>14}: mean {timing['mean_ms']:.2f}ms "
+            f"median {timing['median_ms']:.2f}ms min {timing['min_ms']:.2f}ms"
+        )
+    speedup = timings["without_cache"]["mean_ms"] / timings["with_cache"]["mean_ms"]
+    print(f"Speedup: {speedup:.2f}x")
@@ -0,0 +1,98 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Benchmark of the decode stage on crowded frames, combined NMS over every
+anchor against the fast single-class path
+
+Usage (from the agamotto folder):
+    python -m benchmarks.decode_nms --persons 200
+"""
+
+import argparse
+
+import tensorflow as tf
+
+from agamotto.retinanet.decodepredictions import DecodePredictions
+from benchmarks.anchor_cache import total_anchors
+from benchmarks.timing import time_call
+
+
+def crowded_predictions(height, width, persons, anchors_per_person=20):
+    """Synthetic single-class predictions with many confident anchors
+
+    Args:
+        height (int): Padded image height
+        width (int): Padded image width
+        persons (int): Number of simulated persons
+        anchors_per_person (int): Confident anchors around every person
+
+    Returns:
+        tf.Tensor: `(1, total_anchors, 5)` raw predictions
+    """
+    num_anchors = total_anchors(height, width)
+    box_predictions = tf.random.normal([1, num_anchors, 4], stddev=0.1)
+    logits = tf.fill([1, num_anchors, 1], -6.0)
+    positives = tf.random.shuffle(tf.range(num_anchors))[: persons * anchors_per_person]
+    logits = tf.tensor_scatter_nd_update(
+        logits,
+        tf.stack([tf.zeros_like(positives), positives], axis=-1),
+        tf.random.uniform([persons * anchors_per_person, 1], 0.0, 4.0),
+    )
+    return tf.concat([box_predictions, logits], axis=-1)
+
+
+def benchmark_decode_modes(height, width, persons, iterations):
+    """Time both decode modes on the same crowded predictions
+
+    Returns:
+        Dict[str, Dict]: Timings and number of detections of each mode
+    """
+    images = tf.zeros([1, height, width, 3], dtype=tf.float32)
+    predictions = crowded_predictions(height, width, persons)
+    results = {}
+    for decode_mode in ("combined", "fast"):
+        decode_predictions = DecodePredictions(
+            num_classes=1, confidence_threshold=0.35, decode_mode=decode_mode
+        )
+        anchor_boxes = decode_predictions.get_anchors(height, width)
+        decode = tf.function(
+            lambda layer=decode_predictions: layer(
+                images, predictions, anchor_boxes=anchor_boxes
+            )
+        )
+        results[decode_mode] = time_call(decode, iterations=iterations)
+        results[decode_mode]["detections"] = int(decode().valid_detections[0])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--height", type=int, default=896)
+    parser.add_argument("--width", type=int, default=1408)
+    parser.add_argument("--persons", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    results = benchmark_decode_modes(
+        args.height, args.width, args.persons, args.iterations
+    )
+    for decode_mode, result in results.items():
+        print(
+            f"{decode_mode:>8}: mean {result['mean_ms']:.2f}ms "
+            f"median {result['median_ms']:.2f}ms, {result['detections']} detections"
+        )
+    speedup = results["combined"]["mean_ms"] / results["fast"]["mean_ms"]
+    print(f"Decode-stage speedup: {speedup:.2f}x")
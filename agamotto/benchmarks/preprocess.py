@@ -0,0 +1,79 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Benchmark of the inference preprocessing, float32 prepare_image against the
+uint8 FramePreprocessor on 1080p and 4K frames
+
+Usage (from the agamotto folder):
+    python -m benchmarks.preprocess
+"""
+
+import argparse
+
+import numpy as np
+import tensorflow as tf
+
+from agamotto.frame_preprocessor import FramePreprocessor
+from agamotto.retinanet.preprocess import prepare_image
+from benchmarks.timing import time_call
+
+RESOLUTIONS = {"1080p": (1080, 1920), "4k": (2160, 3840)}
+
+
+def benchmark_preprocess(height, width, iterations):
+    """Time both preprocessing paths on a random frame
+
+    Args:
+        height (int): Frame height
+        width (int): Frame width
+        iterations (int): Number of timed calls
+
+    Returns:
+        Dict: Timings of both paths, the ratios and the largest pixel difference
+    """
+    frame = np.random.randint(0, 256, size=(height, width, 3), dtype=np.uint8)
+    frame_preprocessor = FramePreprocessor()
+
+    def float_path():
+        return prepare_image(tf.cast(frame, dtype=tf.float32))
+
+    float_image, float_ratio = float_path()
+    uint8_image, uint8_ratio = frame_preprocessor(frame)
+    return {
+        "float32": time_call(float_path, iterations=iterations),
+        "uint8": time_call(lambda: frame_preprocessor(frame), iterations=iterations),
+        "float32_ratio": float(float_ratio),
+        "uint8_ratio": float(uint8_ratio),
+        "same_shape": tuple(float_image.shape) == uint8_image.shape,
+        "max_abs_difference": float(np.max(np.abs(float_image.numpy() - uint8_image))),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    for name, (height, width) in RESOLUTIONS.items():
+        results = benchmark_preprocess(height, width, args.iterations)
+        speedup = results["float32"]["mean_ms"] / results["uint8"]["mean_ms"]
+        print(
+            f"{name}: float32 {results['float32']['mean_ms']:.2f}ms, "
+            f"uint8 {results['uint8']['mean_ms']:.2f}ms ({speedup:.2f}x), "
+            f"ratio {results['float32_ratio']} / {results['uint8_ratio']}, "
+            f"same shape {results['same_shape']}, "
+            f"max difference {results['max_abs_difference']:.2f}"
+        )
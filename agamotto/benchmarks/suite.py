@@ -0,0 +1,296 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Offline benchmark suite of the retinanet components and of a full
+create_detections call, synthetic data and random weights, JSON results
+compared against a stored baseline
+
+Usage (from the agamotto folder):
+    python -m benchmarks.suite --save-baseline
+    python -m benchmarks.suite --output results.json --threshold 0.15
+
+The exit status is 1 when a benchmark of the baseline got slower than the
+threshold allows. A baseline is only meaningful on the machine (and
+TensorFlow build) that recorded it.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+from agamotto.retinanet.anchorbox import AnchorBox
+from agamotto.retinanet.decodepredictions import DecodePredictions
+from agamotto.retinanet.labelencoder import LabelEncoder
+from agamotto.retinanet.preprocess import resize_and_pad_image
+from benchmarks.decode_nms import crowded_predictions
+from benchmarks.timing import time_call
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+IMAGE_SIZES = [(512, 640), (896, 1408), (1152, 2048)]
+FRAME_SIZES = [(720, 1280), (1080, 1920), (2160, 3840)]
+OBJECT_COUNTS = [1, 10, 50]
+
+
+def random_boxes(count, height, width):
+    """Random `[x, y, width, height]` boxes inside an image"""
+    sizes = tf.random.uniform([count, 2], 16.0, min(height, width) / 4.0)
+    centres = tf.random.uniform([count, 2], 0.0, 1.0) * tf.constant(
+        [width, height], dtype=tf.float32
+    )
+    return tf.concat([centres, sizes], axis=-1)
+
+
+def benchmark_anchors(iterations):
+    """AnchorBox.get_anchors without cache (generation) and with cache"""
+    results = {}
+    for height, width in IMAGE_SIZES:
+        for name, cache_size in [("generate", 0), ("cached", 8)]:
+            anchor_box = AnchorBox(cache_size=cache_size)
+            results[f"get_anchors/{name}/{height}x{width}"] = time_call(
+                lambda anchor_box=anchor_box, h=height, w=width: anchor_box.get_anchors(
+                    h, w
+                ),
+                iterations=iterations,
+            )
+    return results
+
+
+def benchmark_encode_batch(iterations, batch_size=2):
+    """LabelEncoder.encode_batch for every image size and object count"""
+    label_encoder = LabelEncoder()
+    results = {}
+    for height, width in IMAGE_SIZES:
+        images = tf.zeros([batch_size, height, width, 3], dtype=tf.float32)
+        for count in OBJECT_COUNTS:
+            gt_boxes = tf.stack(
+                [random_boxes(count, height, width) for _ in range(batch_size)]
+            )
+            cls_ids = tf.zeros([batch_size, count], dtype=tf.int32)
+            results[f"encode_batch/{height}x{width}/objects={count}"] = time_call(
+                lambda images=images, gt_boxes=gt_boxes, cls_ids=cls_ids: label_encoder.encode_batch(
+                    images, gt_boxes, cls_ids
+                ),
+                iterations=iterations,
+            )
+    return results
+
+
+def benchmark_compute_iou(iterations):
+    """LabelEncoder.compute_iou of every anchor against the objects"""
+    label_encoder = LabelEncoder()
+    anchor_box = AnchorBox()
+    results = {}
+    for height, width in IMAGE_SIZES:
+        anchors = anchor_box.get_anchors(height, width)
+        for count in OBJECT_COUNTS:
+            gt_boxes = random_boxes(count, height, width)
+            results[f"compute_iou/{height}x{width}/objects={count}"] = time_call(
+                lambda anchors=anchors, gt_boxes=gt_boxes: label_encoder.compute_iou(
+                    anchors, gt_boxes
+                ),
+                iterations=iterations,
+            )
+    return results
+
+
+def benchmark_resize_and_pad(iterations):
+    """resize_and_pad_image of camera frames to the default 800/1333 sides"""
+    results = {}
+    for height, width in FRAME_SIZES:
+        frame = tf.random.uniform([height, width, 3], 0.0, 255.0)
+        results[f"resize_and_pad_image/{height}x{width}"] = time_call(
+            lambda frame=frame: resize_and_pad_image(frame, jitter=None),
+            iterations=iterations,
+        )
+    return results
+
+
+def benchmark_decode_predictions(iterations):
+    """DecodePredictions in both decode modes for every size and object count"""
+    results = {}
+    for height, width in IMAGE_SIZES:
+        images = tf.zeros([1, height, width, 3], dtype=tf.float32)
+        for count in OBJECT_COUNTS:
+            predictions = crowded_predictions(height, width, count)
+            for decode_mode in ("combined", "fast"):
+                decode_predictions = DecodePredictions(
+                    num_classes=1, confidence_threshold=0.35, decode_mode=decode_mode
+                )
+                results[
+                    f"decode_predictions/{decode_mode}/{height}x{width}/objects={count}"
+                ] = time_call(
+                    lambda layer=decode_predictions, images=images, predictions=predictions: layer(
+                        images, predictions
+                    ),
+                    iterations=iterations,
+                )
+    return results
+
+
+def offline_agamotto(config):
+    """Agamotto with a randomly initialised RetinaNet, nothing is downloaded
+
+    The download, dataset and weights steps of the constructor are skipped,
+    the inference path (preprocessing, forward pass and decoding) is the one
+    of the configured agamotto.yaml with the keras backend.
+    """
+    # pylint: disable=import-outside-toplevel
+    from agamotto.agamotto import Agamotto
+    from agamotto.retinanet.retinanet import RetinaNet, get_backbone
+
+    config = dict(config, model=dict(config["model"], inference_backend="keras"))
+    config["model"]["tiling"] = dict(config["model"]["tiling"], enabled=False)
+    config["model"]["tuning_file"] = None
+    agamotto = Agamotto.__new__(Agamotto)
+    agamotto._config = config  # pylint: disable=protected-access
+    agamotto.set_parameters()
+    agamotto._model = RetinaNet(  # pylint: disable=protected-access
+        config["model"]["num_classes"], get_backbone(weights=None)
+    )
+    agamotto.build_inference_model()
+    return agamotto
+
+
+def benchmark_create_detections(iterations, config):
+    """Agamotto.create_detections on random camera frames"""
+    agamotto = offline_agamotto(config)
+    results = {}
+    for height, width in FRAME_SIZES:
+        frame = np.random.randint(0, 256, size=(height, width, 3), dtype=np.uint8)
+        results[f"create_detections/{height}x{width}"] = time_call(
+            lambda frame=frame: agamotto.create_detections(frame),
+            iterations=iterations,
+        )
+    return results
+
+
+def run_suite(iterations, config=None):
+    """Run every benchmark
+
+    Args:
+        iterations (int): Number of timed calls of every benchmark
+        config (Dict, optional): agamotto.yaml config, create_detections is
+            skipped without it
+
+    Returns:
+        Dict: metadata and the timings of every benchmark
+    """
+    tf.random.set_seed(0)
+    np.random.seed(0)
+    results = {}
+    results.update(benchmark_anchors(iterations))
+    results.update(benchmark_encode_batch(iterations))
+    results.update(benchmark_compute_iou(iterations))
+    results.update(benchmark_resize_and_pad(iterations))
+    results.update(benchmark_decode_predictions(iterations))
+    if config is not None:
+        results.update(benchmark_create_detections(iterations, config))
+    return {
+        "metadata": {
+            "tensorflow": tf.__version__,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "iterations": iterations,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Median of every benchmark against the baseline
+
+    Args:
+        current (Dict): Output of run_suite
+        baseline (Dict): Stored output of run_suite
+        threshold (float): Allowed slowdown, 0.15 is 15% slower
+
+    Returns:
+        List[Tuple[str, float, float, bool]]: name, baseline and current
+        median in ms and if it is a regression
+    """
+    comparison = []
+    for name, timing in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        baseline_ms = baseline["results"][name]["median_ms"]
+        current_ms = timing["median_ms"]
+        comparison.append(
+            (name, baseline_ms, current_ms, current_ms > baseline_ms * (1 + threshold))
+        )
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--threshold", type=float, default=0.15, help="Allowed slowdown (0.15 = 15%%)"
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store the results as the new baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--skip-create-detections",
+        action="store_true",
+        help="Only run the retinanet components",
+    )
+    args = parser.parse_args()
+
+    config = None
+    if not args.skip_create_detections:
+        from utils.read_from_yaml import read_from_yaml
+
+        config = read_from_yaml()
+    suite = run_suite(args.iterations, config)
+    if args.output:
+        with open(args.output, "w") as file_pointer:
+            json.dump(suite, file_pointer, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as file_pointer:
+            json.dump(suite, file_pointer, indent=2)
+        print(
+            f"Baseline with {len(suite['results'])} benchmarks written to {args.baseline}"
+        )
+        sys.exit(0)
+    if not os.path.exists(args.baseline):
+        print(json.dumps(suite, indent=2))
+        print(f"No baseline at {args.baseline}, run with --save-baseline first")
+        sys.exit(0)
+
+    with open(args.baseline) as file_pointer:
+        baseline = json.load(file_pointer)
+    regressions = 0
+    for name, baseline_ms, current_ms, regression in compare(
+        suite, baseline, args.threshold
+    ):
+        regressions += regression
+        print(
+            f"{'REGRESSION' if regression else 'ok':>10} {name:<55} "
+            f"{baseline_ms:>9.2f}ms -> {current_ms:>9.2f}ms "
+            f"({100.0 * (current_ms / max(baseline_ms, 1e-9) - 1):+.1f}%)"
+        )
+    print(f"{regressions} regressions over a {100 * args.threshold:.0f}% threshold")
+    sys.exit(1 if regressions else 0)
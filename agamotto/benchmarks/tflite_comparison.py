@@ -0,0 +1,140 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Accuracy and latency of the INT8 TFLite backend against the float model
+
+Usage (from the agamotto folder, after `python main.py export-tflite`):
+    python -m benchmarks.tflite_comparison --video video.mp4 --model agamotto_int8.tflite
+"""
+
+import argparse
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+from agamotto.agamotto import Agamotto
+from agamotto.retinanet.decodepredictions import DecodePredictions
+from agamotto.sampler import FrameSampler
+from agamotto.tflite_backend import TFLiteInference
+from utils.read_from_yaml import read_from_yaml
+
+
+def mean_best_iou(reference_boxes, boxes):
+    """Mean IOU between every reference box and its best match in boxes
+
+    Args:
+        reference_boxes (numpy.ndarray): `(N, 4)` boxes `[x1, y1, x2, y2]`
+        boxes (numpy.ndarray): `(M, 4)` boxes `[x1, y1, x2, y2]`
+
+    Returns:
+        float: Mean best IOU, 1.0 when both are empty and 0.0 when only one is
+    """
+    if len(reference_boxes) == 0 and len(boxes) == 0:
+        return 1.0
+    if len(reference_boxes) == 0 or len(boxes) == 0:
+        return 0.0
+    left_up = np.maximum(reference_boxes[:, None, :2], boxes[None, :, :2])
+    right_down = np.minimum(reference_boxes[:, None, 2:], boxes[None, :, 2:])
+    intersection = np.prod(np.clip(right_down - left_up, 0.0, None), axis=-1)
+    reference_area = np.prod(reference_boxes[:, 2:] - reference_boxes[:, :2], axis=-1)
+    area = np.prod(boxes[:, 2:] - boxes[:, :2], axis=-1)
+    union = np.maximum(reference_area[:, None] + area[None, :] - intersection, 1e-8)
+    return float(np.mean(np.max(intersection / union, axis=1)))
+
+
+def valid_boxes(detections):
+    """Boxes of the first image of a detections batch"""
+    return detections.nmsed_boxes[0][: int(detections.valid_detections[0])]
+
+
+def compare(agamotto, tflite_inference, video_path, interval, max_frames):
+    """Run both backends on the same frames
+
+    Returns:
+        Dict[str, float]: Latencies, count error and box agreement
+    """
+    float_times, int8_times, count_errors, ious = [], [], [], []
+    player = cv2.VideoCapture(video_path)
+    for position, sampled_frame in enumerate(FrameSampler(player, interval=interval)):
+        if position >= max_frames:
+            break
+        input_image, _ = agamotto.prepare_frame(sampled_frame.image)
+        start_time = time.perf_counter()
+        float_detections = agamotto.run_inference(input_image)
+        float_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        int8_detections = tflite_inference(input_image)
+        int8_time = time.perf_counter() - start_time
+        if position > 0:
+            float_times.append(float_time * 1000.0)
+            int8_times.append(int8_time * 1000.0)
+        count_errors.append(
+            abs(
+                int(float_detections.valid_detections[0])
+                - int(int8_detections.valid_detections[0])
+            )
+        )
+        ious.append(
+            mean_best_iou(valid_boxes(float_detections), valid_boxes(int8_detections))
+        )
+    player.release()
+    return {
+        "frames": len(count_errors),
+        "float_median_ms": statistics.median(float_times),
+        "int8_median_ms": statistics.median(int8_times),
+        "speedup": statistics.median(float_times) / statistics.median(int8_times),
+        "count_mae": statistics.mean(count_errors),
+        "count_exact_match": count_errors.count(0) / len(count_errors),
+        "mean_best_iou": statistics.mean(ious),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--video", default="video.mp4")
+    parser.add_argument("--model", default="agamotto_int8.tflite")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--frames", type=int, default=50)
+    args = parser.parse_args()
+
+    config = read_from_yaml()
+    config["model"]["inference_backend"] = "keras"
+    results = compare(
+        Agamotto(config),
+        TFLiteInference(
+            args.model,
+            # Same decoding as the float model, only the quantization differs
+            DecodePredictions(
+                num_classes=config["model"]["num_classes"],
+                confidence_threshold=config["model"]["confidence_threshold"],
+                decode_mode=config["model"]["decode_mode"],
+                pre_nms_top_k=config["model"]["pre_nms_top_k"],
+            ),
+            num_threads=args.threads,
+        ),
+        args.video,
+        args.interval,
+        args.frames,
+    )
+    for name, value in results.items():
+        print(
+            f"{name:>18}: {value:.3f}"
+            if isinstance(value, float)
+            else f"{name:>18}: {value}"
+        )
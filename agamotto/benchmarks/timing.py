@@ -0,0 +1,45 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""Timing helpers shared by the benchmarks"""
+
+import statistics
+import time
+
+
+def time_call(function, iterations=20, warmup=3):
+    """Time a callable, discarding the warmup calls
+
+    Args:
+        function (Callable): Function without arguments to be timed
+        iterations (int): Number of timed calls
+        warmup (int): Number of calls before timing (tracing, caches, etc)
+
+    Returns:
+        Dict[str, float]: mean, median, min and max in milliseconds
+    """
+    for _ in range(warmup):
+        function()
+    durations = []
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start_time) * 1000.0)
+    return {
+        "mean_ms": statistics.mean(durations),
+        "median_ms": statistics.median(durations),
+        "min_ms": min(durations),
+        "max_ms": max(durations),
+    }
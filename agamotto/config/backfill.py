@@ -0,0 +1,131 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+"""
+Backfill of recorded videos, the rows are written as newline-delimited JSON
+files partitioned by location and date and every batch is appended to
+BigQuery with a single load job instead of stream inserts
+"""
+
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from utils.logger import logger
+
+
+def video_start_time(video_path, frame_count, fps):
+    """Wall clock start of a recording when it is not given
+
+    Recorders close the file when the recording ends, so the start is the
+    file modification time minus the video duration.
+
+    Args:
+        video_path (str): Local video file
+        frame_count (int): Number of frames of the video
+        fps (float): Frames per second of the video
+
+    Returns:
+        datetime: Local time of the first frame
+    """
+    duration = frame_count / fps if fps > 0 else 0.0
+    return datetime.fromtimestamp(os.path.getmtime(video_path)) - timedelta(
+        seconds=duration
+    )
+
+
+class BackfillWriter:
+    """Writes the rows of a batch to partition files and loads them
+
+    A batch (one video) is written to
+    `output_dir/location_id=<id>/date=<YYYY-MM-DD>/<batch_id>.json`, writing it
+    again replaces its files. When a BigQuery is given, all the files of the
+    batch go through one load job and a marker in `output_dir/_loaded` keeps
+    the batch from being loaded twice, without it only the files are written.
+
+    Attributes:
+        output_dir: Root folder of the partition files
+        bigquery: BigQuery of the count table, None for the local mode
+    """
+
+    def __init__(self, output_dir, bigquery=None):
+        self.output_dir = output_dir
+        self.bigquery = bigquery
+
+    def _marker(self, batch_id):
+        """Path of the marker of a loaded batch"""
+        return os.path.join(self.output_dir, "_loaded", batch_id)
+
+    def write_batch(self, batch_id: str, rows: List[Dict]) -> List[str]:
+        """Write the rows of a batch, one file per location and date
+
+        Args:
+            batch_id (str): Unique name of the batch
+            rows (List[Dict]): Rows from BigQuery.build_rows
+
+        Returns:
+            List[str]: Paths of the written files
+        """
+        partitions = defaultdict(list)
+        for row in rows:
+            partitions[(row["location_id"], row["day_time"][:10])].append(row)
+        paths = []
+        for (location_id, date), partition_rows in sorted(partitions.items()):
+            partition_dir = os.path.join(
+                self.output_dir, f"location_id={location_id}", f"date={date}"
+            )
+            os.makedirs(partition_dir, exist_ok=True)
+            path = os.path.join(partition_dir, f"{batch_id}.json")
+            with open(path, "w") as partition_file:
+                for row in partition_rows:
+                    partition_file.write(json.dumps(row, default=str) + "\n")
+            paths.append(path)
+        logger(self.__class__.__name__).info(
+            f"Wrote {len(rows)} rows of {batch_id} to {len(paths)} partition files"
+        )
+        return paths
+
+    def load_batch(self, batch_id: str, paths: List[str]):
+        """Append the files of a batch to the count table with one load job
+
+        Args:
+            batch_id (str): Unique name of the batch
+            paths (List[str]): Files from write_batch
+        """
+        if self.bigquery is None or not paths:
+            return
+        if os.path.exists(self._marker(batch_id)):
+            logger(self.__class__.__name__).info(
+                f"Batch {batch_id} was already loaded, skipping"
+            )
+            return
+        self.bigquery.load_files(paths)
+        os.makedirs(os.path.dirname(self._marker(batch_id)), exist_ok=True)
+        open(self._marker(batch_id), "w").close()
+
+    def commit(self, batch_id: str, rows: List[Dict]) -> List[str]:
+        """Write a batch and load it
+
+        Args:
+            batch_id (str): Unique name of the batch
+            rows (List[Dict]): Rows from BigQuery.build_rows
+
+        Returns:
+            List[str]: Paths of the written files
+        """
+        paths = self.write_batch(batch_id, rows)
+        self.load_batch(batch_id, paths)
+        return paths
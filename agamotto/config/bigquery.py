@@ -15,7 +15,9 @@
 
 """Bigquery main module"""
 
-from typing import List
+import io
+from datetime import datetime
+from typing import Dict, List
 from google.cloud import bigquery
 from google.cloud.exceptions import NotFound
 from utils.logger import logger
@@ -57,10 +59,12 @@ class BigQuery:
         """Create the count table if bigquery save is enabled"""
         try:
             self._bigquery_service = bigquery.Client()
-            if self._bigquery_service.get_table(self._table_id):
+            table = self._bigquery_service.get_table(self._table_id)
+            if table:
                 logger(self.__class__.__name__).info(
                     f"Table {self._table_id} already exists"
                 )
+                self._add_missing_fields(table)
         except NotFound:
             # CreateModel
             table = bigquery.Table(self._table_id, schema=get_schema())
@@ -69,32 +73,123 @@ class BigQuery:
                 f"Created table {table.project}.{table.dataset_id}.{table.table_id}".format()
             )
 
-    def insert(self, count_list: List[int]):
-        """Insert a list of counts into count_table
+    def _add_missing_fields(self, table):
+        """Add the nullable fields of get_schema missing in an existing table"""
+        existing_fields = {field.name for field in table.schema}
+        missing_fields = [
+            field for field in get_schema() if field.name not in existing_fields
+        ]
+        if not missing_fields:
+            return
+        table.schema = list(table.schema) + missing_fields
+        self._bigquery_service.update_table(table, ["schema"])
+        logger(self.__class__.__name__).info(
+            f"Added {[field.name for field in missing_fields]} to {self._table_id}"
+        )
+
+    def build_rows(self, count_list: List[int]) -> List[Dict]:
+        """Build the rows of a list of counts for this location
 
         Args:
-            count_list (List[int]): #TODO
+            count_list (List[int]): List of [count, day_time]
 
-        Raises:
-            ex: #TODO
+        Returns:
+            List[Dict]: One AgamottoEntry row per count
         """
-        try:
-            rows = []
-            for count, day_time in count_list:
-                entry = AgamottoEntry(
-                    count=count,
-                    day_time=day_time,
-                    latlong=self._location_latlong,
-                    location_id=self._location_id,
-                    location_name=self._location_name,
-                ).__dict__
-                rows.append(entry)
-            errors = self._get_bigquery_service().insert_rows_json(self._table_id, rows)
-            if errors == []:
-                logger(self.__class__.__name__).info("Stream insert was successfull")
-            else:
-                logger(self.__class__.__name__).info(
-                    f"Encountered errors while inserting rows: {errors}"
-                )
-        except Exception as ex:
-            raise ex
+        rows = []
+        for count, day_time in count_list:
+            entry = AgamottoEntry(
+                count=count,
+                day_time=day_time,
+                latlong=self._location_latlong,
+                location_id=self._location_id,
+                location_name=self._location_name,
+            ).__dict__
+            rows.append(entry)
+        return rows
+
+    def build_window_rows(self, windows) -> List[Dict]:
+        """Build one row per rollup window for this location
+
+        `count` is the rounded mean and `day_time` the window end, so queries
+        over the per-frame columns keep working on window rows.
+
+        Args:
+            windows (List[Window]): Windows from WindowAggregator
+
+        Returns:
+            List[Dict]: One AgamottoEntry row per window
+        """
+        rows = []
+        for window in windows:
+            window_end = datetime.fromtimestamp(window.window_end).strftime(
+                "%Y-%m-%dT%H:%M:%S"
+            )
+            entry = AgamottoEntry(
+                count=round(window.count_mean),
+                day_time=window_end,
+                latlong=self._location_latlong,
+                location_id=self._location_id,
+                location_name=self._location_name,
+                window_start=datetime.fromtimestamp(window.window_start).strftime(
+                    "%Y-%m-%dT%H:%M:%S"
+                ),
+                window_end=window_end,
+                count_min=window.count_min,
+                count_max=window.count_max,
+                count_mean=window.count_mean,
+                count_p95=window.count_p95,
+                sample_count=window.sample_count,
+            ).__dict__
+            rows.append(entry)
+        return rows
+
+    def insert_rows(self, rows: List[Dict], row_ids: List[str] = None) -> List[Dict]:
+        """Stream insert rows into count_table with the shared client
+
+        Args:
+            rows (List[Dict]): Rows from build_rows, any location
+            row_ids (List[str], optional): insertId of every row, BigQuery
+                deduplicates the rows sent again with the same id
+
+        Returns:
+            List[Dict]: Row errors returned by BigQuery, empty on success
+        """
+        errors = self._get_bigquery_service().insert_rows_json(
+            self._table_id, rows, row_ids=row_ids
+        )
+        if errors == []:
+            logger(self.__class__.__name__).info("Stream insert was successfull")
+        else:
+            logger(self.__class__.__name__).info(
+                f"Encountered errors while inserting rows: {errors}"
+            )
+        return errors
+
+    def load_files(self, paths: List[str]):
+        """Append newline-delimited JSON files to count_table with a single load job
+
+        Args:
+            paths (List[str]): Files with one row from build_rows per line
+
+        Returns:
+            bigquery.LoadJob: The finished load job
+        """
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            schema=get_schema(),
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        )
+        data = io.BytesIO()
+        for path in paths:
+            with open(path, "rb") as source_file:
+                data.write(source_file.read())
+        data.seek(0)
+        job = self._get_bigquery_service().load_table_from_file(
+            data, self._table_id, job_config=job_config
+        )
+        job.result()
+        logger(self.__class__.__name__).info(
+            f"Load job {job.job_id} appended {job.output_rows} rows from {len(paths)} files"
+        )
+        return job
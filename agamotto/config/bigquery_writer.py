@@ -0,0 +1,412 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Background BigQuery writer, one long-lived client fed through a bounded queue
+(or the durable RowSpool) so the inference loop never waits for a stream insert
+"""
+
+import queue
+import threading
+import time
+import uuid
+from typing import Dict, List
+
+from google.api_core import exceptions
+
+from utils.logger import logger
+from utils.metrics import record_bigquery_rows, record_bigquery_writer, timed_stage
+
+# Exceptions worth a retry, anything else drops the batch (kept in the spool)
+TRANSIENT_ERRORS = (
+    exceptions.ServerError,
+    exceptions.TooManyRequests,
+    ConnectionError,
+    TimeoutError,
+)
+# Row level reasons worth a retry, `stopped` rows were valid but not inserted
+# because another row of the request was invalid
+TRANSIENT_ROW_REASONS = ("backendError", "internalError", "timeout", "stopped")
+
+
+class BigQueryWriter:
+    """Buffers rows and stream inserts them from a background thread
+
+    Rows are flushed when `flush_size` rows are waiting or `flush_interval`
+    seconds after the oldest waiting row arrived. Every row gets an insertId
+    so a retried request is deduplicated by BigQuery.
+
+    `submit` only puts the rows in a bounded memory queue: it never blocks by
+    default, rows are dropped and counted when the queue is full. Without a
+    spool the writer thread inserts from that queue, rows that still fail
+    after `max_retries` are dropped and counted.
+
+    With a RowSpool the writer thread moves the queued rows to disk (one
+    SQLite transaction per wake up, the queue only absorbs the disk latency)
+    and a row is only deleted once BigQuery acknowledged it, rows it rejects
+    as invalid are moved to the dead letter table of the spool. Transient
+    failures are retried with backoff for as long as needed, any other error
+    stops the sending (rows are still spooled) and the rows left in the spool
+    are sent by the next start or by `replay`.
+
+    Attributes:
+        bigquery: BigQuery instance that owns the client and the table
+        spool: RowSpool or None for the memory queue
+        queue_size: Maximum number of rows waiting in memory
+        flush_size: Rows per insert request
+        flush_interval: Maximum seconds a row waits before a flush
+        max_retries: Retries of a failed request (memory queue), consecutive
+            failed requests before `replay` gives up (spool)
+        initial_backoff: First retry delay in seconds, doubled every retry
+        max_backoff: Upper bound of the retry delay
+        written_rows: Rows acknowledged by BigQuery
+        dropped_rows: Rows dropped because the queue was full
+        failed_rows: Rows dropped after an error (or dead lettered)
+        lag: Seconds the rows of the last flush waited
+    """
+
+    def __init__(
+        self,
+        bigquery,
+        queue_size=10000,
+        flush_size=500,
+        flush_interval=5.0,
+        max_retries=5,
+        initial_backoff=1.0,
+        max_backoff=60.0,
+        spool=None,
+    ):
+        self.bigquery = bigquery
+        self.spool = spool
+        self.queue_size = queue_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.written_rows = 0
+        self.dropped_rows = 0
+        self.failed_rows = 0
+        self.lag = 0.0
+        self._started = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="agamotto-bigquery-writer", daemon=True
+        )
+
+    def start(self):
+        """Start the writer thread, rows left in the spool are sent right away"""
+        self._started = time.time()
+        self._thread.start()
+        return self
+
+    def submit(self, rows: List[Dict], block=False):
+        """Queue rows for the next flush
+
+        Args:
+            rows (List[Dict]): Rows from BigQuery.build_rows
+            block (bool): If True, wait for room in the queue instead of
+                dropping (only for callers outside of the frame loop)
+
+        Returns:
+            int: Number of queued rows
+        """
+        queued = 0
+        for row in rows:
+            try:
+                self._queue.put((time.monotonic(), uuid.uuid4().hex, row), block=block)
+                queued += 1
+            except queue.Full:
+                self.dropped_rows += 1
+                record_bigquery_rows("dropped")
+        if queued < len(rows):
+            logger(self.__class__.__name__).warning(
+                f"Writer queue full, dropped {len(rows) - queued} rows "
+                f"({self.dropped_rows} in total)"
+            )
+        record_bigquery_writer(self._queue.qsize(), self.lag)
+        return queued
+
+    def _next_batch(self):
+        """Wait for up to flush_size rows or flush_interval after the first one
+
+        Rows already waiting are always taken, so a backlog is sent in full
+        batches, and nothing is waited for once the writer is stopping.
+        """
+        batch = []
+        deadline = None
+        while len(batch) < self.flush_size:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            try:
+                if self._stop.is_set() or (timeout is not None and timeout <= 0):
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=0.5 if timeout is None else timeout)
+            except queue.Empty:
+                if deadline is None and not self._stop.is_set():
+                    continue
+                break
+            batch.append(item)
+            if deadline is None:
+                deadline = item[0] + self.flush_interval
+        return batch
+
+    def _insert(self, rows, insert_ids):
+        """Insert rows, splitting the row errors into retries and rejections
+
+        Rejected rows are counted as failed.
+
+        Returns:
+            Tuple[List[int], List[Tuple[int, str]]]: Positions of the rows
+            worth a retry, positions and reasons of the rejected rows
+        """
+        with timed_stage("bigquery"):
+            errors = self.bigquery.insert_rows(rows, row_ids=insert_ids)
+        retry = []
+        rejected = []
+        for error in errors:
+            reasons = {detail.get("reason") for detail in error.get("errors", [])}
+            if reasons and reasons <= set(TRANSIENT_ROW_REASONS):
+                retry.append(error["index"])
+            else:
+                rejected.append((error["index"], ",".join(sorted(map(str, reasons)))))
+        self.failed_rows += len(rejected)
+        record_bigquery_rows("failed", len(rejected))
+        self.written_rows += len(rows) - len(errors)
+        record_bigquery_rows("written", len(rows) - len(errors))
+        return retry, rejected
+
+    def _flush(self, batch):
+        """Insert a batch of the memory queue with retries and backoff"""
+        self.lag = time.monotonic() - batch[0][0]
+        insert_ids = [insert_id for _, insert_id, _ in batch]
+        rows = [row for _, _, row in batch]
+        delay = self.initial_backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                retry, _ = self._insert(rows, insert_ids)
+                rows = [rows[index] for index in retry]
+                insert_ids = [insert_ids[index] for index in retry]
+                if not rows:
+                    break
+            except TRANSIENT_ERRORS as ex:
+                logger(self.__class__.__name__).warning(
+                    f"Transient error inserting {len(rows)} rows: {ex}"
+                )
+            if attempt < self.max_retries:
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+        else:
+            self.failed_rows += len(rows)
+            record_bigquery_rows("failed", len(rows))
+            logger(self.__class__.__name__).error(
+                f"Dropped {len(rows)} rows after {self.max_retries} retries"
+            )
+        record_bigquery_writer(self._queue.qsize(), self.lag)
+
+    def _send_spooled(self, batch):
+        """Insert spooled rows, delete the acknowledged ones and dead letter the rejected ones
+
+        Returns:
+            bool: True when every row of the batch left the spool
+        """
+        self.lag = time.time() - batch[0].created
+        try:
+            retry, rejected = self._insert(
+                [spooled.row for spooled in batch],
+                [spooled.insert_id for spooled in batch],
+            )
+        except TRANSIENT_ERRORS as ex:
+            logger(self.__class__.__name__).warning(
+                f"Transient error inserting {len(batch)} spooled rows, kept for a retry: {ex}"
+            )
+            return False
+        if rejected:
+            logger(self.__class__.__name__).error(
+                f"BigQuery rejected {len(rejected)} rows, moved to the dead letter "
+                f"table of {self.spool.path}"
+            )
+            self.spool.reject([(batch[index].id, reason) for index, reason in rejected])
+        kept = set(retry) | {index for index, _ in rejected}
+        self.spool.acknowledge(
+            [spooled.id for index, spooled in enumerate(batch) if index not in kept]
+        )
+        record_bigquery_writer(len(self.spool), self.lag)
+        return not retry
+
+    def _spool_waiting(self, timeout=0.0):
+        """Move the rows waiting in the memory queue to the spool
+
+        Args:
+            timeout (float): Seconds to wait for a first row
+
+        Returns:
+            int: Number of spooled rows
+        """
+        items = []
+        try:
+            items.append(
+                self._queue.get(timeout=timeout)
+                if timeout > 0
+                else self._queue.get_nowait()
+            )
+            while True:
+                items.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        if items:
+            self.spool.append([row for _, _, row in items])
+        return len(items)
+
+    def _wait_spooling(self, seconds):
+        """Wait, spooling the rows submitted meanwhile, until stopped"""
+        deadline = time.monotonic() + seconds
+        while not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self._spool_waiting(timeout=min(0.5, remaining))
+
+    def _drain_spool(self, until_empty=False, max_retries=None):
+        """Send the spool in batches, backing off while the sink fails
+
+        Errors that are not transient are raised, the rows stay in the spool.
+
+        Args:
+            until_empty (bool): Return once the spool is empty instead of
+                waiting for new rows, flushes without waiting for flush_size
+            max_retries (int, optional): Consecutive failed requests before
+                giving up, None retries for as long as needed
+
+        Returns:
+            bool: False when it gave up after max_retries
+        """
+        delay = self.initial_backoff
+        failures = 0
+        while True:
+            self._spool_waiting()
+            batch = self.spool.peek(self.flush_size)
+            if not batch:
+                stopping = until_empty or self._stop.is_set()
+                if not self._spool_waiting(timeout=0.0 if stopping else 0.5):
+                    if stopping:
+                        return True
+                continue
+            waited = time.time() - batch[0].created
+            flush_now = (
+                until_empty
+                or self._stop.is_set()
+                or batch[0].created < self._started
+                or len(batch) >= self.flush_size
+                or waited >= self.flush_interval
+            )
+            if not flush_now:
+                self._wait_spooling(self.flush_interval - waited)
+                continue
+            if self._send_spooled(batch):
+                delay = self.initial_backoff
+                failures = 0
+                continue
+            if self._stop.is_set() and not until_empty:
+                return True
+            failures += 1
+            if max_retries is not None and failures > max_retries:
+                return False
+            if until_empty:
+                time.sleep(delay)
+            else:
+                self._wait_spooling(delay)
+            delay = min(delay * 2, self.max_backoff)
+
+    def _run(self):
+        """Writer thread, flushes until stopped and nothing is waiting"""
+        if self.spool is not None:
+            try:
+                self._drain_spool()
+            except Exception as ex:  # pylint: disable=broad-except
+                logger(self.__class__.__name__).error(
+                    f"Stopped sending after an error, rows are kept in "
+                    f"{self.spool.path} for `python main.py replay`: {ex}"
+                )
+                self._wait_spooling(float("inf"))
+            self._spool_waiting()
+            return
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._flush(batch)
+            except Exception as ex:  # pylint: disable=broad-except
+                self.failed_rows += len(batch)
+                record_bigquery_rows("failed", len(batch))
+                logger(self.__class__.__name__).error(
+                    f"Dropped {len(batch)} rows after an error: {ex}"
+                )
+
+    def replay(self):
+        """Send every spooled row in the caller thread
+
+        A transient error is retried with backoff up to max_retries times in a
+        row, any other error stops the replay. The rows that were not sent
+        stay in the spool.
+
+        Returns:
+            bool: True when the spool is empty
+        """
+        logger(self.__class__.__name__).info(
+            f"Replaying {len(self.spool)} spooled rows from {self.spool.path}"
+        )
+        try:
+            replayed = self._drain_spool(until_empty=True, max_retries=self.max_retries)
+        except Exception as ex:  # pylint: disable=broad-except
+            logger(self.__class__.__name__).error(f"Replay stopped by an error: {ex}")
+            replayed = False
+        if not replayed:
+            logger(self.__class__.__name__).error(
+                f"{len(self.spool)} rows kept in {self.spool.path}"
+            )
+        logger(self.__class__.__name__).info(self.summary())
+        return replayed
+
+    def close(self, timeout=30.0):
+        """Flush the waiting rows and stop the writer thread
+
+        Spooled rows that could not be sent before the timeout stay on disk.
+
+        Args:
+            timeout (float): Seconds to wait for the last flush
+        """
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        logger(self.__class__.__name__).info(self.summary())
+        if self.spool is not None and not self._thread.is_alive():
+            self.spool.close()
+
+    def summary(self):
+        """Single line report of the writer counters"""
+        waiting = len(self.spool) if self.spool is not None else self._queue.qsize()
+        dead_letter = (
+            f", {self.spool.dead_letter_count()} in the dead letter table"
+            if self.spool is not None
+            else ""
+        )
+        return (
+            f"BigQuery writer: {self.written_rows} rows written, "
+            f"{self.dropped_rows} dropped (queue full), {self.failed_rows} failed, "
+            f"{waiting} waiting{dead_letter}, last lag {self.lag:.2f}s"
+        )
@@ -0,0 +1,218 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Time-window rollups of the per-frame counts, each location keeps its recent
+samples in a fixed size ring buffer and emits one row per window
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from utils.logger import logger
+
+ROLLUP_MODES = ("tumbling", "sliding")
+
+Window = namedtuple(
+    "Window",
+    [
+        "window_start",
+        "window_end",
+        "count_min",
+        "count_max",
+        "count_mean",
+        "count_p95",
+        "sample_count",
+    ],
+)
+Window.__doc__ = """Statistics of the counts of a location over a time window
+
+Attributes:
+    window_start: Window start, seconds since the epoch
+    window_end: Window end (exclusive), seconds since the epoch
+    count_min: Smallest count of the window
+    count_max: Largest count of the window
+    count_mean: Mean count of the window
+    count_p95: 95th percentile of the counts (linear interpolation)
+    sample_count: Number of counted frames in the window
+"""
+
+
+class RingBuffer:
+    """Fixed size buffer of (timestamp, count) samples, oldest first
+
+    When it is full the oldest sample is overwritten and counted in
+    `overwritten`, size the capacity for the samples of a window.
+
+    Attributes:
+        capacity: Maximum number of samples
+        overwritten: Samples lost because the buffer was full
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.overwritten = 0
+        self._timestamps = np.zeros(capacity, dtype=np.float64)
+        self._counts = np.zeros(capacity, dtype=np.int32)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamp, count):
+        """Add a sample at the end"""
+        if self._size == self.capacity:
+            self._start = (self._start + 1) % self.capacity
+            self._size -= 1
+            self.overwritten += 1
+        position = (self._start + self._size) % self.capacity
+        self._timestamps[position] = timestamp
+        self._counts[position] = count
+        self._size += 1
+
+    def _positions(self):
+        """Buffer positions from the oldest to the newest sample"""
+        return (self._start + np.arange(self._size)) % self.capacity
+
+    def drop_before(self, timestamp):
+        """Drop the samples older than timestamp"""
+        while self._size and self._timestamps[self._start] < timestamp:
+            self._start = (self._start + 1) % self.capacity
+            self._size -= 1
+
+    def counts_between(self, start, end):
+        """Counts of the samples with start <= timestamp < end"""
+        positions = self._positions()
+        timestamps = self._timestamps[positions]
+        return self._counts[positions[(timestamps >= start) & (timestamps < end)]]
+
+
+def window_statistics(window_start, window_end, counts):
+    """Window of a set of counts, None when there is no sample"""
+    if not len(counts):
+        return None
+    return Window(
+        window_start=window_start,
+        window_end=window_end,
+        count_min=int(np.min(counts)),
+        count_max=int(np.max(counts)),
+        count_mean=float(np.mean(counts)),
+        count_p95=float(np.percentile(counts, 95)),
+        sample_count=int(len(counts)),
+    )
+
+
+class WindowAggregator:
+    """Per-location tumbling or sliding windows over the counts
+
+    Tumbling windows are aligned to multiples of `window_seconds` and a window
+    is emitted when the first sample of a later window arrives. Sliding
+    windows of `window_seconds` are emitted every `slide_seconds`, aligned to
+    multiples of it, once a sample reaches the end of the window.
+
+    Attributes:
+        mode: One of ROLLUP_MODES
+        window_seconds: Window length in seconds
+        slide_seconds: Seconds between two sliding windows
+        capacity: Ring buffer size of every location
+    """
+
+    def __init__(
+        self, mode="tumbling", window_seconds=60, slide_seconds=15, capacity=4096
+    ):
+        if mode not in ROLLUP_MODES:
+            raise ValueError(f"Unknown rollup mode {mode}, available: {ROLLUP_MODES}")
+        self.mode = mode
+        self.window_seconds = float(window_seconds)
+        self.slide_seconds = float(
+            window_seconds if mode == "tumbling" else slide_seconds
+        )
+        self.capacity = capacity
+        self._buffers = {}
+        self._next_end = {}
+
+    def _window_end(self, timestamp):
+        """End of the first window that contains timestamp"""
+        return (np.floor(timestamp / self.slide_seconds) + 1) * self.slide_seconds
+
+    def add(self, location, timestamp, count):
+        """Add the count of a frame, returning the windows it closed
+
+        Args:
+            location (Hashable): Location key (location.id)
+            timestamp (float): Frame time, seconds since the epoch
+            count (int): Number of detections of the frame
+
+        Returns:
+            List[Window]: Closed windows of the location, oldest first
+        """
+        buffer = self._buffers.get(location)
+        if buffer is None:
+            buffer = self._buffers[location] = RingBuffer(self.capacity)
+            self._next_end[location] = self._window_end(timestamp)
+        windows = []
+        while timestamp >= self._next_end[location]:
+            window_end = self._next_end[location]
+            window = self._close(buffer, window_end)
+            if window is not None:
+                windows.append(window)
+            self._next_end[location] = (
+                window_end + self.slide_seconds
+                if len(buffer)
+                else self._window_end(timestamp)
+            )
+        overwritten = buffer.overwritten
+        buffer.append(timestamp, count)
+        if buffer.overwritten > overwritten:
+            logger(self.__class__.__name__).warning(
+                f"Rollup buffer of location {location} is full, raise its capacity"
+            )
+        return windows
+
+    def _close(self, buffer, window_end):
+        """Statistics of the window ending at window_end, then drop what no later window needs"""
+        window_start = window_end - self.window_seconds
+        window = window_statistics(
+            window_start, window_end, buffer.counts_between(window_start, window_end)
+        )
+        buffer.drop_before(window_end + self.slide_seconds - self.window_seconds)
+        return window
+
+    def flush(self):
+        """Close every pending window of every location (partial windows)
+
+        In sliding mode the last samples belong to several overlapping
+        windows, all of them are closed up to the one ending after the last
+        sample.
+
+        Returns:
+            Dict[Hashable, List[Window]]: Windows of every location, oldest first
+        """
+        windows = {}
+        for location, buffer in self._buffers.items():
+            window_end = self._next_end[location]
+            location_windows = []
+            while len(buffer):
+                window = self._close(buffer, window_end)
+                if window is not None:
+                    location_windows.append(window)
+                window_end += self.slide_seconds
+            if location_windows:
+                windows[location] = location_windows
+        self._buffers.clear()
+        self._next_end.clear()
+        return windows
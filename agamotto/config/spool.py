@@ -0,0 +1,189 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Durable local spool of BigQuery rows, every row is written to a SQLite
+database in WAL mode before it is sent and deleted once BigQuery acknowledged
+it, so a sink outage or a crash does not lose counts. Rows BigQuery rejects
+are moved to a dead letter table of the same database
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+from typing import Dict, List
+
+SpooledRow = namedtuple("SpooledRow", ["id", "insert_id", "created", "row"])
+SpooledRow.__doc__ = """A row waiting in the spool
+
+Attributes:
+    id: Position in the spool, rows are replayed in this order
+    insert_id: BigQuery insertId, the same on every replay of the row
+    created: Wall clock time the row was spooled
+    row: Row from BigQuery.build_rows
+"""
+
+
+class RowSpool:
+    """Append-only SQLite spool shared by the frame loop and the writer thread
+
+    The database runs in WAL mode with synchronous NORMAL: an append is a
+    sequential write to the log, a process crash loses nothing that was
+    appended, and readers do not block the writer.
+
+    Attributes:
+        path: SQLite database file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "insert_id TEXT NOT NULL UNIQUE, "
+            "created REAL NOT NULL, "
+            "payload TEXT NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            "id INTEGER PRIMARY KEY, "
+            "insert_id TEXT NOT NULL, "
+            "created REAL NOT NULL, "
+            "payload TEXT NOT NULL, "
+            "reason TEXT NOT NULL, "
+            "rejected REAL NOT NULL)"
+        )
+
+    def append(self, rows: List[Dict]):
+        """Write rows to the spool in a single transaction
+
+        Args:
+            rows (List[Dict]): Rows from BigQuery.build_rows
+
+        Returns:
+            List[str]: insertId of every row
+        """
+        created = time.time()
+        records = [
+            (uuid.uuid4().hex, created, json.dumps(row, default=str)) for row in rows
+        ]
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "INSERT INTO rows (insert_id, created, payload) VALUES (?, ?, ?)",
+                records,
+            )
+        return [insert_id for insert_id, _, _ in records]
+
+    def peek(self, limit):
+        """Oldest rows of the spool, they stay there until acknowledged
+
+        Args:
+            limit (int): Maximum number of rows
+
+        Returns:
+            List[SpooledRow]: Rows in spool order
+        """
+        with self._lock:
+            records = self._connection.execute(
+                "SELECT id, insert_id, created, payload FROM rows ORDER BY id LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            SpooledRow(row_id, insert_id, created, json.loads(payload))
+            for row_id, insert_id, created, payload in records
+        ]
+
+    def acknowledge(self, row_ids):
+        """Delete rows that BigQuery accepted
+
+        Args:
+            row_ids (List[int]): SpooledRow ids
+        """
+        if not row_ids:
+            return
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "DELETE FROM rows WHERE id = ?", [(row_id,) for row_id in row_ids]
+            )
+
+    def reject(self, rejected_rows):
+        """Move rows BigQuery rejected for good to the dead letter table
+
+        Args:
+            rejected_rows (List[Tuple[int, str]]): SpooledRow id and the
+                rejection reason of every row
+        """
+        if not rejected_rows:
+            return
+        rejected = time.time()
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO dead_letter "
+                "SELECT id, insert_id, created, payload, ?, ? FROM rows WHERE id = ?",
+                [(reason, rejected, row_id) for row_id, reason in rejected_rows],
+            )
+            self._connection.executemany(
+                "DELETE FROM rows WHERE id = ?",
+                [(row_id,) for row_id, _ in rejected_rows],
+            )
+
+    def dead_letter(self, limit):
+        """Oldest rejected rows, with the reason BigQuery gave
+
+        Args:
+            limit (int): Maximum number of rows
+
+        Returns:
+            List[Tuple[SpooledRow, str]]: Rows and their rejection reason
+        """
+        with self._lock:
+            records = self._connection.execute(
+                "SELECT id, insert_id, created, payload, reason FROM dead_letter "
+                "ORDER BY id LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            (SpooledRow(row_id, insert_id, created, json.loads(payload)), reason)
+            for row_id, insert_id, created, payload, reason in records
+        ]
+
+    def dead_letter_count(self):
+        """Number of rows in the dead letter table"""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM dead_letter"
+            ).fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def close(self):
+        """Checkpoint the WAL and close the database"""
+        with self._lock:
+            self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._connection.close()
@@ -15,21 +15,181 @@
 """
 This is the main file, first it reads from yaml
 then configure other classes with the parameters
+
+Commands:
+ - run (default): process video.input_location
+ - export-tflite: export the loaded model as an INT8 TFLite model
+ - export: export the loaded model as a self-contained SavedModel
+ - evaluate: count error and latency of every resolution profile on a video
+ - replay: send the rows left in gcp.spool_path to BigQuery and exit
+ - backfill: count recorded videos and load the rows with BigQuery load jobs
 #TODO Improvements:
  - decouple timezone
 """
+import argparse
 import os
+import sys
+from datetime import datetime
+from config.backfill import BackfillWriter
 from config.bigquery import BigQuery
+from config.bigquery_writer import BigQueryWriter
+from config.spool import RowSpool
 from utils.read_from_yaml import read_from_yaml
+from utils.metrics import start_metrics_server
 from agamotto.agamotto import Agamotto
+from agamotto.evaluation import evaluate_resolution_profiles, read_ground_truth
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Agamotto")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("run", help="Process video.input_location (default)")
+    export_tflite = subparsers.add_parser(
+        "export-tflite", help="Export an INT8 TFLite model calibrated on a video"
+    )
+    export_tflite.add_argument(
+        "--video", help="Calibration video, defaults to video.input_location"
+    )
+    export_tflite.add_argument(
+        "--frames", type=int, default=100, help="Number of calibration frames"
+    )
+    export_tflite.add_argument(
+        "--output", help="Output file, defaults to model.tflite_model_path"
+    )
+    export = subparsers.add_parser(
+        "export", help="Export a SavedModel with the decoding and label names"
+    )
+    export.add_argument(
+        "--output", help="Output directory, defaults to model.saved_model_dir"
+    )
+    evaluate = subparsers.add_parser(
+        "evaluate", help="Count error and latency of every resolution profile"
+    )
+    evaluate.add_argument(
+        "--video", help="Local video, defaults to video.input_location"
+    )
+    evaluate.add_argument(
+        "--frames", type=int, default=50, help="Number of sampled frames"
+    )
+    evaluate.add_argument(
+        "--reference",
+        help=(
+            "Reference profile for the count error when there is no ground truth, "
+            "defaults to the largest profile"
+        ),
+    )
+    evaluate.add_argument(
+        "--ground-truth", help="File with the expected count of each sampled frame"
+    )
+    subparsers.add_parser(
+        "replay", help="Send the rows left in gcp.spool_path to BigQuery"
+    )
+    backfill = subparsers.add_parser(
+        "backfill", help="Count recorded videos and load the rows into BigQuery"
+    )
+    backfill.add_argument("videos", nargs="+", help="Local video files")
+    backfill.add_argument(
+        "--start-time",
+        type=datetime.fromisoformat,
+        help=(
+            "Local time of the first frame (single video), defaults to the file "
+            "modification time minus its duration"
+        ),
+    )
+    backfill.add_argument(
+        "--local",
+        action="store_true",
+        help="Only write the files to backfill.output_dir, without load jobs",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
+    args = parse_args()
     config = read_from_yaml()
 
     os.environ["TZ"] = config["timezone"]
-    if config["gcp"]["save_to_bigquery"]:
-        bigquery = BigQuery(config)
-        bigquery.create_count_table()
-    agamotto = Agamotto(config)
-    agamotto.process_media(config["video"]["input_location"])
+    if args.command == "export-tflite":
+        config["model"]["inference_backend"] = "keras"
+        agamotto = Agamotto(config)
+        agamotto.export_tflite(
+            args.video or config["video"]["input_location"],
+            args.frames,
+            args.output or config["model"]["tflite_model_path"],
+        )
+    elif args.command == "export":
+        config["model"]["inference_backend"] = "keras"
+        agamotto = Agamotto(config)
+        agamotto.export_saved_model(args.output or config["model"]["saved_model_dir"])
+    elif args.command == "replay":
+        if not config["gcp"]["spool_path"]:
+            sys.exit("gcp.spool_path is not set, there is no spool to replay")
+        spool = RowSpool(config["gcp"]["spool_path"])
+        replayed = BigQueryWriter(
+            BigQuery(config),
+            flush_size=config["gcp"]["writer_flush_size"],
+            max_retries=config["gcp"]["writer_max_retries"],
+            max_backoff=config["gcp"]["writer_max_backoff"],
+            spool=spool,
+        ).replay()
+        spool.close()
+        if not replayed:
+            sys.exit(1)
+    elif args.command == "backfill":
+        if args.start_time is not None and len(args.videos) > 1:
+            raise ValueError("--start-time can only be given with a single video")
+        load = config["backfill"]["load"] and not args.local
+        if load:
+            BigQuery(config).create_count_table()
+        backfill_writer = BackfillWriter(
+            config["backfill"]["output_dir"], BigQuery(config) if load else None
+        )
+        agamotto = Agamotto(config)
+        try:
+            for video_path in args.videos:
+                agamotto.backfill_video(video_path, backfill_writer, args.start_time)
+        finally:
+            agamotto.close()
+    elif args.command == "evaluate":
+        profiles = config["model"]["resolution_profiles"]
+        reference = args.reference or max(
+            profiles,
+            key=lambda name: profiles[name]["min_side"] * profiles[name]["max_side"],
+        )
+        if reference not in profiles:
+            sys.exit(
+                f"Unknown reference profile {reference}, "
+                f"available: {list(profiles)}"
+            )
+        agamotto = Agamotto(config)
+        results = evaluate_resolution_profiles(
+            agamotto,
+            args.video or config["video"]["input_location"],
+            list(profiles),
+            reference,
+            interval=config["video"]["read_interval"],
+            num_frames=args.frames,
+            ground_truth=(
+                read_ground_truth(args.ground_truth) if args.ground_truth else None
+            ),
+        )
+        print(
+            f"{'profile':>10} {'frames':>7} {'count_mae':>10} "
+            f"{'mean_count':>11} {'median_ms':>10}"
+        )
+        for profile, result in results.items():
+            print(
+                f"{profile:>10} {result['frames']:>7} {result['count_mae']:>10.2f} "
+                f"{result['mean_count']:>11.2f} {result['median_ms']:>10.1f}"
+            )
+    else:
+        if config["gcp"]["save_to_bigquery"]:
+            bigquery = BigQuery(config)
+            bigquery.create_count_table()
+        if config["metrics"]["enabled"]:
+            start_metrics_server(config["metrics"]["port"])
+        agamotto = Agamotto(config)
+        try:
+            agamotto.process_media(config["video"]["input_location"])
+        finally:
+            agamotto.close()
@@ -29,12 +29,27 @@ class AgamottoEntry:
         latlong: str,
         location_id: int,
         location_name: str,
+        window_start: datetime = None,
+        window_end: datetime = None,
+        count_min: int = None,
+        count_max: int = None,
+        count_mean: float = None,
+        count_p95: float = None,
+        sample_count: int = None,
     ):
         self.count = int(count)
         self.day_time = day_time
         self.latlong = latlong
         self.location_id = int(location_id)
         self.location_name = location_name
+        # Window rollups only (see config/rollup.py), null on per-frame rows
+        self.window_start = window_start
+        self.window_end = window_end
+        self.count_min = count_min
+        self.count_max = count_max
+        self.count_mean = count_mean
+        self.count_p95 = count_p95
+        self.sample_count = sample_count
 
 
 def get_schema():
@@ -52,5 +67,12 @@ def get_schema():
         bigquery.SchemaField("latlong", "STRING", mode="REQUIRED"),
         bigquery.SchemaField("location_id", "INTEGER", mode="REQUIRED"),
         bigquery.SchemaField("location_name", "STRING", mode="REQUIRED"),
+        bigquery.SchemaField("window_start", "DATETIME", mode="NULLABLE"),
+        bigquery.SchemaField("window_end", "DATETIME", mode="NULLABLE"),
+        bigquery.SchemaField("count_min", "INTEGER", mode="NULLABLE"),
+        bigquery.SchemaField("count_max", "INTEGER", mode="NULLABLE"),
+        bigquery.SchemaField("count_mean", "FLOAT", mode="NULLABLE"),
+        bigquery.SchemaField("count_p95", "FLOAT", mode="NULLABLE"),
+        bigquery.SchemaField("sample_count", "INTEGER", mode="NULLABLE"),
     ]
     return schema
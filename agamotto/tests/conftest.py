@@ -0,0 +1,39 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+"""Makes the agamotto folder importable (config, utils, model) from the tests"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_clip(tmp_path):
+    """Write a small clip, frame i is filled with the gray level 10 * i"""
+
+    def make(num_frames=10, fps=100.0, size=(64, 48)):
+        path = str(tmp_path / "clip.avi")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+        for index in range(num_frames):
+            writer.write(np.full((size[1], size[0], 3), 10 * index, dtype=np.uint8))
+        writer.release()
+        return path
+
+    return make
@@ -0,0 +1,187 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+"""Tests of the BigQueryWriter with a fake BigQuery, no client is created"""
+
+import time
+
+import pytest
+from google.api_core import exceptions
+
+from config.bigquery_writer import BigQueryWriter
+from config.spool import RowSpool
+
+
+class FakeBigQuery:
+    """Records the insert requests and answers with the queued responses
+
+    A response is a list of row errors or an exception to raise, once they
+    are used every request succeeds.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def insert_rows(self, rows, row_ids=None):
+        self.requests.append((list(rows), list(row_ids)))
+        response = self.responses.pop(0) if self.responses else []
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def row_error(index, reason):
+    return {"index": index, "errors": [{"reason": reason}]}
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = RowSpool(str(tmp_path / "spool.db"))
+    yield spool
+    spool.close()
+
+
+def spool_writer(bigquery, spool, max_retries=2):
+    return BigQueryWriter(
+        bigquery, max_retries=max_retries, initial_backoff=0.0, spool=spool
+    )
+
+
+def test_replay_retries_transient_rows_and_dead_letters_rejected_ones(spool):
+    insert_ids = spool.append([{"count": 1}, {"count": 2}, {"count": 3}])
+    bigquery = FakeBigQuery([row_error(1, "backendError"), row_error(2, "invalid")])
+    writer = spool_writer(bigquery, spool)
+
+    assert writer.replay()
+    assert len(spool) == 0
+    assert writer.written_rows == 2
+    assert writer.failed_rows == 1
+    # Only the transient row is sent again, with its original insertId
+    assert bigquery.requests[1] == ([{"count": 2}], [insert_ids[1]])
+    ((rejected, reason),) = spool.dead_letter(10)
+    assert (rejected.insert_id, rejected.row, reason) == (
+        insert_ids[2],
+        {"count": 3},
+        "invalid",
+    )
+
+
+def test_start_sends_the_rows_left_by_a_previous_run(tmp_path):
+    # close() also closes the spool, so the fixture is not used
+    spool = RowSpool(str(tmp_path / "spool.db"))
+    insert_ids = spool.append([{"count": 1}])
+    bigquery = FakeBigQuery()
+    writer = BigQueryWriter(bigquery, flush_interval=60.0, spool=spool).start()
+    for _ in range(100):
+        if not len(spool):
+            break
+        time.sleep(0.05)
+    assert bigquery.requests == [([{"count": 1}], insert_ids)]
+    writer.close(timeout=5.0)
+
+
+def test_insert_ids_are_stable_across_replays(spool):
+    insert_ids = spool.append([{"count": 1}, {"count": 2}])
+    bigquery = FakeBigQuery(exceptions.ServiceUnavailable("down"))
+    writer = spool_writer(bigquery, spool, max_retries=0)
+
+    assert not writer.replay()
+    assert len(spool) == 2
+    assert spool_writer(bigquery, spool).replay()
+    assert [row_ids for _, row_ids in bigquery.requests] == [insert_ids, insert_ids]
+    assert len(spool) == 0
+
+
+def test_replay_gives_up_after_max_retries_of_transient_errors(spool):
+    spool.append([{"count": 1}])
+    bigquery = FakeBigQuery(*[exceptions.ServiceUnavailable("down")] * 10)
+    writer = spool_writer(bigquery, spool, max_retries=2)
+
+    assert not writer.replay()
+    assert len(bigquery.requests) == 3
+    assert len(spool) == 1
+
+
+def test_replay_stops_on_a_non_transient_error(spool):
+    spool.append([{"count": 1}])
+    bigquery = FakeBigQuery(exceptions.Forbidden("denied"))
+    writer = spool_writer(bigquery, spool, max_retries=5)
+
+    assert not writer.replay()
+    assert len(bigquery.requests) == 1
+    assert len(spool) == 1
+
+
+def test_memory_queue_drops_and_counts_rows_when_full():
+    writer = BigQueryWriter(FakeBigQuery(), queue_size=2)
+
+    assert writer.submit([{"count": 1}, {"count": 2}, {"count": 3}]) == 2
+    assert writer.dropped_rows == 1
+
+
+def test_memory_queue_drops_rows_that_still_fail_after_max_retries():
+    bigquery = FakeBigQuery(*[exceptions.ServiceUnavailable("down")] * 10)
+    writer = BigQueryWriter(bigquery, max_retries=2, initial_backoff=0.0)
+
+    writer._flush([(0.0, "id-1", {"count": 1}), (0.0, "id-2", {"count": 2})])
+    assert len(bigquery.requests) == 3
+    assert writer.failed_rows == 2
+    assert writer.written_rows == 0
+
+
+def test_close_flushes_the_waiting_rows():
+    bigquery = FakeBigQuery()
+    writer = BigQueryWriter(bigquery, flush_size=10, flush_interval=60.0).start()
+    writer.submit([{"count": 1}, {"count": 2}])
+    writer.close(timeout=5.0)
+
+    assert writer.written_rows == 2
+    assert [rows for rows, _ in bigquery.requests] == [[{"count": 1}, {"count": 2}]]
+
+
+def test_submit_with_a_spool_only_queues_in_memory(tmp_path):
+    spool = RowSpool(str(tmp_path / "spool.db"))
+    writer = BigQueryWriter(FakeBigQuery(), queue_size=2, spool=spool)
+
+    assert writer.submit([{"count": 1}, {"count": 2}, {"count": 3}]) == 2
+    assert writer.dropped_rows == 1
+    assert len(spool) == 0
+    spool.close()
+
+
+def test_close_spools_and_sends_the_queued_rows(tmp_path):
+    path = str(tmp_path / "spool.db")
+    bigquery = FakeBigQuery()
+    writer = BigQueryWriter(bigquery, flush_interval=60.0, spool=RowSpool(path))
+    writer.start().submit([{"count": 1}, {"count": 2}])
+    writer.close(timeout=5.0)
+
+    assert [rows for rows, _ in bigquery.requests] == [[{"count": 1}, {"count": 2}]]
+    spool = RowSpool(path)
+    assert len(spool) == 0
+    spool.close()
+
+
+def test_rows_that_fail_on_close_stay_in_the_spool(tmp_path):
+    path = str(tmp_path / "spool.db")
+    bigquery = FakeBigQuery(exceptions.ServiceUnavailable("down"))
+    writer = BigQueryWriter(bigquery, flush_interval=60.0, spool=RowSpool(path))
+    writer.start().submit([{"count": 1}, {"count": 2}])
+    writer.close(timeout=5.0)
+
+    assert len(bigquery.requests) == 1
+    spool = RowSpool(path)
+    assert [spooled.row for spooled in spool.peek(10)] == [{"count": 1}, {"count": 2}]
+    spool.close()
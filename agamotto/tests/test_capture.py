@@ -0,0 +1,95 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+"""Tests of the LatestFrameReader and MultiSourceEngine end of a local file"""
+
+from agamotto.capture import LatestFrameReader
+from agamotto.multisource import MultiSourceEngine, Source
+
+
+class FakeAgamotto:
+    """Counts the frames that reach the model, without a model"""
+
+    def __init__(self):
+        self.frames = 0
+
+    def create_motion_gate(self):
+        return None
+
+    def create_gated_detections(self, frames, motion_gates, rois=None):
+        self.frames += len(frames)
+        return [(None, 1.0, 0) for _ in frames]
+
+    def draw_boxes_to_frame(self, **kwargs):
+        pass
+
+    def report_tiling(self):
+        pass
+
+
+def source(index, input_location):
+    location = {"name": f"camera {index}", "id": index, "latlong": "0,0"}
+    return Source(
+        index=index, input_location=input_location, config={"location": location}
+    )
+
+
+def test_reader_finishes_at_the_end_of_a_local_file(make_clip):
+    reader = LatestFrameReader(make_clip(num_frames=5), reconnect=False)
+    reader.start()
+    reader.join(timeout=10)
+
+    assert reader.finished
+    assert reader.reconnections == 0
+    sequence, frame = reader.latest()
+    assert sequence == 5
+    assert frame is not None
+
+
+def test_wait_for_frame_returns_once_the_reader_finished(make_clip):
+    reader = LatestFrameReader(make_clip(num_frames=2), reconnect=False)
+    reader.start()
+    reader.join(timeout=10)
+
+    assert reader.wait_for_frame(2, timeout=10) == (2, None)
+
+
+def test_reader_paces_a_local_file_at_its_frame_rate(make_clip):
+    reader = LatestFrameReader(make_clip(num_frames=10, fps=50.0), reconnect=False)
+    reader.start()
+    reader.join(timeout=0.1)
+
+    assert not reader.finished
+    reader.join(timeout=10)
+    assert reader.finished
+
+
+def test_engine_run_returns_after_every_local_file_ended(make_clip):
+    agamotto = FakeAgamotto()
+    path = make_clip(num_frames=5)
+    engine = MultiSourceEngine(
+        agamotto,
+        [source(0, path), source(1, path)],
+        read_interval=0.01,
+        batch_size=2,
+        save_to_bigquery=False,
+        write_frames=False,
+        reconnect=False,
+    )
+
+    engine.run()
+
+    assert 2 <= agamotto.frames <= 10
+    # The last frame of both files went through the model
+    assert engine._last_sequences == [5, 5]
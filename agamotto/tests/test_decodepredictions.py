@@ -0,0 +1,90 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+"""Tests of the fast single-class decode against the combined NMS"""
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from agamotto.retinanet.decodepredictions import DecodePredictions
+from benchmarks.decode_nms import crowded_predictions
+
+HEIGHT, WIDTH = 256, 384
+
+
+def decode(decode_mode, predictions):
+    layer = DecodePredictions(
+        num_classes=1, confidence_threshold=0.35, decode_mode=decode_mode
+    )
+    images = tf.zeros([predictions.shape[0], HEIGHT, WIDTH, 3])
+    return layer(images, predictions)
+
+
+@pytest.mark.parametrize("persons", [0, 1, 3, 20])
+def test_fast_matches_combined(persons):
+    tf.random.set_seed(persons)
+    predictions = tf.concat(
+        [
+            crowded_predictions(HEIGHT, WIDTH, persons),
+            crowded_predictions(HEIGHT, WIDTH, 2),
+        ],
+        axis=0,
+    )
+
+    fast = decode("fast", predictions)
+    combined = decode("combined", predictions)
+
+    np.testing.assert_array_equal(fast.valid_detections, combined.valid_detections)
+    for image, valid in enumerate(combined.valid_detections.numpy()):
+        np.testing.assert_allclose(
+            fast.nmsed_scores[image][:valid],
+            combined.nmsed_scores[image][:valid],
+            rtol=1e-5,
+        )
+        np.testing.assert_allclose(
+            fast.nmsed_boxes[image][:valid],
+            combined.nmsed_boxes[image][:valid],
+            atol=1e-3,
+        )
+    # The padding is zeroed like combined_non_max_suppression
+    assert not np.any(fast.nmsed_scores[0][fast.valid_detections[0] :])
+
+
+def test_fast_decode_in_a_graph_with_an_unknown_batch():
+    layer = DecodePredictions(
+        num_classes=1, confidence_threshold=0.35, decode_mode="fast"
+    )
+    anchor_boxes = layer.get_anchors(HEIGHT, WIDTH)
+    decode_batch = tf.function(
+        lambda images, predictions: layer(
+            images, predictions, anchor_boxes=anchor_boxes
+        ),
+        input_signature=[
+            tf.TensorSpec([None, HEIGHT, WIDTH, 3], tf.float32),
+            tf.TensorSpec([None, None, 5], tf.float32),
+        ],
+    )
+
+    detections = decode_batch(
+        tf.zeros([1, HEIGHT, WIDTH, 3]), crowded_predictions(HEIGHT, WIDTH, 1)
+    )
+
+    assert detections.nmsed_boxes.shape == (1, 100, 4)
+    assert int(detections.valid_detections[0]) > 0
+
+
+def test_unknown_decode_mode():
+    with pytest.raises(ValueError, match="Unknown decode mode"):
+        DecodePredictions(decode_mode="soft")
@@ -0,0 +1,93 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+"""Tests of the uint8 FramePreprocessor against prepare_image"""
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from agamotto.frame_preprocessor import FramePreprocessor
+from agamotto.retinanet.preprocess import prepare_image, resize_and_pad_image
+
+SIZES = [(1080, 1920), (720, 1280), (480, 640), (1920, 1080), (601, 799), (100, 3000)]
+
+
+def frame(height, width, seed=0):
+    rng = np.random.default_rng(seed)
+    # Smooth content, the bilinear kernels only differ by rounding on it
+    small = rng.integers(0, 256, (height // 8 + 2, width // 8 + 2, 3), dtype=np.uint8)
+    return tf.image.resize(small, (height, width)).numpy().round().astype(np.uint8)
+
+
+@pytest.mark.parametrize("height,width", SIZES)
+@pytest.mark.parametrize("min_side,max_side", [(800.0, 1333.0), (480.0, 800.0)])
+def test_compute_shapes_matches_resize_and_pad_image(height, width, min_side, max_side):
+    preprocessor = FramePreprocessor(min_side=min_side, max_side=max_side)
+    image = tf.zeros((height, width, 3))
+
+    ratio, resized_shape, padded_shape = preprocessor.compute_shapes(height, width)
+    padded, image_shape, expected_ratio = resize_and_pad_image(
+        image, min_side=min_side, max_side=max_side, jitter=None
+    )
+
+    assert ratio == expected_ratio.numpy()
+    assert resized_shape == tuple(tf.cast(image_shape, tf.int32).numpy())
+    assert padded_shape == tuple(padded.shape[:2])
+
+
+def test_compute_shapes_with_a_given_ratio():
+    ratio, resized_shape, padded_shape = FramePreprocessor().compute_shapes(
+        1000, 500, ratio=0.5
+    )
+
+    assert (ratio, resized_shape, padded_shape) == (0.5, (500, 250), (512, 256))
+
+
+@pytest.mark.parametrize("height,width", [(720, 1280), (601, 799)])
+def test_prepare_matches_prepare_image(height, width):
+    image = frame(height, width)
+
+    prepared, ratio = FramePreprocessor()(image)
+    expected, expected_ratio = prepare_image(tf.cast(image, tf.float32))
+
+    assert ratio == expected_ratio.numpy()
+    assert prepared.shape == tuple(expected.shape)
+    difference = np.abs(prepared - expected.numpy())
+    # uint8 rounding of the resized pixels, the padding is exact
+    assert difference.max() <= 1.0
+    assert difference.mean() < 0.5
+
+
+def test_batch_pads_to_the_largest_frame_and_resets_the_padding():
+    large, small = frame(720, 1280), frame(480, 640, seed=1)
+
+    batch, ratios = FramePreprocessor().prepare_batch([large, small])
+
+    assert batch.shape == (2, 896, 1408, 3)
+    for index, image in enumerate([large, small]):
+        expected, expected_ratio = prepare_image(tf.cast(image, tf.float32))
+        height, width = expected.shape[1:3]
+        assert ratios[index] == expected_ratio.numpy()
+        assert np.abs(batch[index, :height, :width] - expected.numpy()[0]).max() <= 1.0
+        # Nothing of the previous frame is left in the shared uint8 buffer
+        padding = np.concatenate(
+            [
+                batch[index, height:].reshape(-1, 3),
+                batch[index, :, width:].reshape(-1, 3),
+            ]
+        )
+        np.testing.assert_allclose(
+            padding, np.broadcast_to([-103.939, -116.779, -123.68], padding.shape)
+        )
@@ -0,0 +1,102 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+"""Tests of the MotionGate skip decisions and counters"""
+
+import numpy as np
+import pytest
+
+from agamotto.motion_gate import MotionGate
+
+
+def frame(level=0, box=None):
+    image = np.full((120, 160, 3), level, dtype=np.uint8)
+    if box is not None:
+        x1, y1, x2, y2 = box
+        image[y1:y2, x1:x2] = 255
+    return image
+
+
+def run(gate, frames):
+    """Feed the frames like create_gated_detections, returning the decisions"""
+    decisions = []
+    for image in frames:
+        infer = gate.should_infer(image)
+        if infer:
+            gate.last_result = object()
+        decisions.append(infer)
+    return decisions
+
+
+def test_diff_skips_static_frames():
+    gate = MotionGate(method="diff", downscale_width=80)
+
+    assert run(gate, [frame()] * 5) == [True, False, False, False, False]
+    assert (gate.inference_calls, gate.skipped) == (1, 4)
+    assert "4 of 5 frames" in gate.summary()
+
+
+def test_diff_infers_when_enough_pixels_change():
+    gate = MotionGate(method="diff", threshold=0.01, downscale_width=80)
+
+    decisions = run(
+        gate, [frame(), frame(box=(40, 30, 80, 70)), frame(box=(40, 30, 80, 70))]
+    )
+
+    assert decisions == [True, True, False]
+
+
+def test_diff_ignores_changes_below_the_pixel_threshold():
+    gate = MotionGate(method="diff", pixel_threshold=25, downscale_width=80)
+
+    assert run(gate, [frame(100), frame(110), frame(120)]) == [True, False, False]
+    # Compared with the last inferred frame, not the previous one
+    assert run(gate, [frame(130)]) == [True]
+
+
+def test_diff_forces_inference_after_max_skipped_frames():
+    gate = MotionGate(method="diff", downscale_width=80, max_skipped_frames=2)
+
+    decisions = run(gate, [frame()] * 7)
+
+    assert decisions == [True, False, False, True, False, False, True]
+    assert (gate.inference_calls, gate.skipped) == (3, 4)
+
+
+def test_first_frame_always_infers_until_there_is_a_result():
+    gate = MotionGate(method="diff", downscale_width=80)
+
+    assert gate.should_infer(frame())
+    assert gate.should_infer(frame())
+    assert gate.skipped == 0
+
+
+def test_mog2_skips_the_learned_background():
+    gate = MotionGate(method="mog2", threshold=0.05, downscale_width=80)
+
+    decisions = run(gate, [frame(50)] * 30)
+    moving = run(
+        gate,
+        [frame(50, box=(20 + 10 * step, 30, 60 + 10 * step, 90)) for step in range(3)],
+    )
+
+    assert decisions[0]
+    assert not any(decisions[-10:])
+    assert all(moving)
+    assert gate.inference_calls + gate.skipped == 33
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError, match="Unknown motion gate method"):
+        MotionGate(method="optical_flow")
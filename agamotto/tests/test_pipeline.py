@@ -0,0 +1,98 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+"""Tests of the FramePipeline order and error propagation"""
+
+import random
+import time
+
+import pytest
+
+from agamotto.pipeline import FramePipeline
+
+
+def slow_detect(frames):
+    time.sleep(random.uniform(0.0, 0.003))
+    return [frame * 10 for frame in frames]
+
+
+def test_frames_reach_write_frame_in_order():
+    written = []
+    batches = []
+
+    def detect_frames(frames):
+        batches.append(len(frames))
+        return slow_detect(frames)
+
+    pipeline = FramePipeline(
+        range(50),
+        detect_frames,
+        lambda frame, result: written.append((frame, result)),
+        batch_size=4,
+        queue_size=2,
+    )
+    pipeline.run()
+
+    assert written == [(frame, frame * 10) for frame in range(50)]
+    assert max(batches) <= 4
+    assert pipeline.capture_stats.items == 50
+    assert pipeline.inference_stats.items == 50
+    assert pipeline.render_stats.items == 50
+
+
+def test_empty_input():
+    written = []
+
+    FramePipeline([], slow_detect, lambda *item: written.append(item)).run()
+
+    assert written == []
+
+
+def test_capture_error_is_raised_by_run():
+    def frames():
+        yield 1
+        raise IOError("decoder failed")
+
+    with pytest.raises(IOError, match="decoder failed"):
+        FramePipeline(frames(), slow_detect, lambda *item: None).run()
+
+
+def test_inference_error_is_raised_by_run():
+    def detect_frames(frames):
+        if 20 in frames:
+            raise RuntimeError("inference failed")
+        return slow_detect(frames)
+
+    with pytest.raises(RuntimeError, match="inference failed"):
+        FramePipeline(
+            range(1000), detect_frames, lambda *item: None, queue_size=2
+        ).run()
+
+
+def test_render_error_stops_the_pipeline():
+    def write_frame(frame, result):
+        if frame == 5:
+            raise ValueError("disk full")
+
+    consumed = []
+
+    def frames():
+        for frame in range(10000):
+            consumed.append(frame)
+            yield frame
+
+    with pytest.raises(ValueError, match="disk full"):
+        FramePipeline(frames(), slow_detect, write_frame, queue_size=2).run()
+    # The capture stopped instead of reading the whole input
+    assert len(consumed) < 10000
@@ -0,0 +1,107 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+"""Tests of the RegionOfInterest crop and mapping"""
+
+import numpy as np
+import pytest
+
+from agamotto.retinanet.decodepredictions import Detections
+from agamotto.roi import RegionOfInterest
+
+
+def frame(height=100, width=200):
+    return np.zeros((height, width, 3), dtype=np.uint8)
+
+
+def detections(boxes):
+    boxes = np.asarray(boxes, dtype=np.float32)
+    return Detections(
+        nmsed_boxes=boxes[None, ...],
+        nmsed_scores=np.full((1, len(boxes)), 0.9, dtype=np.float32),
+        nmsed_classes=np.zeros((1, len(boxes)), dtype=np.float32),
+        valid_detections=np.array([len(boxes)], dtype=np.int32),
+    )
+
+
+def test_two_points_are_a_rectangle():
+    roi = RegionOfInterest([[50, 10], [20, 40]])
+    assert roi.bounds == (20, 10, 50, 40)
+    assert len(roi.polygon) == 4
+
+
+def test_a_single_point_is_rejected():
+    with pytest.raises(ValueError):
+        RegionOfInterest([[10, 10]])
+
+
+@pytest.mark.parametrize(
+    "points, shape",
+    [
+        ([[20, 10], [50, 40]], (30, 30, 3)),
+        ([[-5, -5], [50, 60]], (60, 50, 3)),
+        ([[150, 20], [400, 500]], (80, 50, 3)),
+        ([[10, 10], [10, 10]], (1, 1, 3)),
+    ],
+)
+def test_crop_is_clipped_to_the_frame(points, shape):
+    assert RegionOfInterest(points).crop(frame()).shape == shape
+
+
+@pytest.mark.parametrize(
+    "points", [[[-100, 0], [-10, 50]], [[300, 0], [400, 50]], [[0, 120], [50, 150]]]
+)
+def test_region_outside_of_the_frame_falls_back_to_the_whole_frame(points):
+    roi = RegionOfInterest(points)
+    assert not roi.intersects(frame().shape)
+    assert roi.for_frame(frame().shape) is None
+    with pytest.raises(ValueError):
+        roi.crop(frame())
+
+
+def test_for_frame_checks_again_when_the_frame_size_changes():
+    roi = RegionOfInterest([[300, 0], [400, 50]])
+    assert roi.for_frame(frame().shape) is None
+    assert roi.for_frame(frame(width=640).shape) is roi
+
+
+def test_to_frame_maps_boxes_and_keeps_the_centres_inside_the_polygon():
+    roi = RegionOfInterest([[100, 0], [200, 0], [100, 100]])
+    crop_detections = detections(
+        [
+            [0.0, 0.0, 20.0, 20.0],  # centre (110, 10), inside
+            [80.0, 80.0, 98.0, 98.0],  # centre (189, 89), outside
+            [10.0, 40.0, 30.0, 60.0],  # centre (120, 50), inside
+        ]
+    )
+
+    mapped, ratio, num_detections = roi.to_frame(
+        (crop_detections, 1.0, 3), frame().shape
+    )
+    assert ratio == 1.0
+    assert num_detections == 2
+    np.testing.assert_allclose(
+        mapped.nmsed_boxes[0],
+        [[100.0, 0.0, 120.0, 20.0], [110.0, 40.0, 130.0, 60.0]],
+    )
+    assert list(mapped.valid_detections) == [2]
+
+
+def test_to_frame_undoes_the_ratio_of_the_crop():
+    roi = RegionOfInterest([[20, 10], [120, 90]])
+    mapped, _, num_detections = roi.to_frame(
+        (detections([[10.0, 10.0, 30.0, 30.0]]), 2.0, 1), frame().shape
+    )
+    assert num_detections == 1
+    np.testing.assert_allclose(mapped.nmsed_boxes[0], [[25.0, 15.0, 35.0, 25.0]])
@@ -0,0 +1,94 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+"""Tests of the time-window rollups"""
+
+import numpy as np
+import pytest
+
+from config.rollup import RingBuffer, WindowAggregator
+
+
+def test_ring_buffer_overwrites_the_oldest_sample():
+    buffer = RingBuffer(3)
+    for timestamp, count in enumerate([1, 2, 3, 4]):
+        buffer.append(float(timestamp), count)
+
+    assert len(buffer) == 3
+    assert buffer.overwritten == 1
+    assert list(buffer.counts_between(0.0, 10.0)) == [2, 3, 4]
+    buffer.drop_before(2.0)
+    assert list(buffer.counts_between(0.0, 10.0)) == [3, 4]
+
+
+def test_tumbling_window_closes_on_the_first_sample_of_the_next_window():
+    aggregator = WindowAggregator("tumbling", window_seconds=60)
+    counts = list(range(1, 21))
+    for position, count in enumerate(counts):
+        assert aggregator.add(1, 120.0 + position * 2.9, count) == []
+
+    (window,) = aggregator.add(1, 180.0, 100)
+    assert (window.window_start, window.window_end) == (120.0, 180.0)
+    assert window.sample_count == 20
+    assert (window.count_min, window.count_max) == (1, 20)
+    assert window.count_mean == pytest.approx(np.mean(counts))
+    assert window.count_p95 == pytest.approx(np.percentile(counts, 95))
+    assert aggregator.flush()[1][0].sample_count == 1
+
+
+def test_tumbling_windows_without_samples_are_not_emitted():
+    aggregator = WindowAggregator("tumbling", window_seconds=60)
+    aggregator.add(1, 10.0, 1)
+
+    (window,) = aggregator.add(1, 250.0, 2)
+    assert (window.window_start, window.window_end) == (0.0, 60.0)
+    (window,) = aggregator.flush()[1]
+    assert (window.window_start, window.window_end) == (240.0, 300.0)
+
+
+def test_locations_have_their_own_windows():
+    aggregator = WindowAggregator("tumbling", window_seconds=60)
+    aggregator.add(1, 10.0, 1)
+    aggregator.add(2, 10.0, 5)
+
+    assert [window.count_max for window in aggregator.add(2, 70.0, 0)] == [5]
+    assert aggregator.flush()[1][0].count_max == 1
+
+
+def test_sliding_windows_overlap():
+    aggregator = WindowAggregator("sliding", window_seconds=60, slide_seconds=15)
+    assert aggregator.add(1, 1.0, 1) == []
+
+    (window,) = aggregator.add(1, 16.0, 2)
+    assert (window.window_start, window.window_end) == (-45.0, 15.0)
+    assert window.sample_count == 1
+    (window,) = aggregator.add(1, 31.0, 3)
+    assert (window.window_start, window.window_end) == (-30.0, 30.0)
+    assert window.sample_count == 2
+
+
+def test_flush_closes_every_pending_sliding_window():
+    aggregator = WindowAggregator("sliding", window_seconds=60, slide_seconds=15)
+    for timestamp, count in [(1.0, 1), (16.0, 2), (31.0, 3)]:
+        aggregator.add(1, timestamp, count)
+
+    windows = aggregator.flush()[1]
+    assert [window.window_end for window in windows] == [45.0, 60.0, 75.0, 90.0]
+    assert [window.sample_count for window in windows] == [3, 3, 2, 1]
+    assert aggregator.flush() == {}
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        WindowAggregator("hopping")
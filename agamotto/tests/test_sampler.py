@@ -0,0 +1,53 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+"""Tests of the FrameSampler indices and timestamps on a generated clip"""
+
+import cv2
+import numpy as np
+import pytest
+
+from agamotto.sampler import FrameSampler
+
+
+@pytest.mark.parametrize("seek_threshold", [250, 1], ids=["grab", "seek"])
+def test_samples_every_interval_with_its_timestamp(make_clip, seek_threshold):
+    player = cv2.VideoCapture(make_clip(num_frames=20, fps=10.0))
+    sampler = FrameSampler(player, interval=0.5, seek_threshold=seek_threshold)
+
+    samples = list(sampler)
+    player.release()
+
+    assert sampler.stride == 5
+    assert sampler.use_seek == (seek_threshold == 1)
+    assert [sample.index for sample in samples] == [0, 5, 10, 15]
+    np.testing.assert_allclose(
+        [sample.timestamp for sample in samples], [0.0, 0.5, 1.0, 1.5], atol=1e-6
+    )
+    # Frame i of the clip is filled with the gray level 10 * i
+    np.testing.assert_allclose(
+        [sample.image.mean() for sample in samples], [0, 50, 100, 150], atol=3
+    )
+
+
+def test_interval_shorter_than_a_frame_keeps_every_frame(make_clip):
+    player = cv2.VideoCapture(make_clip(num_frames=4, fps=10.0))
+
+    samples = list(FrameSampler(player, interval=0.01))
+    player.release()
+
+    assert [sample.index for sample in samples] == [0, 1, 2, 3]
+    np.testing.assert_allclose(
+        [sample.timestamp for sample in samples], [0.0, 0.1, 0.2, 0.3], atol=1e-6
+    )
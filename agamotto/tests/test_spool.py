@@ -0,0 +1,58 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+"""Tests of the SQLite RowSpool"""
+
+from config.spool import RowSpool
+
+
+def test_rows_are_peeked_in_order_and_survive_a_reopen(tmp_path):
+    path = str(tmp_path / "spool.db")
+    spool = RowSpool(path)
+    insert_ids = spool.append([{"count": 1}, {"count": 2}, {"count": 3}])
+    spool.close()
+
+    spool = RowSpool(path)
+    rows = spool.peek(10)
+    assert [spooled.row for spooled in rows] == [
+        {"count": 1},
+        {"count": 2},
+        {"count": 3},
+    ]
+    assert [spooled.insert_id for spooled in rows] == insert_ids
+    assert len(set(insert_ids)) == 3
+    assert len(spool.peek(2)) == 2
+    spool.close()
+
+
+def test_acknowledge_deletes_only_the_given_rows(tmp_path):
+    spool = RowSpool(str(tmp_path / "spool.db"))
+    spool.append([{"count": 1}, {"count": 2}, {"count": 3}])
+    first, second, third = spool.peek(10)
+    spool.acknowledge([first.id, third.id])
+    spool.acknowledge([])
+    assert len(spool) == 1
+    assert spool.peek(10) == [second]
+    spool.close()
+
+
+def test_reject_moves_rows_to_the_dead_letter_table(tmp_path):
+    spool = RowSpool(str(tmp_path / "spool.db"))
+    spool.append([{"count": 1}, {"count": 2}])
+    first, second = spool.peek(10)
+    spool.reject([(first.id, "invalid")])
+    assert spool.peek(10) == [second]
+    assert spool.dead_letter_count() == 1
+    assert spool.dead_letter(10) == [(first, "invalid")]
+    spool.close()
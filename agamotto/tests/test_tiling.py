@@ -0,0 +1,109 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+"""Tests of the tile grid and the cross-tile merge"""
+
+import numpy as np
+import pytest
+
+from agamotto.retinanet.decodepredictions import Detections
+from agamotto.tiling import TiledDetector, merge_detections, tile_grid
+
+
+def test_tile_grid_covers_the_frame_with_the_overlap():
+    tiles = tile_grid(1080, 1920, 1024, 128)
+
+    assert tiles == [
+        (0, 0, 1024, 1024),
+        (896, 0, 1920, 1024),
+        (0, 56, 1024, 1080),
+        (896, 56, 1920, 1080),
+    ]
+
+
+def test_tile_grid_ends_at_the_border():
+    tiles = tile_grid(500, 1000, 400, 100)
+
+    assert sorted({x1 for x1, _, _, _ in tiles}) == [0, 300, 600]
+    assert max(x2 for _, _, x2, _ in tiles) == 1000
+    assert max(y2 for _, _, _, y2 in tiles) == 500
+
+
+def test_tile_grid_of_a_frame_smaller_than_a_tile():
+    assert tile_grid(300, 500, 1024, 128) == [(0, 0, 500, 300)]
+
+
+def test_merge_suppresses_a_partial_box_contained_in_a_better_one():
+    # Cut by a tile border, IoU 0.4 with the full box but fully inside it
+    boxes = np.array([[100, 100, 150, 200], [100, 100, 120, 200]], dtype=np.float32)
+
+    keep = merge_detections(boxes, np.array([0.9, 0.8]), np.zeros(2))
+
+    assert keep.tolist() == [0]
+
+
+def test_merge_keeps_boxes_below_both_thresholds():
+    boxes = np.array([[0, 0, 100, 100], [60, 0, 160, 100]], dtype=np.float32)
+
+    keep = merge_detections(boxes, np.array([0.5, 0.9]), np.zeros(2))
+
+    assert keep.tolist() == [1, 0]
+
+
+def test_merge_only_suppresses_the_same_class():
+    boxes = np.array([[0, 0, 100, 100], [0, 0, 100, 100]], dtype=np.float32)
+
+    keep = merge_detections(boxes, np.array([0.9, 0.8]), np.array([0.0, 1.0]))
+
+    assert keep.tolist() == [0, 1]
+
+
+def test_merge_of_no_boxes():
+    keep = merge_detections(np.zeros((0, 4), np.float32), np.zeros(0), np.zeros(0))
+
+    assert keep.tolist() == []
+
+
+def test_tiled_detector_maps_and_merges_the_tiles():
+    def detect_frames(frames, scales):
+        # Every tile sees the same person at its own (10, 10) with ratio 2
+        assert scales == [1.0] * len(frames)
+        return [
+            (
+                Detections(
+                    nmsed_boxes=np.array([[[20, 20, 60, 100]]], np.float32),
+                    nmsed_scores=np.array([[0.9]], np.float32),
+                    nmsed_classes=np.array([[0.0]], np.float32),
+                    valid_detections=np.array([1], np.int32),
+                ),
+                2.0,
+                1,
+            )
+            for _ in frames
+        ]
+
+    tiled = TiledDetector(detect_frames, tile_size=100, overlap=20)
+    ((detections, ratio, num_detections),) = tiled([np.zeros((100, 180, 3), np.uint8)])
+
+    assert ratio == 1.0
+    assert num_detections == 2
+    np.testing.assert_allclose(
+        sorted(detections.nmsed_boxes[0].tolist()),
+        [[10, 10, 30, 50], [90, 10, 110, 50]],
+    )
+
+
+def test_overlap_must_be_smaller_than_the_tile():
+    with pytest.raises(ValueError, match="must be smaller"):
+        TiledDetector(None, tile_size=100, overlap=100)
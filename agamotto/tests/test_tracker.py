@@ -0,0 +1,151 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+"""Tests of the keyframe tracker association and Kalman prediction"""
+
+import cv2
+import numpy as np
+import pytest
+
+from agamotto.retinanet.decodepredictions import Detections
+from agamotto.tracker import BoxTracker, KeyframeTracker, associate, box_iou
+
+
+def boxes(*rows):
+    return np.array(rows, dtype=np.float32).reshape(-1, 4)
+
+
+def frame():
+    return np.zeros((200, 300, 3), dtype=np.uint8)
+
+
+def frame_detections(rows, ratio=1.0):
+    detected = boxes(*rows)
+    count = len(detected)
+    return (
+        Detections(
+            nmsed_boxes=(detected * ratio)[None, ...],
+            nmsed_scores=np.full((1, count), 0.9, dtype=np.float32),
+            nmsed_classes=np.zeros((1, count), dtype=np.float32),
+            valid_detections=np.array([count], dtype=np.int32),
+        ),
+        ratio,
+        count,
+    )
+
+
+def test_box_iou():
+    iou = box_iou(
+        boxes([0, 0, 10, 10]), boxes([0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30])
+    )
+
+    np.testing.assert_allclose(iou, [[1.0, 50 / 150, 0.0]], rtol=1e-6)
+
+
+def test_associate_prefers_the_highest_iou():
+    tracks = boxes([0, 0, 10, 10], [4, 0, 14, 10])
+    detections = boxes([5, 0, 15, 10], [0, 0, 10, 10])
+
+    assert sorted(associate(tracks, detections, 0.3)) == [(0, 1), (1, 0)]
+
+
+def test_associate_falls_back_to_the_centroid_distance():
+    # IoU 0.18, below the threshold, centres 4.2 apart, half diagonal 7.1
+    tracks = boxes([0, 0, 10, 10])
+    detections = boxes([100, 100, 110, 110], [3, 3, 13, 13])
+
+    assert associate(tracks, detections, 0.5) == [(0, 1)]
+
+
+def test_associate_leaves_far_boxes_unmatched():
+    assert associate(boxes([0, 0, 10, 10]), boxes([50, 50, 60, 60]), 0.3) == []
+    assert associate(boxes(), boxes([0, 0, 10, 10]), 0.3) == []
+
+
+def test_kalman_predict_follows_the_velocity_of_the_keyframes():
+    tracker = BoxTracker(method="kalman")
+    for step in range(8):
+        x1 = 10.0 + 10 * step
+        tracker.update(frame(), boxes([x1, 50, x1 + 20, 90]), np.ones(1), np.zeros(1))
+
+    last = tracker.tracks[0].box.copy()
+    predicted = tracker.propagate(frame())[0]
+
+    assert 5.0 < predicted[0] - last[0] < 15.0
+    assert abs(predicted[1] - last[1]) < 1.0
+    np.testing.assert_allclose(predicted[2:] - predicted[:2], [20, 40], atol=1.0)
+
+
+def test_optical_flow_moves_each_box_with_its_content():
+    rng = np.random.default_rng(0)
+    texture = rng.integers(0, 255, (200, 300), dtype=np.uint8)
+    texture = cv2.cvtColor(cv2.GaussianBlur(texture, (5, 5), 0), cv2.COLOR_GRAY2BGR)
+    tracker = BoxTracker(method="optical_flow")
+    tracker.update(
+        texture, boxes([50, 50, 100, 100], [150, 80, 200, 130]), np.ones(2), np.zeros(2)
+    )
+
+    shifted = np.roll(texture, shift=(3, 5), axis=(0, 1))
+    moved = tracker.propagate(shifted)
+
+    np.testing.assert_allclose(
+        moved, boxes([55, 53, 105, 103], [155, 83, 205, 133]), atol=0.5
+    )
+
+
+def test_update_keeps_matched_tracks_and_drops_missing_ones():
+    tracker = BoxTracker(method="kalman")
+    tracker.update(
+        frame(), boxes([10, 10, 30, 30], [100, 100, 130, 130]), np.ones(2), np.zeros(2)
+    )
+    first = tracker.tracks[0]
+
+    tracker.update(
+        frame(), boxes([11, 10, 31, 30], [200, 50, 220, 70]), np.ones(2), np.zeros(2)
+    )
+
+    assert len(tracker.tracks) == 2
+    assert tracker.tracks[0] is first
+    np.testing.assert_allclose(tracker.tracks[1].box, [200, 50, 220, 70])
+
+
+def test_propagate_drops_tracks_that_left_the_frame():
+    tracker = BoxTracker(method="kalman")
+    tracker.update(frame(), boxes([400, 10, 420, 30]), np.ones(1), np.zeros(1))
+
+    assert len(tracker.propagate(frame())) == 0
+
+
+def test_keyframe_tracker_runs_the_detector_on_keyframes_only():
+    calls = []
+
+    def detect_frames(frames):
+        calls.append(len(frames))
+        return [frame_detections([[20, 20, 60, 60]], ratio=2.0) for _ in frames]
+
+    keyframe_tracker = KeyframeTracker(detect_frames, keyframe_interval=3)
+    results = keyframe_tracker([frame() for _ in range(7)])
+
+    assert calls == [3]
+    assert (keyframe_tracker.keyframes, keyframe_tracker.tracked_frames) == (3, 4)
+    assert [num_detections for _, _, num_detections in results] == [1] * 7
+    # Tracked boxes are scaled by the keyframe ratio like the detections
+    np.testing.assert_allclose(
+        results[1][0].nmsed_boxes[0], results[0][0].nmsed_boxes[0], atol=2.0
+    )
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError, match="Unknown tracker method"):
+        BoxTracker(method="sort")
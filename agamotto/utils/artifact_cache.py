@@ -0,0 +1,149 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Local cache of downloaded weight archives, versioned, checksummed and
+extracted atomically under a lock file so concurrent workers share it
+"""
+
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import urllib.request
+import zipfile
+from contextlib import contextmanager
+
+from utils.logger import logger
+
+_COMPLETE_MARKER = "COMPLETE"
+
+
+def sha256sum(path, chunk_size=2**20):
+    """SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file_pointer:
+        for chunk in iter(lambda: file_pointer.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """Versioned cache of extracted zip archives
+
+    Every archive lives in `<cache_dir>/<url hash>/<version>/extracted`. The
+    `COMPLETE` marker is written last and holds the archive checksum, when it
+    exists a warm start returns the extracted directory without touching the
+    archive. Downloads and extractions happen under an exclusive lock file,
+    into temporary paths that are renamed in place, so a crash or several
+    workers starting at the same time never see a half extracted directory.
+
+    Attributes:
+        cache_dir: Root directory of the cache
+    """
+
+    def __init__(self, cache_dir):
+        self._cache_dir = os.path.expanduser(cache_dir)
+
+    def _version_dir(self, url, version):
+        url_hash = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self._cache_dir, url_hash, str(version))
+
+    @staticmethod
+    @contextmanager
+    def _lock(version_dir):
+        """Exclusive lock on the version directory"""
+        os.makedirs(version_dir, exist_ok=True)
+        with open(os.path.join(version_dir, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_marker(version_dir):
+        """Checksum stored in the COMPLETE marker, None if it does not exist"""
+        try:
+            with open(os.path.join(version_dir, _COMPLETE_MARKER)) as marker:
+                return marker.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _is_complete(self, version_dir, checksum):
+        stored_checksum = self._read_marker(version_dir)
+        if stored_checksum is None:
+            return False
+        return checksum is None or stored_checksum == checksum
+
+    def _download(self, url, version_dir):
+        """Download url into the version directory, returns the archive path"""
+        archive_path = os.path.join(version_dir, "archive.zip")
+        logger(self.__class__.__name__).info(f"Downloading {url}")
+        with tempfile.NamedTemporaryFile(dir=version_dir, delete=False) as tmp_file:
+            with urllib.request.urlopen(url) as response:
+                shutil.copyfileobj(response, tmp_file)
+        os.replace(tmp_file.name, archive_path)
+        return archive_path
+
+    def fetch(self, url, version, checksum=None):
+        """Return the extracted directory of an archive, downloading it if needed
+
+        Args:
+            url (str): Archive URL
+            version (str): Archive version, part of the cache key
+            checksum (str, optional): Expected SHA-256 of the archive
+
+        Raises:
+            ValueError: The downloaded archive does not match the checksum
+
+        Returns:
+            str: Directory with the extracted archive
+        """
+        version_dir = self._version_dir(url, version)
+        extracted_dir = os.path.join(version_dir, "extracted")
+        if self._is_complete(version_dir, checksum):
+            logger(self.__class__.__name__).info(f"Using cached {extracted_dir}")
+            return extracted_dir
+
+        with self._lock(version_dir):
+            # Another worker may have finished while we waited for the lock
+            if self._is_complete(version_dir, checksum):
+                return extracted_dir
+            archive_path = self._download(url, version_dir)
+            archive_checksum = sha256sum(archive_path)
+            if checksum is not None and archive_checksum != checksum:
+                os.remove(archive_path)
+                raise ValueError(
+                    f"Checksum mismatch for {url}: expected {checksum}, "
+                    f"got {archive_checksum}"
+                )
+            tmp_dir = tempfile.mkdtemp(dir=version_dir)
+            with zipfile.ZipFile(archive_path, "r") as z_fp:
+                z_fp.extractall(tmp_dir)
+            if os.path.exists(extracted_dir):
+                shutil.rmtree(extracted_dir)
+            os.replace(tmp_dir, extracted_dir)
+            os.remove(archive_path)
+            with tempfile.NamedTemporaryFile(
+                "w", dir=version_dir, delete=False
+            ) as marker:
+                marker.write(archive_checksum)
+            os.replace(marker.name, os.path.join(version_dir, _COMPLETE_MARKER))
+            logger(self.__class__.__name__).info(
+                f"Extracted {url} (sha256 {archive_checksum}) into {extracted_dir}"
+            )
+        return extracted_dir
@@ -0,0 +1,157 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Prometheus metrics of the processing stages, served on /metrics from a
+background thread (see the metrics section of agamotto.yaml)
+"""
+
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from utils.logger import logger
+
+STAGES = (
+    "capture",
+    "preprocess",
+    "forward",
+    "decode",
+    "inference",
+    "render",
+    "write",
+    "bigquery",
+)
+
+STAGE_LATENCY = Histogram(
+    "agamotto_stage_latency_seconds",
+    "Latency of a processing stage, inference is the whole model call "
+    "(forward and decode, which are only timed apart by the compiled and "
+    "TFLite backends)",
+    ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+FRAMES_PROCESSED = Counter(
+    "agamotto_frames_processed_total", "Frames that went through the model"
+)
+FRAMES_SKIPPED = Counter(
+    "agamotto_frames_skipped_total",
+    "Frames that did not go through the model",
+    ["reason"],
+)
+QUEUE_DEPTH = Gauge("agamotto_queue_depth", "Items waiting in a queue", ["queue"])
+DETECTIONS = Histogram(
+    "agamotto_detections_per_frame",
+    "Number of persons counted in a frame",
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+LAST_COUNT = Gauge(
+    "agamotto_last_count", "Last count of persons of a location", ["location"]
+)
+
+BIGQUERY_ROWS = Counter(
+    "agamotto_bigquery_rows_total",
+    "Rows handled by the BigQuery writer",
+    ["result"],
+)
+BIGQUERY_QUEUE_DEPTH = Gauge(
+    "agamotto_bigquery_queue_depth", "Rows waiting in the BigQuery writer queue"
+)
+BIGQUERY_LAG = Gauge(
+    "agamotto_bigquery_lag_seconds",
+    "Seconds the rows of the last BigQuery flush waited in the queue",
+)
+
+# Children are bound once, labels() is a dict lookup under a lock
+_STAGE_LATENCY = {stage: STAGE_LATENCY.labels(stage) for stage in STAGES}
+
+
+def start_metrics_server(port=9097):
+    """Serve /metrics on a daemon thread
+
+    Args:
+        port (int): HTTP port
+    """
+    start_http_server(port)
+    logger("metrics").info(f"Serving Prometheus metrics on :{port}/metrics")
+
+
+def observe_stage(stage, seconds):
+    """Record the latency of a stage
+
+    Args:
+        stage (str): One of STAGES
+        seconds (float): Duration in seconds
+    """
+    _STAGE_LATENCY[stage].observe(seconds)
+
+
+@contextmanager
+def timed_stage(stage):
+    """Context manager recording the latency of the block as a stage"""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        _STAGE_LATENCY[stage].observe(time.perf_counter() - start_time)
+
+
+def record_frames_processed(count=1):
+    """Count frames that went through the model"""
+    FRAMES_PROCESSED.inc(count)
+
+
+def record_frames_skipped(reason, count=1):
+    """Count frames that reused or tracked detections
+
+    Args:
+        reason (str): motion_gate or tracker
+        count (int): Number of frames
+    """
+    FRAMES_SKIPPED.labels(reason).inc(count)
+
+
+def record_queue_depth(queue_name, depth):
+    """Current depth of a queue"""
+    QUEUE_DEPTH.labels(queue_name).set(depth)
+
+
+def record_detections(num_detections, location_name):
+    """Count of persons of a frame
+
+    Args:
+        num_detections (int): Number of detections of the frame
+        location_name (str): location.name of the frame
+    """
+    DETECTIONS.observe(int(num_detections))
+    LAST_COUNT.labels(location_name).set(int(num_detections))
+
+
+def record_bigquery_rows(result, count=1):
+    """Count rows of the BigQuery writer
+
+    Args:
+        result (str): written, dropped (queue full) or failed
+        count (int): Number of rows
+    """
+    if count:
+        BIGQUERY_ROWS.labels(result).inc(count)
+
+
+def record_bigquery_writer(queue_depth, lag):
+    """Queue depth and lag of the BigQuery writer"""
+    BIGQUERY_QUEUE_DEPTH.set(queue_depth)
+    BIGQUERY_LAG.set(lag)
@@ -0,0 +1,59 @@
+# Copyright 2023 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+#
+# limitations under the License.
+
+"""
+Machine tuning written by bench.py and applied by Agamotto at startup
+"""
+
+import os
+
+import yaml
+from yaml.loader import SafeLoader
+
+TUNING_KEYS = (
+    "inference_batch_size",
+    "intra_op_parallelism_threads",
+    "inter_op_parallelism_threads",
+)
+
+
+def read_tuning(file_name):
+    """Read a tuning file
+
+    Args:
+        file_name (str): File written by bench.py
+
+    Returns:
+        Dict | None: The tuning, None when the file does not exist
+    """
+    if not file_name or not os.path.exists(file_name):
+        return None
+    with open(file_name) as file_pointer:
+        tuning = yaml.load(file_pointer, Loader=SafeLoader) or {}
+    missing = [key for key in TUNING_KEYS if key not in tuning]
+    if missing:
+        raise ValueError(f"Tuning file {file_name} is missing {missing}")
+    return tuning
+
+
+def write_tuning(file_name, tuning):
+    """Write a tuning file, the measurements are kept for reference
+
+    Args:
+        file_name (str): Output file
+        tuning (Dict): TUNING_KEYS and any other measurement
+    """
+    with open(file_name, "w") as file_pointer:
+        yaml.safe_dump(tuning, file_pointer, sort_keys=False)